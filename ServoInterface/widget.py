@@ -1,10 +1,18 @@
 # This Python file uses the following encoding: utf-8
+import os
 import sys
-import PyQt5
-import pysoem
 
+# the shared EtherCAT core lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethercat.import_profile import ImportProfile
+
+# times every import below, printed once the window is shown
+import_profile = ImportProfile()
+import_profile.start()
+
+from PySide6.QtCore import QTimer
+from PySide6.QtGui import QGuiApplication
 from PySide6.QtWidgets import QApplication, QWidget,QMessageBox
-from PyQt5.QtGui import QGuiApplication
 
 # Important:
 # You need to run the following command to generate the ui_form.py file
@@ -12,6 +20,13 @@ from PyQt5.QtGui import QGuiApplication
 #     pyside2-uic form.ui -o ui_form.py
 from ui_form import Ui_Widget
 
+# pysoem is loaded by backend.get() on the first scan
+from ethercat import backend
+from ethercat.qt_scan import ScanService
+
+# Give up on a bus scan after this many seconds
+SCAN_TIMEOUT = 10.0
+
 class Widget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -23,6 +38,14 @@ class Widget(QWidget):
         self.master = None  # Initially, the master is not connected
         self.master_opened = False  # Boolean flag to track if master is opened
 
+        # adapter discovery and bus scans run in the background
+        self.scanner = ScanService(self)
+        self.scanner.adapterFound.connect(self.on_adapter_found)
+        self.scanner.adaptersDone.connect(self.on_adapters_done)
+        self.scanner.slaveFound.connect(self.on_slave_found)
+        self.scanner.busOpened.connect(self.on_bus_opened)
+        self.scanner.failed.connect(self.on_scan_failed)
+
         self.ui.FindAdapter.clicked.connect(self.FindAdFunc)
         self.ui.pushButton_open.clicked.connect(self.OpenEthercat)
         self.ui.pushButton_Close.clicked.connect(self.CloseEthercat)
@@ -75,7 +98,10 @@ class Widget(QWidget):
 
     def CloseEthercat(self):
 
-        if self.master and self.master_opened:
+        if self.scanner.busy:
+            self.scanner.cancel()
+            self.show_message("Scan cancelled")
+        elif self.master and self.master_opened:
             self.master.close()
             self.master_opened = False  # Set the flag to False when closed
             self.master = None
@@ -88,25 +114,30 @@ class Widget(QWidget):
 
             etherCat = self.ui.Combo_Adapter.currentText()
             self.ui.Combo_Slaves.clear()
-            self.master = pysoem.Master()
-            self.master_opened = True
-            try:
-                self.master.open(etherCat)
-                if self.master.config_init() > 0:
-                    self.show_message('Master is opened')
-                    self.open_flag = 1
-                   # self.master.detect_slaves()  # Detect slaves on the network
-                    # Populate the slave combo box
-                    for i, slave in enumerate(self.master.slaves):
-                        slave_info = f"Slave {i}: {slave.name} ({slave.type})"
-                        self.Combo_Slaves.addItem(slave_info)
-                else:
-                    self.show_message('no device found')
-            except:
-                self.show_message('Invalid Master adress')
+            # open() and config_init() run on the scan thread, slaves are
+            # listed as they are found and on_bus_opened() finishes the setup
+            self.scanner.open_bus(etherCat, SCAN_TIMEOUT)
         else:
              self.show_message("Master already connected")
 
+    def on_slave_found(self, position, slave_name):
+        self.ui.Combo_Slaves.addItem(f"Slave {position}: {slave_name} (scanning)")
+
+    def on_bus_opened(self, master):
+        self.master = master
+        self.master_opened = True
+        self.open_flag = 1
+        # Populate the slave combo box
+        self.ui.Combo_Slaves.clear()
+        for i, slave in enumerate(self.master.slaves):
+            slave_info = f"Slave {i}: {slave.name}"
+            self.ui.Combo_Slaves.addItem(slave_info)
+        self.show_message('Master is opened')
+
+    def on_scan_failed(self, message):
+        self.ui.Combo_Slaves.clear()
+        self.show_message(message)
+
     def show_message(self,Text):
         msg = QMessageBox()
         #msg.setIcon(QMessageBox.Information)
@@ -117,14 +148,18 @@ class Widget(QWidget):
 
     def FindAdFunc(self):
         self.ui.Combo_Adapter.clear()
-        adapters = pysoem.find_adapters()
-        if not adapters:
-            self.show_message("No adapters found!")
+        # the adapters are added by on_adapter_found() while the scan runs
+        self.scanner.find_adapters()
 
-        self.show_message("Available adapters founded")
-        for i, adapter in enumerate(adapters):
-            # Add adapter name and description as a combo box item
-            self.ui.Combo_Adapter.addItem(f"{adapter.name}")
+    def on_adapter_found(self, name, desc):
+        # Add adapter name as a combo box item
+        self.ui.Combo_Adapter.addItem(f"{name}")
+
+    def on_adapters_done(self, count):
+        if not count:
+            self.show_message("No adapters found!")
+        else:
+            self.show_message("Available adapters founded")
 
     def configure_speed_profile_mode(self, slave_index, target_velocity):
         """
@@ -135,10 +170,10 @@ class Widget(QWidget):
         """
         try:
             # Step 1: Transition the EtherCAT network to Pre-Operational state
-            self.master.state = pysoem.PREOP_STATE
+            self.master.state = backend.PREOP_STATE
             self.master.write_state()
             self.master.read_state()
-            if self.master.state != pysoem.PREOP_STATE:
+            if self.master.state != backend.PREOP_STATE:
                 self.show_message("Failed to enter PRE-OP state.")
 
             # Step 2: Get the specific servo motor (slave)
@@ -158,11 +193,11 @@ class Widget(QWidget):
             servo_motor.sdo_write(0x60FF, 0, target_velocity)
 
             # Step 6: Transition the EtherCAT network to Operational state
-            self.master.state = pysoem.OP_STATE
+            self.master.state = backend.OP_STATE
             self.master.write_state()
             self.master.read_state()
 
-            if self.master.state != pysoem.OP_STATE:
+            if self.master.state != backend.OP_STATE:
                 self.show_message("Failed to enter OP state.")
 
             self.show_message(f"Servo motor {servo_motor.name} is configured for Speed Profile Mode with velocity {target_velocity}.")
@@ -217,4 +252,6 @@ if __name__ == "__main__":
     widget.setWindowTitle("Controlling Servo Motors")
     #widget.resize(500, 200)
     widget.show()
+    # once the event loop runs the window is on screen
+    QTimer.singleShot(0, import_profile.report)
     sys.exit(app.exec())
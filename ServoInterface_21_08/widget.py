@@ -1,13 +1,20 @@
 # This Python file uses the following encoding: utf-8
+import os
 import sys
-import PyQt5
-import pysoem
 import time
-import ctypes
 import struct
 
-from PySide6.QtWidgets import QApplication, QWidget,QMessageBox
-from PyQt5.QtGui import QGuiApplication
+# the shared EtherCAT core lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethercat.import_profile import ImportProfile
+
+# times every import below, printed once the window is shown
+import_profile = ImportProfile()
+import_profile.start()
+
+from PySide6.QtCore import QTimer
+from PySide6.QtGui import QGuiApplication
+from PySide6.QtWidgets import QApplication, QWidget,QMessageBox, QPushButton
 
 # Important:
 # You need to run the following command to generate the ui_form.py file
@@ -15,99 +22,89 @@ from PyQt5.QtGui import QGuiApplication
 #     pyside2-uic form.ui -o ui_form.py
 from ui_form import Ui_Widget
 
-class InputPdo(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ('modes_of_operation_display', ctypes.c_int8),
-        ('statusword', ctypes.c_uint16),
-        ('position_demand_value', ctypes.c_int32),
-        ('position_actual_value', ctypes.c_int32),
-        ('velocity_demand_value', ctypes.c_int32),
-        ('velocity_actual_value', ctypes.c_int32),
-        ('torque_demand_value', ctypes.c_int32),
-        ('torque_actual_value', ctypes.c_int32),
-        ('digital_input', ctypes.c_uint32),
-    ]
-
-
-class OutputPdo(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ('modes_of_operation', ctypes.c_int8),
-        ('controlword', ctypes.c_uint16),
-        ('target_position', ctypes.c_int32),
-        ('target_velocity', ctypes.c_int32),
-        ('target_torque', ctypes.c_int32),
-        ('digital_output', ctypes.c_uint32),
-    ]
-
-
-modes_of_operation = {
-    'No mode': 0,
-    'Profile position mode': 1,
-    'Profile velocity mode': 3,
-    'Profile Torque mode': 4,
-    'Homing mode': 6,
-    'Cyclic synchronous position mode': 8,
-    'Cyclic synchronous velocity mode': 9,
-    'Cyclic synchronous torque mode': 10,
-}
+# pysoem is loaded by backend.get() on the first scan, the trend and bus
+# status windows when they are opened
+from ethercat import backend
+from ethercat.bus_cache import BusCache
+from ethercat.master_manager import MasterManager, Segment
+from ethercat.pdo import modes_of_operation
+from ethercat.qt_scan import ScanService
+from ethercat.sdo import controlword_param, mode_param, target_speed_param, target_torque_param
+from ethercat.slave_state import state_name
 
 # Define constants for control commands
 CONTROLWORD_START = 0x000F  # Start/Enable
 CONTROLWORD_STOP = 0x0000  # Stop/Disable
 
-def convert_input_data(data):
-    return InputPdo.from_buffer_copy(data)
+# Cycle time of the process data exchange in seconds (1, 2 or 4 ms)
+CYCLE_TIME = 0.001
+
+# Give up on a bus scan after this many seconds
+SCAN_TIMEOUT = 10.0
+
+# Run the cyclic exchange of every adapter in its own process instead of a
+# thread, the GUI then only shares the process image with it
+CYCLIC_IN_PROCESS = False
 
-def set_mode_of_operation(slave, mode):
+# Configure SYNC0 on the slaves that have distributed clocks and keep the
+# cycle in step with their reference clock (needed for multi-axis CSP)
+DISTRIBUTED_CLOCKS = True
+
+# The cyclic exchange stops every axis when the GUI has not sent a heartbeat
+# for this many seconds (e.g. the event loop hangs), it is sent every
+# HEARTBEAT_PERIOD milliseconds
+HEARTBEAT_TIMEOUT = 0.5
+HEARTBEAT_PERIOD = 100
+
+def set_mode_of_operation(setpoint, mode):
     print("Setting the mode of operation: ...")
     if mode in modes_of_operation:
-        mode_value = modes_of_operation[mode]
         try:
-            slave.sdo_write(0x6060, 0, mode_value, pysoem.INT8)
-            #slave.sdo_write(0x6060, 0, mode_value.to_bytes(length=1, byteorder='little', signed=True))
-            #slave.sdo_write(index=0x6060, subindex=0, data=struct.pack("B", mode_value))
-            print(f"Mode of Operation set to: {mode} ({mode_value})")
+            path = setpoint.write(mode_param(mode))
+            print(f"Mode of Operation set to: {mode} ({modes_of_operation[mode]}) via {path}")
         except Exception as e:
             print(e)
     else:
         print(f"Invalid mode of operation: {mode}")
 
-def set_target_speed(slave, target_speed):
+def set_target_speed(setpoint, target_speed):
     print("Setting the target speed: ...")
     try:
-        TARGET_VELOCITY_INDEX = 0x60FF  # Target Velocity (assuming this is the index for velocity)
-        slave.sdo_write(TARGET_VELOCITY_INDEX, 0, target_speed, pysoem.INT32)
-        #slave.sdo_write(TARGET_VELOCITY_INDEX, 0, target_speed)
-        #slave.sdo_write(index=0x60FF, subindex=0, data=struct.pack("B", target_speed))
-        print(f"Set Target Speed to: {target_speed} RPM")
+        path = setpoint.write(target_speed_param(target_speed))
+        print(f"Set Target Speed to: {target_speed} RPM via {path}")
     except Exception as e:
         print(e)
 
-def set_target_torque(slave, target_torque):
+def set_target_torque(setpoint, target_torque):
     print("Setting the target torque: ...")
     try:
-        TARGET_TORQUE_INDEX = 0x6071
-        slave.sdo_write(TARGET_TORQUE_INDEX, 0, target_torque, pysoem.INT16)
-        #slave.sdo_write(TARGET_TORQUE_INDEX, 0, target_torque)
-        #slave.sdo_write(index=0x6071, subindex=0, data=struct.pack("B", target_torque))
-        print(f"Set Target Torque to: {target_torque} Nm")
+        path = setpoint.write(target_torque_param(target_torque))
+        print(f"Set Target Torque to: {target_torque} Nm via {path}")
     except Exception as e:
         print(e)
 
 
-def control_motor(slave, controlword):
-    print("Setting the target torque: ...")
+def control_motor(setpoint, controlword):
+    print("Setting the controlword: ...")
     try:
-        CONTROLWORD_INDEX = 0x6040  # Control Word index (adjust if needed)
-        slave.sdo_write(CONTROLWORD_INDEX, 0, controlword, pysoem.INT16)
-        #slave.sdo_write(index=0x6040, subindex=0, data=struct.pack("B", controlword))
-        print(f"Motor control command sent: {controlword}")
+        path = setpoint.write(controlword_param(controlword))
+        print(f"Motor control command sent: {controlword} via {path}")
     except Exception as e:
         print(e)
 
 
+def report_drive(name, action):
+    """Done callback for the futures of Cia402Drive, runs on the cyclic thread."""
+    def done(future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print(f"{name}: {action} failed: {future.exception()}")
+        else:
+            print(f"{name}: {future.result()}")
+    return done
+
+
 class Widget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -115,9 +112,26 @@ class Widget(QWidget):
         self.ui.setupUi(self)
         #self.center()  # Call the center method
 
-        # Initialize the master object
-        self.master = None  # Initially, the master is not connected
-        self.master_opened = False  # Boolean flag to track if master is opened
+        # one segment per opened adapter, the slaves of all of them are
+        # listed together in Combo_Slaves
+        # the PDO layouts of every bus are kept between starts
+        self.manager = MasterManager(CYCLE_TIME, processes=CYCLIC_IN_PROCESS, dc=DISTRIBUTED_CLOCKS,
+                                     heartbeat_timeout=HEARTBEAT_TIMEOUT, cache=BusCache())
+        self.axes = []
+        self.scan_adapter = None
+
+        # tells the supervisor of every segment that the event loop is alive
+        self.heartbeat = QTimer(self)
+        self.heartbeat.timeout.connect(self.manager.heartbeat)
+        self.heartbeat.start(HEARTBEAT_PERIOD)
+
+        # adapter discovery and bus scans run in the background
+        self.scanner = ScanService(self)
+        self.scanner.adapterFound.connect(self.on_adapter_found)
+        self.scanner.adaptersDone.connect(self.on_adapters_done)
+        self.scanner.slaveFound.connect(self.on_slave_found)
+        self.scanner.busOpened.connect(self.on_bus_opened)
+        self.scanner.failed.connect(self.on_scan_failed)
 
         self.ui.FindAdapter.clicked.connect(self.FindAdFunc)
         self.ui.pushButton_open.clicked.connect(self.OpenEthercat)
@@ -141,18 +155,105 @@ class Widget(QWidget):
 
         self.ui.ApplySetB.clicked.connect(self.ApplySet)
 
+        # records the inputs of all axes every cycle while checked
+        self.recordB = QPushButton("Record", self)
+        self.recordB.setCheckable(True)
+        self.recordB.setGeometry(50, 450, 151, 41)
+        self.recordB.toggled.connect(self.Record)
+
+        # live trend of the selected axis
+        self.trendB = QPushButton("Trend", self)
+        self.trendB.setGeometry(50, 400, 151, 41)
+        self.trendB.clicked.connect(self.Trend)
+        self.trends = []
+
+        # lost frames, working counter and ESC error counters of every segment
+        self.busStatusB = QPushButton("Bus status", self)
+        self.busStatusB.setGeometry(650, 400, 151, 41)
+        self.busStatusB.clicked.connect(self.BusStatus)
+        self.bus_status = None
+
     def Close(self):
         self.close();
 
+    def closeEvent(self, event):
+        for trend in self.trends:
+            trend.close()
+        if self.bus_status is not None:
+            self.bus_status.close()
+        self.scanner.cancel()
+        self.scanner.wait()
+        self.manager.close_all()
+        super().closeEvent(event)
+
+    def Record(self, checked):
+        for adapter, segment in self.manager.segments.items():
+            if not isinstance(segment, Segment):
+                print(f"{adapter}: recording is not available for a separate cyclic process")
+            elif checked:
+                path = f"telemetry_{adapter.replace('/', '_')}_{time.strftime('%Y%m%d_%H%M%S')}.ectr"
+                try:
+                    segment.start_recording(path)
+                    print(f"Recording {adapter} to {path}")
+                except Exception as e:
+                    print(e)
+            else:
+                segment.stop_recording()
+
+    def Trend(self):
+        axis = self.selected_axis()
+        if axis is None:
+            return
+        segment = axis.segment
+        if not isinstance(segment, Segment) or not segment.running or segment.image[axis.position] is None:
+            print("Trend needs a running cyclic exchange with a mapped process image")
+            return
+        from ethercat.qt_trend import TrendWindow
+        trend = TrendWindow(segment.worker, [(repr(axis), segment.image[axis.position].inputs)])
+        trend.setWindowTitle(f"Trend {axis}")
+        trend.show()
+        # keep a reference, closed windows are dropped on the next open
+        self.trends = [t for t in self.trends if t.isVisible()] + [trend]
+
+    def BusStatus(self):
+        if self.bus_status is None or not self.bus_status.isVisible():
+            from ethercat.qt_bus_status import BusStatusWindow
+            self.bus_status = BusStatusWindow(self.manager)
+        self.bus_status.show()
+        self.bus_status.raise_()
+
+    def selected_axis(self):
+        selected_slave_index = self.ui.Combo_Slaves.currentIndex()
+        if selected_slave_index == -1 or selected_slave_index >= len(self.axes):
+            print("Please select a servo motor")
+            return None
+        return self.axes[selected_slave_index]
+
+    def acknowledge_trip(self, axis):
+        """A new move acknowledges a safe stop of the segment, the drive is enabled again after it."""
+        if axis.segment.tripped:
+            print(f"{axis.segment.adapter}: safe stop acknowledged")
+            axis.segment.reset_trip()
+
+    def refresh_slaves(self):
+        self.ui.Combo_Slaves.clear()
+        self.axes = self.manager.axes()
+        for axis in self.axes:
+            self.ui.Combo_Slaves.addItem(repr(axis))
+
     def ApplySet(self):
 
-        self.master.state = pysoem.PREOP_STATE
-        self.master.write_state()
-        self.master.read_state()
-        if self.master.state != pysoem.PREOP_STATE:
-            print("Failed to enter PRE-OP state.")
-        else:
-            print("PRE-OP state successfilly changed")
+        axis = self.selected_axis()
+        if axis is None:
+            return
+
+        if not axis.segment.running:
+            # mode and targets can only be written by SDO without the cyclic exchange,
+            # only this axis goes to PRE-OP
+            if axis.set_state(backend.PREOP_STATE) != backend.PREOP_STATE:
+                print("Failed to enter PRE-OP state.")
+            else:
+                print("PRE-OP state successfilly changed")
 
         selected_mode = self.ui.ModeOfOperation.currentText()
         #target_speed = (self.ui.spinBox_TargetVelocity.value()).to_bytes(length=4, byteorder='little', signed=False)
@@ -165,38 +266,36 @@ class Widget(QWidget):
 
         try:
 
-            selected_slave_index = self.ui.Combo_Slaves.currentIndex()
-
-
-            if selected_slave_index == -1:
-                print("Please select a servo motor")
-                return
-
-            print(f"selected {selected_slave_index+1} servo motor")
-            servo_slave = self.master.slaves[selected_slave_index]
-
-            set_mode_of_operation(servo_slave, selected_mode)
+            print(f"selected {axis} servo motor")
+            setpoint = axis.setpoint
 
-            # Set target speed and torque
-            set_target_speed(servo_slave, target_speed)
-            set_target_torque(servo_slave, target_torque)
+            # mode, target speed and torque are written as one parameter set,
+            # through the output image when they are mapped
+            paths = setpoint.apply([
+                mode_param(selected_mode),
+                target_speed_param(target_speed),
+                target_torque_param(target_torque),
+            ])
+            print(f"Settings applied to {setpoint.sdo.name} via {', '.join(paths)}")
 
         except Exception as e:
             print(e)
 
     def move_servo(self):
         """Configure the selected servo motor using SDOs and PDOs"""
-        selected_slave_index = self.ui.Combo_Slaves.currentIndex()
-
-
-        if selected_slave_index == -1:
-            print("Please select a servo motor")
+        axis = self.selected_axis()
+        if axis is None:
             return
 
-        servo_slave = self.master.slaves[selected_slave_index]
+        setpoint = axis.setpoint
 
         try:
-            control_motor(servo_slave, CONTROLWORD_START)
+            if axis.drive is not None:
+                self.acknowledge_trip(axis)
+                # steps through Shutdown, Switch on and Enable operation as the statusword allows
+                axis.drive.enable().add_done_callback(report_drive(axis.name, "enable"))
+            else:
+                control_motor(setpoint, CONTROLWORD_START)
             print("Motor is now moving.")
         except:
             print("No slaves found.")
@@ -204,54 +303,61 @@ class Widget(QWidget):
     def stop_servo(self):
 
         """Configure the selected servo motor using SDOs and PDOs"""
-        selected_slave_index = self.ui.Combo_Slaves.currentIndex()
-
-
-        if selected_slave_index == -1:
-            print("Please select a servo motor")
+        axis = self.selected_axis()
+        if axis is None:
             return
 
-        servo_slave = self.master.slaves[selected_slave_index]
+        setpoint = axis.setpoint
 
         try:
-            control_motor(servo_slave, CONTROLWORD_STOP)
+            if axis.drive is not None:
+                axis.drive.disable().add_done_callback(report_drive(axis.name, "disable"))
+            else:
+                control_motor(setpoint, CONTROLWORD_STOP)
             print("Motor has been stopped.")
         except:
             print("Error: No slaves found.")
 
     def CloseEthercat(self):
 
-        if self.master and self.master_opened:
-            self.master.close()
-            self.master_opened = False  # Set the flag to False when closed
-            self.master = None
-            print("EtherCAT master closed")
+        etherCat = self.ui.Combo_Adapter.currentText()
+        if self.scanner.busy:
+            self.scanner.cancel()
+            print("Scan cancelled")
+        elif etherCat in self.manager:
+            self.manager.close(etherCat)
+            self.refresh_slaves()
+            print(f"EtherCAT master on {etherCat} closed")
         else:
             print("Master is not opened")
 
     def OpenEthercat(self):
-        if self.master is None:
-
-            etherCat = self.ui.Combo_Adapter.currentText()
-            self.ui.Combo_Slaves.clear()
-            self.master = pysoem.Master()
-            self.master_opened = True
-            try:
-                self.master.open(etherCat)
-                if self.master.config_init() > 0:
-                    print('Master is opened')
-                    self.open_flag = 1
-                    #self.master.detect_slaves()  # Detect slaves on the network
-                    # Populate the slave combo box
-                    for i, slave in enumerate(self.master.slaves):
-                        slave_name = getattr(slave, 'name', f"Unknown Slave {i+1}")
-                        self.ui.Combo_Slaves.addItem(f"Slave {i+1}: {slave_name}", slave)
-                else:
-                    print('no device found')
-            except Exception as e:
-                print(e)
+        etherCat = self.ui.Combo_Adapter.currentText()
+        if etherCat not in self.manager:
+
+            # open(), config_init() and the start of the cyclic exchange run on
+            # the scan thread, slaves are listed as they are found and
+            # on_bus_opened() receives the running segment
+            self.scan_adapter = etherCat
+            if self.scanner.open_bus(etherCat, SCAN_TIMEOUT, self.manager.starter()):
+                print(f"Scanning {etherCat} ...")
         else:
-            print('Invalid Master Adress')
+            print('Master already connected')
+
+    def on_slave_found(self, position, slave_name):
+        self.ui.Combo_Slaves.addItem(f"{self.scan_adapter} / Slave {position+1}: {slave_name} (scanning)")
+
+    def on_bus_opened(self, segment):
+        print(f'Master on {segment.adapter} is opened')
+        # setpoints go through the output image from now on
+        self.manager.attach(segment)
+        # the supervisor was armed on the scan thread
+        segment.heartbeat()
+        self.refresh_slaves()
+
+    def on_scan_failed(self, message):
+        print(message)
+        self.refresh_slaves()
 
     def show_message(self,Text):
         msg = QMessageBox()
@@ -263,14 +369,18 @@ class Widget(QWidget):
 
     def FindAdFunc(self):
         self.ui.Combo_Adapter.clear()
-        adapters = pysoem.find_adapters()
-        if not adapters:
-            print("No adapters found!")
+        # the adapters are added by on_adapter_found() while the scan runs
+        self.scanner.find_adapters()
 
-        print("Available adapters founded")
-        for i, adapter in enumerate(adapters):
-            # Add adapter name and description as a combo box item
-            self.ui.Combo_Adapter.addItem(f"{adapter.name}")
+    def on_adapter_found(self, name, desc):
+        # Add adapter name as a combo box item
+        self.ui.Combo_Adapter.addItem(f"{name}")
+
+    def on_adapters_done(self, count):
+        if not count:
+            print("No adapters found!")
+        else:
+            print("Available adapters founded")
 
     def center(self):
         # Get the screen's geometry using QScreen instead of QDesktopWidget
@@ -291,50 +401,55 @@ class Widget(QWidget):
 
     def move_servo_2(self):
        """Configure the selected servo motor using SDOs and PDOs"""
-       slave_index = self.ui.Combo_Slaves.currentIndex()
-
-
-       if slave_index == -1:
-           print("Please select a servo motor")
+       axis = self.selected_axis()
+       if axis is None:
+           return
+       master = axis.segment.master
+       if master is None:
+           print("Not available while the bus runs in a separate process")
            return
 
        target_velocity = self.ui.spinBox_TargetVelocity.value()
        try:
-           # Step 1: Transition the EtherCAT network to Pre-Operational state
-           self.master.state = pysoem.PREOP_STATE
-           self.master.write_state()
-           self.master.read_state()
-           if self.master.state != pysoem.PREOP_STATE:
-               print("Failed to enter PRE-OP state.")
+           # Step 1: Transition this servo motor to Pre-Operational state,
+           # the other axes keep running
+           state = axis.set_state(backend.PREOP_STATE)
+           if state != backend.PREOP_STATE:
+               print(f"Failed to enter PRE-OP state, slave is in {state_name(state)}.")
            else:
                 print("PRE-OP state changed.")
 
            # Step 2: Get the specific servo motor (slave)
-           servo_motor = self.master.slaves[slave_index]
+           servo_motor = axis.sdo
 
            # Step 3: Set the operating mode to Speed Profile Mode
            # Speed Profile Mode is typically set via SDO 0x6060 with the value of 0x03
            print("step 3: ...")
            servo_motor.sdo_write(index=0x6060, subindex=0, data=struct.pack("B", 3))
 
-           # Step 4: Set the Control Word to switch on the servo motor
-           # Control Word 0x6040: 0x06 (enable voltage), 0x07 (enable operation)
-           print("step 4: ...")
-           servo_motor.sdo_write(index=0x6040, subindex=0, data=0x06)
-           servo_motor.sdo_write(index=0x6040, subindex=0, data=0x07)
-
-           # Step 5: Set the target velocity via SDO 0x60FF
+           # Step 4: Set the target velocity via SDO 0x60FF
            # Example: Write the target velocity to the servo motor
-           print("step 5: ...")
-           servo_motor.sdo_write(index=0x60FF, subindex=0, data=struct.pack("B", target_velocity))
-
-           # Step 6: Transition the EtherCAT network to Operational state
-           self.master.state = pysoem.OP_STATE
-           self.master.write_state()
-           self.master.read_state()
-
-           if self.master.state != pysoem.OP_STATE:
-               print("Failed to enter OP state.")
+           print("step 4: ...")
+           servo_motor.sdo_write(index=0x60FF, subindex=0, data=struct.pack("<i", target_velocity))
+
+           # Step 5: Transition this servo motor back to Operational state
+           state = axis.set_state(backend.OP_STATE)
+           if state != backend.OP_STATE:
+               print(f"Failed to enter OP state, slave is in {state_name(state)}.")
+
+           # Step 6: Switch on the servo motor
+           # The output image overrides the mapped objects in OP, so mode and
+           # velocity go there too; the drive state machine then sends
+           # Shutdown, Switch on and Enable operation as the statusword allows
+           print("step 6: ...")
+           if axis.drive is not None:
+               axis.setpoint.apply([mode_param('Profile velocity mode'), target_speed_param(target_velocity)])
+               self.acknowledge_trip(axis)
+               axis.drive.enable().add_done_callback(report_drive(servo_motor.name, "enable"))
+           else:
+               # Control Word 0x6040: 0x06 (enable voltage), 0x07 (enable operation)
+               servo_motor.sdo_write(index=0x6040, subindex=0, data=struct.pack("<H", 0x06))
+               servo_motor.sdo_write(index=0x6040, subindex=0, data=struct.pack("<H", 0x07))
 
            print(f"Servo motor {servo_motor.name} is configured for Speed Profile Mode with velocity {target_velocity}.")
            #self.status_label.setText(f"Servo {servo_motor.name} in Speed Profile Mode.")
@@ -350,26 +465,26 @@ class Widget(QWidget):
 
        :param slave_index: Index of the slave (servo motor) to stop.
        """
-       selected_slave_index = self.ui.Combo_Slaves.currentIndex()
-
-
-       if selected_slave_index == -1:
-           print("Please select a servo motor")
+       axis = self.selected_axis()
+       if axis is None:
            return
 
        try:
            # Step 1: Get the specific servo motor (slave)
-           servo_motor = self.master.slaves[selected_slave_index]
+           servo_motor = axis.sdo
 
            # Step 2: Set the target velocity to 0 to stop the motor
-           # SDO 0x60FF is used to set the target velocity.
+           # 0x60FF goes into the output image while the exchange runs, by SDO otherwise
            print("step 2: ...")
-           servo_motor.sdo_write(index=0x60FF, subindex=0, data=struct.pack("B", 0))
+           axis.setpoint.write(target_speed_param(0))
 
            # Step 3: Set the Control Word to stop the motor
            # Control Word 0x6040: Set it to 0x06 to disable operation
            print("step 3: ...")
-           servo_motor.sdo_write(index=0x60FF, subindex=0, data=0x06)
+           if axis.drive is not None:
+               axis.drive.disable().add_done_callback(report_drive(servo_motor.name, "disable"))
+           else:
+               servo_motor.sdo_write(index=0x6040, subindex=0, data=struct.pack("<H", 0x06))
 
 
            print(f"Servo motor {servo_motor.name} is stopped.")
@@ -384,4 +499,6 @@ if __name__ == "__main__":
     widget.setWindowTitle("Controlling Servo Motors")
     #widget.resize(500, 200)
     widget.show()
+    # once the event loop runs the window is on screen
+    QTimer.singleShot(0, import_profile.report)
     sys.exit(app.exec())
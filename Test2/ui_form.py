@@ -60,6 +60,6 @@ class Ui_Widget(object):
         self.label.setText(QCoreApplication.translate("Widget", u"After Serch, Write the name of the slave", None))
         self.OpenB.setText(QCoreApplication.translate("Widget", u"Open", None))
         self.MMB.setText(QCoreApplication.translate("Widget", u"Motor Move", None))
-        self.label_2.setText(QCoreApplication.translate("Widget", u"You can stop the motor while moving by clicking one of the keyboard keys", None))
+        self.label_2.setText(QCoreApplication.translate("Widget", u"You can stop the motor while moving by clicking Close", None))
     # retranslateUi
 
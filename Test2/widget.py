@@ -1,4 +1,5 @@
 # This Python file uses the following encoding: utf-8
+import os
 import sys
 
 from PySide6.QtWidgets import QApplication, QWidget
@@ -10,143 +11,133 @@ from PySide6.QtWidgets import QApplication, QWidget
 from ui_form import Ui_Widget
 
 
-import pysoem
-import time
-import ctypes
-tmcm1617 = None
+# the shared EtherCAT core lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethercat import backend
+from ethercat.bus_cache import BusCache
+from ethercat.cia402 import Cia402Drive
+from ethercat.cyclic import CyclicWorker
+from ethercat.pdo import ProcessImage, modes_of_operation
+from ethercat.sdo import TMCM1617_PARAMS, is_tmcm1617
+from ethercat.supervisor import Supervisor
+
 open_flag = 0
-master = pysoem.Master()
-
-
-class InputPdo(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ('modes_of_operation_display', ctypes.c_int8),
-        ('statusword', ctypes.c_uint16),
-        ('position_demand_value', ctypes.c_int32),
-        ('position_actual_value', ctypes.c_int32),
-        ('velocity_demand_value', ctypes.c_int32),
-        ('velocity_actual_value', ctypes.c_int32),
-        ('torque_demand_value', ctypes.c_int32),
-        ('torque_actual_value', ctypes.c_int32),
-        ('digital_input', ctypes.c_uint32),
-    ]
-
-
-class OutputPdo(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ('modes_of_operation', ctypes.c_int8),
-        ('controlword', ctypes.c_uint16),
-        ('target_position', ctypes.c_int32),
-        ('target_velocity', ctypes.c_int32),
-        ('target_torque', ctypes.c_int32),
-        ('digital_output', ctypes.c_uint32),
-    ]
-
-
-modes_of_operation = {
-    'No mode': 0,
-    'Profile position mode': 1,
-    'Profile velocity mode': 3,
-    'Homing mode': 6,
-    'Cyclic synchronous position mode': 8,
-    'Cyclic synchronous velocity mode': 9,
-    'Cyclic synchronous torque mode': 10,
-}
-
-def convert_input_data(data):
-    return InputPdo.from_buffer_copy(data)
-
-
-def tmcm1617_config_func(slave_pos):
-    global tmcm1617
-    # limit maximum current
-    tmcm1617.sdo_write(0x2003, 0, (2000).to_bytes(length=4, byteorder='little', signed=False))
-    # set torque control P value
-    tmcm1617.sdo_write(0x2041, 1, (50).to_bytes(length=2, byteorder='little', signed=False))
-    # set torque control I value
-    tmcm1617.sdo_write(0x2041, 2, (20).to_bytes(length=2, byteorder='little', signed=False))
-    # set motor type = BLDC
-    tmcm1617.sdo_write(0x2050, 0, bytes([3]))
-    # set commutation mode = Hall sensors
-    tmcm1617.sdo_write(0x2055, 0, bytes([2]))
-    # inverse hall direction
-    tmcm1617.sdo_write(0x2070, 2, bytes([1]))
-    # tune hall PHI_E offset
-    tmcm1617.sdo_write(0x2070, 4, (10500).to_bytes(length=2, byteorder='little', signed=True))
+master = backend.get().Master()
+
+# Cycle time of the process data exchange in seconds (1, 2 or 4 ms)
+CYCLE_TIME = 0.001
+
+# Topology, PDO layouts and parameters of the last start, a restart only
+# reads and writes what changed on the bus
+bus_cache = BusCache()
 
 
+def report_enabled(future):
+    # called on the cyclic thread once the enable request is done
+    if future.exception() is not None:
+        print(f'Enabling the drive failed: {future.exception()}')
+    else:
+        print(f'Drive state: {future.result()}')
+
 
 class Widget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.ui = Ui_Widget()
         self.ui.setupUi(self)
+        self.open_flag = 0
+        self.adapter = None
+        self.worker = None
         self.ui.SearchB.clicked.connect(self.Serch)
         self.ui.CloseB.clicked.connect(self.Close)
         self.ui.OpenB.clicked.connect(self.Open)
+        self.ui.MMB.clicked.connect(self.Move)
 
     def Serch(self):
-        #master = pysoem.Master()
-        for nic in pysoem.find_adapters():
+        #master = backend.get().Master()
+        for nic in backend.get().find_adapters():
             print(nic)
             self.ui.textE.appendPlainText(nic.name)
 
     def Close(self):
+        self.StopMove()
         self.close()
 
+    def closeEvent(self, event):
+        self.StopMove()
+        super().closeEvent(event)
+
 
     def Open(self):
-        #master = pysoem.Master()
+        #master = backend.get().Master()
         try:
-            master.open(self.ui.masterLE.text())
+            self.adapter = self.ui.masterLE.text()
+            master.open(self.adapter)
             if master.config_init() > 0:
                 print('Master is opened')
                 self.open_flag = 1
             else:
                 print('no device found')
-            master.close()
+                master.close()
         except:
             print('Invalid Master adress')
 
     def Move(self):
+        if self.worker is not None:
+            print('Motor is already moving')
+            return
         if self.open_flag == 1:
             tmcm1617 = master.slaves[0]
-            tmcm1617.config_func = tmcm1617_config_func
+            # configure the TMCM-1617 drives in PRE-OP that are not configured yet, the mailbox traffic
+            # of the slaves overlaps; drives of other vendors do not have these objects
+            positions = [i for i, slave in enumerate(master.slaves) if is_tmcm1617(slave)]
+            for slave, error in bus_cache.configure(self.adapter, master.slaves, TMCM1617_PARAMS, positions=positions):
+                print(f'Configuration of {slave.name} failed: {error}')
             master.config_map()
-            if master.state_check(pysoem.SAFEOP_STATE, 50_000) == pysoem.SAFEOP_STATE:
-                master.state = pysoem.OP_STATE
+            if master.state_check(backend.SAFEOP_STATE, 50_000) == backend.SAFEOP_STATE:
+                layouts = bus_cache.discover_layouts(self.adapter, master.slaves)
+                image = ProcessImage([tmcm1617], layouts=layouts[:1])
+                output_data = image[0].outputs
+                output_data.modes_of_operation = modes_of_operation['Profile velocity mode']
+                output_data.target_velocity = 500  # RPM
+                # keep exchanging process data on the cyclic thread,
+                # the motor runs until Close is clicked
+                # a lost working counter or a drive fault stops the motor in the next cycle
+                supervisor = Supervisor(master, image)
+                self.worker = CyclicWorker(master, CYCLE_TIME, image=supervisor)
+                # the drive is enabled step by step as its statusword allows
+                drive = Cia402Drive(image[0])
+                self.worker.add_callback(drive.update)
+                self.worker.add_callback(supervisor.check)
+                self.worker.start()
+                master.state = backend.OP_STATE
                 master.write_state()
-                master.state_check(pysoem.OP_STATE, 5_000_000)
-                if master.state == pysoem.OP_STATE:
-                    output_data = OutputPdo()
-                    output_data.modes_of_operation = modes_of_operation['Profile velocity mode']
-                    output_data.target_velocity = 500  # RPM
-                    for control_cmd in [6, 7, 15]:
-                        output_data.controlword = control_cmd
-                        tmcm1617.output = bytes(output_data)  # that is the actual change of the PDO output data
-                        master.send_processdata()
-                        master.receive_processdata(1_000)
-                        time.sleep(0.01)
-                    try:
-                        while 1:
-                            master.send_processdata()
-                            master.receive_processdata(1_000)
-                            time.sleep(0.01)
-                    except KeyboardInterrupt:
-                        print('stopped')
-                    # zero everything
-                    tmcm1617.output = bytes(len(tmcm1617.output))
-                    master.send_processdata()
-                    master.receive_processdata(1_000)
-                else:
-                    print('failed to got to op state')
+                if master.state_check(backend.OP_STATE, 5_000_000) == backend.OP_STATE:
+                    supervisor.arm()
+                    drive.enable().add_done_callback(report_enabled)
+                    return
+                print('failed to got to op state')
+                self.StopMove()
+                return
             else:
                 print('failed to got to safeop state')
-            master.state = pysoem.PREOP_STATE
+            master.state = backend.PREOP_STATE
             master.write_state()
 
+    def StopMove(self):
+        if self.worker is None:
+            return
+        self.worker.stop()
+        print('stopped', self.worker.stats())
+        self.worker = None
+        # zero everything
+        for slave in master.slaves:
+            slave.output = bytes(len(slave.output))
+        master.send_processdata()
+        master.receive_processdata(1_000)
+        master.state = backend.PREOP_STATE
+        master.write_state()
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     widget = Widget()
@@ -0,0 +1,253 @@
+# This Python file uses the following encoding: utf-8
+"""
+Cycle time and jitter benchmark of the process data path.
+
+Runs the cyclic exchange (CyclicWorker, or the old send/receive + sleep
+loop with --loop sleep) for every combination of cycle time and slave
+count and reports the exchange latency and period jitter (histograms and
+p50/p99/p99.9), missed deadlines, the most memory an exchange holds at once
+and CPU use.
+
+    ETHERCAT_BACKEND=sim python3 benchmarks/bench_cycle.py
+    python3 benchmarks/bench_cycle.py --backend pysoem --adapter eth0 --output release.json
+    python3 benchmarks/bench_cycle.py --compare release.json
+
+With the simulator the slave counts are simulated, on real hardware the
+bus decides and --slaves is ignored.
+"""
+import argparse
+import array
+import gc
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+# the shared EtherCAT core lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethercat import backend, scan
+from ethercat.cyclic import CYCLE_TIMES, CyclicWorker
+from ethercat.pdo import ProcessImage
+
+from common import load_results, write_report
+
+# histogram bin edges in microseconds, the last bin is open
+HISTOGRAM_EDGES_US = (0, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Exchanges traced with tracemalloc after the timed run, tracing would distort the timing
+ALLOCATION_CYCLES = 1000
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(values_ns):
+    """Percentiles and histogram of a list of durations in ns, reported in µs."""
+    values = sorted(value / 1000 for value in values_ns)
+    counts = [0] * len(HISTOGRAM_EDGES_US)
+    bin_index = 0
+    for value in values:
+        while bin_index + 1 < len(HISTOGRAM_EDGES_US) and value >= HISTOGRAM_EDGES_US[bin_index + 1]:
+            bin_index += 1
+        counts[bin_index] += 1
+    return {
+        'p50': percentile(values, 0.5),
+        'p99': percentile(values, 0.99),
+        'p99.9': percentile(values, 0.999),
+        'max': values[-1] if values else 0.0,
+        'histogram': {'edges': list(HISTOGRAM_EDGES_US), 'counts': counts},
+    }
+
+
+def sleep_loop(master, image, cycle_time, cycles, starts, exchanges):
+    """The loop the widgets used before CyclicWorker: exchange, then sleep one cycle."""
+    for i in range(cycles):
+        start = time.monotonic_ns()
+        image.write_outputs()
+        master.send_processdata()
+        master.receive_processdata(1_000)
+        image.read_inputs()
+        starts[i] = start
+        exchanges[i] = time.monotonic_ns() - start
+        time.sleep(cycle_time)
+
+
+def _traced_peak(step):
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    step()
+    return tracemalloc.get_traced_memory()[1] - base
+
+
+def held_peaks(step, cycles):
+    """
+    Most bytes step() holds at the same time per call, from tracemalloc.
+
+    Memory that is allocated and freed again within the call counts too,
+    so only a step that allocates nothing reports 0. This is a high-water
+    mark, not a total: it does not grow with the number of allocations
+    that are freed before the next one, and Python has no allocation
+    counter outside debug builds. The overhead of the probe itself,
+    measured with an empty step, is taken off.
+    """
+    tracemalloc.start()
+    try:
+        overhead = min(_traced_peak(lambda: None) for _ in range(100))
+        return [max(_traced_peak(step) - overhead, 0) for _ in range(cycles)]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(adapter, loop, cycle_time, slaves, duration, cpu):
+    if backend.name() == 'sim':
+        backend.get().configure(slaves=slaves)
+    master = scan.open_bus(adapter)
+    try:
+        master.config_map()
+        if master.state_check(backend.SAFEOP_STATE, 50_000) != backend.SAFEOP_STATE:
+            raise RuntimeError(f"{adapter}: failed to got to safeop state")
+        image = ProcessImage(master.slaves, strict=False)
+        cycles = int(duration / cycle_time)
+
+        if loop == 'worker':
+            # twice the expected cycles so the history never wraps
+            worker = CyclicWorker(master, cycle_time, image=image, cpu=cpu, history=2 * cycles)
+        else:
+            starts = array.array('q', bytes(8 * cycles))
+            exchanges = array.array('q', bytes(8 * cycles))
+
+        gc.collect()
+        collections = gc.get_stats()[0]['collections']
+        blocks = sys.getallocatedblocks()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        wall = time.perf_counter()
+
+        overruns = None
+        if loop == 'worker':
+            worker.start()
+            master.state = backend.OP_STATE
+            master.write_state()
+            time.sleep(duration)
+            worker.stop()
+            if worker.error is not None:
+                raise worker.error
+            count = min(worker.cycles, worker.history)
+            starts = worker.start_history[:count]
+            exchanges = worker.exchange_history[:count]
+            overruns = worker.overruns
+        else:
+            master.state = backend.OP_STATE
+            master.write_state()
+            count = cycles
+            sleep_loop(master, image, cycle_time, cycles, starts, exchanges)
+
+        wall = time.perf_counter() - wall
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        blocks = sys.getallocatedblocks() - blocks
+        collections = gc.get_stats()[0]['collections'] - collections
+
+        # the same exchange both loops run every cycle, traced on this thread
+        def exchange():
+            image.write_outputs()
+            master.send_processdata()
+            master.receive_processdata(1_000)
+            image.read_inputs()
+        held = held_peaks(exchange, ALLOCATION_CYCLES)
+
+        master.state = backend.PREOP_STATE
+        master.write_state()
+    finally:
+        master.close()
+
+    cycle_ns = int(round(cycle_time * 1e9))
+    periods = [b - a for a, b in zip(starts, starts[1:])]
+    cpu_time = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    return {
+        'loop': loop,
+        'cycle_time': cycle_time,
+        'slaves': len(image),
+        'cycles': count,
+        'overruns': overruns,
+        # cycles started more than half a cycle late
+        'late_cycles': sum(1 for period in periods if period > cycle_ns * 3 // 2),
+        'period_mean_us': sum(periods) / max(len(periods), 1) / 1000,
+        'jitter_us': summarize(abs(period - cycle_ns) for period in periods),
+        'exchange_us': summarize(exchanges),
+        'cpu_percent': 100 * cpu_time / wall,
+        'voluntary_switches': after.ru_nvcsw - usage.ru_nvcsw,
+        'involuntary_switches': after.ru_nivcsw - usage.ru_nivcsw,
+        # net growth of allocated memory blocks, anything above 0 is a leak in the cycle
+        'net_blocks_per_cycle': blocks / max(count, 1),
+        # most bytes one exchange holds at once, freed or not; 0 is allocation free, but the
+        # value is a high-water mark and says nothing about how many allocations there are
+        'exchange_held_bytes': {
+            'mean': sum(held) / len(held),
+            'max': max(held),
+        },
+        'gc_collections': collections,
+    }
+
+
+def compare(old_path, results):
+    """Print p99 jitter and exchange time of matching runs next to an older result file."""
+    old = {(r['loop'], r['cycle_time'], r['slaves']): r for r in load_results(old_path)}
+    print(f"\nCompared with {old_path}:")
+    for result in results:
+        previous = old.get((result['loop'], result['cycle_time'], result['slaves']))
+        if previous is None:
+            continue
+        print(f"{result['loop']:>6} {result['cycle_time'] * 1000:g} ms {result['slaves']:>3} slaves: "
+              f"jitter p99 {previous['jitter_us']['p99']:8.1f} -> {result['jitter_us']['p99']:8.1f} µs, "
+              f"exchange p99 {previous['exchange_us']['p99']:8.1f} -> {result['exchange_us']['p99']:8.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', default=os.environ.get(backend.BACKEND_ENV, 'sim'),
+                        choices=sorted(backend.BACKENDS))
+    parser.add_argument('--adapter', help="adapter to open, the first simulated one by default")
+    parser.add_argument('--cycle-times', default=','.join(str(t) for t in CYCLE_TIMES),
+                        help="comma separated cycle times in seconds")
+    parser.add_argument('--slaves', default='1,8,32,64', help="comma separated simulated slave counts")
+    parser.add_argument('--loop', default='worker', help="worker, sleep or worker,sleep")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per run")
+    parser.add_argument('--cpu', type=int, help="CPU the cyclic thread is pinned to")
+    parser.add_argument('--output', default='bench_cycle.json')
+    parser.add_argument('--compare', help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    backend.use(args.backend)
+    adapter = args.adapter
+    if adapter is None:
+        if args.backend != 'sim':
+            parser.error("--adapter is needed on real hardware")
+        adapter = backend.get().find_adapters()[0].name
+    cycle_times = [float(t) for t in args.cycle_times.split(',')]
+    slave_counts = [int(n) for n in args.slaves.split(',')] if args.backend == 'sim' else [None]
+
+    results = []
+    for loop in args.loop.split(','):
+        for slaves in slave_counts:
+            for cycle_time in cycle_times:
+                result = run_case(adapter, loop, cycle_time, slaves, args.duration, args.cpu)
+                results.append(result)
+                print(f"{loop:>6} {cycle_time * 1000:g} ms {result['slaves']:>3} slaves: "
+                      f"{result['cycles']} cycles, overruns {result['overruns']}, late {result['late_cycles']}, "
+                      f"jitter p50/p99/p99.9 {result['jitter_us']['p50']:.1f}/{result['jitter_us']['p99']:.1f}/"
+                      f"{result['jitter_us']['p99.9']:.1f} µs, exchange p99 {result['exchange_us']['p99']:.1f} µs, "
+                      f"CPU {result['cpu_percent']:.0f} %, "
+                      f"held {result['exchange_held_bytes']['mean']:.0f} B/exchange at most, "
+                      f"net blocks/cycle {result['net_blocks_per_cycle']:.3f}")
+
+    write_report(args.output, args.backend, adapter, results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# This Python file uses the following encoding: utf-8
+"""
+SDO throughput and bring-up time benchmark.
+
+Times the PRE-OP -> SAFE-OP -> OP bring-up and every SDO sequence the
+applications run today, for several slave counts and mailbox latencies:
+
+    configure   the seven TMCM-1617 writes of tmcm1617_config_func, one
+                slave after the other, concurrently (configure_slaves),
+                concurrently with complete access, and repeated through a
+                warm SdoCache
+    apply_set   the mode/speed/torque writes of ApplySet, with and without
+                a warm SdoCache
+    move        the SDO enable sequence of move_servo_2 on one axis, with
+                only that slave leaving OP and with the whole bus
+
+    ETHERCAT_BACKEND=sim python3 benchmarks/bench_sdo.py --latencies 0.0005,0.002
+    python3 benchmarks/bench_sdo.py --backend pysoem --adapter eth0
+
+The mailbox latency only applies to the simulator.
+"""
+import argparse
+import os
+import statistics
+import struct
+import sys
+import time
+
+# the shared EtherCAT core lives in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethercat import backend, scan
+from ethercat.cyclic import CyclicWorker
+from ethercat.pdo import ProcessImage
+from ethercat.sdo import (TMCM1617_PARAMS, apply_parameters, configure_slaves, mode_param,
+                          target_speed_param, target_torque_param)
+from ethercat.sdo_cache import SdoCache
+from ethercat.slave_state import request_state
+
+from common import load_results, write_report
+
+
+class CountingSlave:
+    """Forwards to a slave and counts the mailbox transfers."""
+
+    def __init__(self, slave):
+        self.slave = slave
+        self.transfers = 0
+
+    def __getattr__(self, name):
+        return getattr(self.slave, name)
+
+    def sdo_write(self, index, subindex, data, ca=False):
+        self.transfers += 1
+        return self.slave.sdo_write(index, subindex, data, ca)
+
+    def sdo_read(self, index, subindex, size=0, ca=False):
+        self.transfers += 1
+        return self.slave.sdo_read(index, subindex, size, ca)
+
+
+def timed(func, repeat):
+    """Run func() repeat times, returns (median, min) in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), min(durations)
+
+
+def set_state(master, state):
+    master.state = state
+    master.write_state()
+    return master.state_check(state, 5_000_000)
+
+
+def apply_set_params():
+    return [mode_param('Profile velocity mode'), target_speed_param(500), target_torque_param(100)]
+
+
+def move_servo_2(slave, target_velocity=500):
+    """The SDO sequence of move_servo_2 in ServoInterface_21_08, only this slave leaves OP."""
+    request_state(slave, backend.PREOP_STATE)
+    slave.sdo_write(0x6060, 0, struct.pack("B", 3))
+    slave.sdo_write(0x6040, 0, struct.pack("<H", 0x06))
+    slave.sdo_write(0x6040, 0, struct.pack("<H", 0x07))
+    slave.sdo_write(0x60FF, 0, struct.pack("<i", target_velocity))
+    request_state(slave, backend.OP_STATE)
+
+
+def move_servo_2_whole_bus(master, slave, target_velocity=500):
+    """The same sequence as it was before, taking the whole bus through PRE-OP."""
+    set_state(master, backend.PREOP_STATE)
+    slave.sdo_write(0x6060, 0, struct.pack("B", 3))
+    slave.sdo_write(0x6040, 0, struct.pack("<H", 0x06))
+    slave.sdo_write(0x6040, 0, struct.pack("<H", 0x07))
+    slave.sdo_write(0x60FF, 0, struct.pack("<i", target_velocity))
+    # slaves refuse PRE-OP -> OP, SAFE-OP comes first
+    set_state(master, backend.SAFEOP_STATE)
+    set_state(master, backend.OP_STATE)
+
+
+def run_case(adapter, slaves, latency, repeat, cycle_time):
+    if backend.name() == 'sim':
+        backend.get().configure(slaves=slaves, mailbox_latency=latency)
+    result = {'slaves': slaves, 'mailbox_latency': latency}
+
+    start = time.perf_counter()
+    master = scan.open_bus(adapter)
+    result['scan'] = time.perf_counter() - start
+    worker = None
+    try:
+        result['slaves'] = len(master.slaves)
+        counted = [CountingSlave(slave) for slave in master.slaves]
+
+        def sequential():
+            for slave in counted:
+                apply_parameters(slave, TMCM1617_PARAMS)
+
+        strategies = [
+            ('sequential', sequential),
+            ('concurrent', lambda: configure_slaves(counted, TMCM1617_PARAMS)),
+            ('concurrent_ca', lambda: configure_slaves(counted, TMCM1617_PARAMS, complete_access=(0x2041,))),
+        ]
+        configure = {}
+        for name, func in strategies:
+            for slave in counted:
+                slave.transfers = 0
+            median, best = timed(func, repeat)
+            configure[name] = {'median': median, 'min': best,
+                               'transfers': sum(slave.transfers for slave in counted) // repeat}
+        # a warm cache skips every value already on the drive
+        caches = [SdoCache(slave) for slave in counted]
+        configure_slaves(caches, TMCM1617_PARAMS)
+        for slave in counted:
+            slave.transfers = 0
+        median, best = timed(lambda: configure_slaves(caches, TMCM1617_PARAMS), repeat)
+        configure['cached'] = {'median': median, 'min': best,
+                               'transfers': sum(slave.transfers for slave in counted) // repeat}
+        result['configure'] = configure
+
+        # ApplySet of every axis while the bus is stopped
+        params = apply_set_params()
+        apply_set = {}
+        for name, targets in (('direct', counted), ('cached', [SdoCache(slave) for slave in counted])):
+            if name == 'cached':
+                for target in targets:
+                    apply_parameters(target, params)
+            for slave in counted:
+                slave.transfers = 0
+            median, best = timed(lambda: [apply_parameters(target, params) for target in targets], repeat)
+            apply_set[name] = {'median': median, 'min': best,
+                               'transfers': sum(slave.transfers for slave in counted) // repeat}
+        result['apply_set'] = apply_set
+
+        # bring-up with the cyclic exchange running for the OP transition
+        start = time.perf_counter()
+        master.config_map()
+        if master.state_check(backend.SAFEOP_STATE, 50_000) != backend.SAFEOP_STATE:
+            raise RuntimeError(f"{adapter}: failed to got to safeop state")
+        result['safeop'] = time.perf_counter() - start
+        worker = CyclicWorker(master, cycle_time, image=ProcessImage(master.slaves, strict=False))
+        worker.start()
+        start = time.perf_counter()
+        if set_state(master, backend.OP_STATE) != backend.OP_STATE:
+            raise RuntimeError(f"{adapter}: failed to got to op state")
+        result['op'] = time.perf_counter() - start
+        result['bring_up'] = result['scan'] + configure['concurrent']['min'] + result['safeop'] + result['op']
+
+        # move_servo_2 on the first axis, PRE-OP and back to OP included; the
+        # lowest working counter shows whether the other axes kept running
+        lowest_wkc = [master.expected_wkc]
+
+        def watch_wkc(wkc):
+            if wkc < lowest_wkc[0]:
+                lowest_wkc[0] = wkc
+        worker.add_callback(watch_wkc)
+        for name, func in (('move', lambda: move_servo_2(master.slaves[0])),
+                           ('move_whole_bus', lambda: move_servo_2_whole_bus(master, master.slaves[0]))):
+            lowest_wkc[0] = master.expected_wkc
+            median, best = timed(func, repeat)
+            # let a few cycles run in OP again
+            time.sleep(10 * cycle_time)
+            result[name] = {'median': median, 'min': best, 'lowest_wkc': lowest_wkc[0],
+                            'expected_wkc': master.expected_wkc}
+    finally:
+        if worker is not None:
+            worker.stop()
+        master.close()
+    return result
+
+
+def compare(old_path, results):
+    old = {(r['slaves'], r['mailbox_latency']): r for r in load_results(old_path)}
+    print(f"\nCompared with {old_path}:")
+    for result in results:
+        previous = old.get((result['slaves'], result['mailbox_latency']))
+        if previous is None:
+            continue
+        print(f"{result['slaves']:>3} slaves, {result['mailbox_latency'] * 1000:g} ms mailbox: "
+              f"bring-up {previous['bring_up']:.3f} -> {result['bring_up']:.3f} s, "
+              f"configure {previous['configure']['concurrent']['median']:.3f} -> "
+              f"{result['configure']['concurrent']['median']:.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', default=os.environ.get(backend.BACKEND_ENV, 'sim'),
+                        choices=sorted(backend.BACKENDS))
+    parser.add_argument('--adapter', help="adapter to open, the first simulated one by default")
+    parser.add_argument('--slaves', default='1,8,32,64', help="comma separated simulated slave counts")
+    parser.add_argument('--latencies', default='0.0005,0.002',
+                        help="comma separated simulated mailbox round trip times in seconds")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cycle-time', type=float, default=0.001)
+    parser.add_argument('--output', default='bench_sdo.json')
+    parser.add_argument('--compare', help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    backend.use(args.backend)
+    adapter = args.adapter
+    if adapter is None:
+        if args.backend != 'sim':
+            parser.error("--adapter is needed on real hardware")
+        adapter = backend.get().find_adapters()[0].name
+    if args.backend == 'sim':
+        cases = [(int(n), float(latency)) for latency in args.latencies.split(',') for n in args.slaves.split(',')]
+    else:
+        cases = [(None, None)]
+
+    results = []
+    for slaves, latency in cases:
+        result = run_case(adapter, slaves, latency, args.repeat, args.cycle_time)
+        results.append(result)
+        configure = result['configure']
+        print(f"{result['slaves']:>3} slaves, {(latency or 0) * 1000:g} ms mailbox: "
+              f"bring-up {result['bring_up']:.3f} s, configure sequential/concurrent/ca/cached "
+              f"{configure['sequential']['median']:.3f}/{configure['concurrent']['median']:.3f}/"
+              f"{configure['concurrent_ca']['median']:.3f}/{configure['cached']['median']:.3f} s, "
+              f"ApplySet {result['apply_set']['direct']['median']:.3f}/{result['apply_set']['cached']['median']:.3f} s, "
+              f"move {result['move']['median']:.3f} s, lowest WKC {result['move']['lowest_wkc']} "
+              f"(whole bus {result['move_whole_bus']['median']:.3f} s, lowest WKC {result['move_whole_bus']['lowest_wkc']}) "
+              f"of {result['move']['expected_wkc']}")
+
+    write_report(args.output, args.backend, adapter, results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# This Python file uses the following encoding: utf-8
+"""Helpers shared by the benchmark scripts."""
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def write_report(path, backend_name, adapter, results, **meta):
+    """Save results with the machine and revision they were measured on."""
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'backend': backend_name,
+            'adapter': adapter,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            **meta,
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
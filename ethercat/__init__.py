@@ -0,0 +1,2 @@
+# This Python file uses the following encoding: utf-8
+"""Shared EtherCAT control core used by the widget applications."""
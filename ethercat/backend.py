@@ -0,0 +1,51 @@
+# This Python file uses the following encoding: utf-8
+"""
+The EtherCAT stack in use: pysoem on real hardware or the built-in simulator.
+
+Code that opens masters or looks for adapters calls get() instead of
+importing pysoem, so the same application runs against simulated drives
+with ETHERCAT_BACKEND=sim.
+"""
+import importlib
+import os
+
+BACKEND_ENV = 'ETHERCAT_BACKEND'
+BACKENDS = {
+    'pysoem': 'pysoem',
+    'sim': 'ethercat.simulator',
+}
+
+# AL states, the same values in every backend
+NONE_STATE = 0x00
+INIT_STATE = 0x01
+PREOP_STATE = 0x02
+BOOT_STATE = 0x03
+SAFEOP_STATE = 0x04
+OP_STATE = 0x08
+STATE_ACK = 0x10
+STATE_ERROR = 0x10
+
+_name = None
+_module = None
+
+
+def use(name):
+    """Select the backend by name ('pysoem' or 'sim') and return its module."""
+    global _name, _module
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown EtherCAT backend {name!r}, use one of {', '.join(BACKENDS)}")
+    _module = importlib.import_module(BACKENDS[name])
+    _name = name
+    return _module
+
+
+def get():
+    """The backend module, chosen from ETHERCAT_BACKEND on first use (pysoem by default)."""
+    if _module is None:
+        use(os.environ.get(BACKEND_ENV, 'pysoem'))
+    return _module
+
+
+def name():
+    get()
+    return _name
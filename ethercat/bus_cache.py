@@ -0,0 +1,239 @@
+# This Python file uses the following encoding: utf-8
+"""Topology, PDO layouts and applied parameters of every bus, kept on disk between starts."""
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ethercat import pdo_mapping
+from ethercat.sdo import configure_slaves
+
+# JSON file with the state of every adapter, ETHERCAT_CACHE overrides it
+DEFAULT_PATH = os.environ.get('ETHERCAT_CACHE',
+                              os.path.join(os.path.expanduser('~'), '.cache', 'ethercat', 'bus.json'))
+
+# Bumped whenever the file layout changes, older files are ignored
+VERSION = 1
+
+
+def read_serial(slave):
+    """Serial number of slave (0x1018:4), None if it has no readable identity object."""
+    try:
+        return struct.unpack_from('<I', slave.sdo_read(0x1018, 4).ljust(4, b'\0'))[0]
+    except Exception:
+        return None
+
+
+def slave_identity(slave, position):
+    """[vendor ID, product code, revision, serial, position], as stored in the cache."""
+    return [slave.man, slave.id, slave.rev, read_serial(slave), position]
+
+
+def _per_slave(func, *iterables):
+    # one thread per slave like configure_slaves(), the mailbox round trips overlap
+    iterables = [list(items) for items in iterables]
+    if not iterables[0]:
+        return []
+    with ThreadPoolExecutor(max_workers=len(iterables[0])) as executor:
+        return list(executor.map(func, *iterables))
+
+
+def _encode_params(params):
+    return [[param.index, param.subindex, param.type, param.value] for param in params]
+
+
+class BusCache:
+    """
+    What was found on and written to every bus, so a restart skips it.
+
+    The cache is keyed by adapter and, per slave, by its identity (vendor
+    ID, product code, revision, serial number and position). After
+    config_init() check() compares the slaves on the bus with the cached
+    ones; for those that did not change, discover_layouts() takes the PDO
+    layouts from the cache instead of reading the mapping by SDO and
+    configure() only writes a parameter set that differs from the one
+    applied last time.
+
+    Parameters live in the RAM of most drives, so configure() reads every
+    parameter of the set back from an unchanged slave before skipping it;
+    a drive that was power cycled or changed by hand in the meantime is
+    configured again. The reads of different slaves overlap.
+
+    config_init() and config_map() still run on every start, SOEM builds
+    its own tables with them; they take a few milliseconds without the
+    mailbox traffic.
+
+    :param path: JSON file, created on the first save().
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._adapters = {}
+        self._changed = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the file, a missing or unreadable one is an empty cache."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            adapters = data['adapters'] if data.get('version') == VERSION else {}
+        except FileNotFoundError:
+            adapters = {}
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            print(f"Bus cache {self.path} not readable, starting empty: {e}")
+            adapters = {}
+        with self._lock:
+            self._adapters = adapters
+            self._dirty.clear()
+
+    def save(self):
+        """
+        Write the adapters changed since the last save.
+
+        The file is read again first, so several processes with one
+        adapter each do not overwrite each other's entries.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {adapter: self._adapters[adapter] for adapter in self._dirty}
+            self._dirty.clear()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != VERSION:
+                data = None
+        except (OSError, ValueError):
+            data = None
+        if not isinstance(data, dict) or not isinstance(data.get('adapters'), dict):
+            data = {'version': VERSION, 'adapters': {}}
+        data['adapters'].update(entries)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # written next to the file and renamed, a crash never leaves half a file
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(temporary, self.path)
+
+    def clear(self, adapter=None):
+        """Forget one adapter or everything, takes effect with the next save()."""
+        with self._lock:
+            adapters = list(self._adapters) if adapter is None else [adapter]
+            for name in adapters:
+                self._adapters[name] = {'slaves': []}
+                self._dirty.add(name)
+            self._changed.clear()
+
+    def check(self, adapter, slaves):
+        """
+        Compare slaves with the cached topology of adapter and store the new one.
+
+        Returns the positions of the slaves that are new or different,
+        every position if nothing is cached. discover_layouts() and
+        configure() call it for slaves they have not seen yet.
+        """
+        slaves = list(slaves)
+        identities = _per_slave(slave_identity, slaves, range(len(slaves)))
+        with self._lock:
+            cached = self._adapters.get(adapter, {}).get('slaves', [])
+            entries = []
+            changed = []
+            for position, (slave, identity) in enumerate(zip(slaves, identities)):
+                # a serial number that cannot be read never matches
+                if (position < len(cached) and cached[position].get('identity') == identity
+                        and identity[3] is not None):
+                    entries.append(cached[position])
+                else:
+                    entries.append({'identity': identity, 'name': slave.name})
+                    changed.append(position)
+            if len(cached) != len(entries) or changed:
+                self._dirty.add(adapter)
+            self._adapters[adapter] = {'slaves': entries}
+            self._changed[adapter] = (slaves, changed)
+        if changed:
+            print(f"{adapter}: {len(changed)} of {len(slaves)} slaves not in the bus cache")
+        return changed
+
+    def _checked(self, adapter, slaves):
+        with self._lock:
+            checked, changed = self._changed.get(adapter, ((), None))
+        # a new config_init() gives new slave objects, that bus was not checked yet
+        if changed is None or len(checked) != len(slaves) or any(a is not b for a, b in zip(checked, slaves)):
+            changed = self.check(adapter, slaves)
+        return set(changed)
+
+    def discover_layouts(self, adapter, slaves):
+        """
+        Same as pdo_mapping.discover_layouts(), unchanged slaves take their layout from the cache.
+
+        Call after config_map() like the original.
+        """
+        slaves = list(slaves)
+        changed = self._checked(adapter, slaves)
+        with self._lock:
+            entries = self._adapters[adapter]['slaves']
+            for position, slave in enumerate(slaves):
+                layout = entries[position].get('layout')
+                if position not in changed and layout is not None:
+                    pdo_mapping.layout_from_entries(pdo_mapping.slave_key(slave), *layout)
+        layouts = pdo_mapping.discover_layouts(slaves)
+        with self._lock:
+            for entry, layout in zip(entries, layouts):
+                stored = None if layout is None else json.loads(json.dumps(layout.entries()))
+                if entry.get('layout') != stored:
+                    entry['layout'] = stored
+                    self._dirty.add(adapter)
+        self.save()
+        return layouts
+
+    def _configured(self, slave, entry, params):
+        if entry.get('params') != _encode_params(params):
+            return False
+        # every parameter, a failed write or a change by hand is applied again
+        try:
+            return all(slave.sdo_read(param.index, param.subindex).startswith(param.encode()) for param in params)
+        except Exception:
+            return False
+
+    def configure(self, adapter, slaves, params, complete_access=(), max_workers=None, positions=None):
+        """
+        Same as sdo.configure_slaves(), but only for the slaves that need the parameter set.
+
+        Those are the changed slaves, the ones configured with a different
+        set before and the ones where a parameter reads back different.
+        slaves are all slaves of the bus, `positions` limits the set to
+        some of them. Returns a list of (slave, exception) for the slaves
+        that failed.
+        """
+        slaves = list(slaves)
+        params = list(params)
+        changed = self._checked(adapter, slaves)
+        with self._lock:
+            entries = self._adapters[adapter]['slaves']
+        if positions is None:
+            positions = range(len(slaves))
+        positions = list(positions)
+        configured = _per_slave(lambda position: self._configured(slaves[position], entries[position], params),
+                                positions)
+        pending = [position for position, done in zip(positions, configured) if position in changed or not done]
+        failed = configure_slaves([slaves[position] for position in pending], params, complete_access, max_workers)
+        failed_slaves = [slave for slave, _ in failed]
+        with self._lock:
+            for position in pending:
+                entry = entries[position]
+                if any(slaves[position] is slave for slave in failed_slaves):
+                    entry.pop('params', None)
+                else:
+                    entry['params'] = _encode_params(params)
+            if pending:
+                self._dirty.add(adapter)
+        if len(pending) < len(positions):
+            print(f"{adapter}: {len(positions) - len(pending)} of {len(positions)} slaves already configured")
+        self.save()
+        return failed
@@ -0,0 +1,171 @@
+# This Python file uses the following encoding: utf-8
+"""Working counter, lost frame and ESC error counter statistics of a segment."""
+import array
+import ctypes
+import threading
+
+# return values of receive_processdata() besides the working counter
+NO_FRAME = -1
+TIMEOUT = -5
+
+# events of one cycle
+OK = 0
+LOST_FRAME = 1
+TIMED_OUT = 2
+WKC_MISMATCH = 3
+
+# ESC register block with the error counters, read with one FPRD per slave
+ERROR_COUNTERS_ADDRESS = 0x0300
+
+# Seconds between two reads of the ESC error counters of every slave
+ERROR_COUNTERS_PERIOD = 1.0
+
+
+class EscErrorCounters(ctypes.Structure):
+    """Error counter registers 0x0300-0x0313 of an EtherCAT slave controller."""
+    _pack_ = 1
+    _fields_ = [
+        ('port0_invalid_frames', ctypes.c_uint8),
+        ('port0_rx_errors', ctypes.c_uint8),
+        ('port1_invalid_frames', ctypes.c_uint8),
+        ('port1_rx_errors', ctypes.c_uint8),
+        ('port2_invalid_frames', ctypes.c_uint8),
+        ('port2_rx_errors', ctypes.c_uint8),
+        ('port3_invalid_frames', ctypes.c_uint8),
+        ('port3_rx_errors', ctypes.c_uint8),
+        ('port0_forwarded_errors', ctypes.c_uint8),
+        ('port1_forwarded_errors', ctypes.c_uint8),
+        ('port2_forwarded_errors', ctypes.c_uint8),
+        ('port3_forwarded_errors', ctypes.c_uint8),
+        ('processing_unit_errors', ctypes.c_uint8),
+        ('pdi_errors', ctypes.c_uint8),
+        ('reserved', ctypes.c_uint8 * 2),
+        ('port0_lost_links', ctypes.c_uint8),
+        ('port1_lost_links', ctypes.c_uint8),
+        ('port2_lost_links', ctypes.c_uint8),
+        ('port3_lost_links', ctypes.c_uint8),
+    ]
+
+    def total(self):
+        return sum(getattr(self, name) for name, _ in self._fields_ if name != 'reserved')
+
+    def nonzero(self):
+        """{register name: count} of every counter that is not zero."""
+        return {name: getattr(self, name) for name, _ in self._fields_
+                if name != 'reserved' and getattr(self, name)}
+
+
+def read_error_counters(slave, timeout_us=2_000):
+    """ESC error counters of one slave, None if the registers cannot be read."""
+    try:
+        data = slave._fprd(ERROR_COUNTERS_ADDRESS, ctypes.sizeof(EscErrorCounters), timeout_us)
+    except Exception:
+        return None
+    if len(data) < ctypes.sizeof(EscErrorCounters):
+        return None
+    return EscErrorCounters.from_buffer_copy(data)
+
+
+class BusMonitor:
+    """
+    Checks the working counter of every cycle and counts what went wrong.
+
+    update() is a CyclicWorker callback and only does a few integer
+    operations: a negative return of receive_processdata() is a lost frame
+    (NO_FRAME) or a timeout, anything else than master.expected_wkc is a
+    mismatch, e.g. a slave that left OP. Besides the totals, the events of
+    the last `window` cycles are kept in a ring, so the rates always cover
+    the same stretch of time.
+
+    :param master: pysoem master whose worker calls update().
+    :param window: cycles the rolling rates are taken over.
+    """
+
+    def __init__(self, master, window=1000):
+        self.master = master
+        self.window = window
+        self.cycles = 0
+        self.lost_frames = 0
+        self.timeouts = 0
+        self.wkc_mismatches = 0
+        self.last_wkc = None
+        self.lowest_wkc = None
+        self._events = array.array('b', bytes(window))
+        self._recent = [0, 0, 0, 0]
+
+    def update(self, wkc):
+        if wkc == NO_FRAME:
+            event = LOST_FRAME
+            self.lost_frames += 1
+        elif wkc < 0:
+            event = TIMED_OUT
+            self.timeouts += 1
+        elif wkc != self.master.expected_wkc:
+            event = WKC_MISMATCH
+            self.wkc_mismatches += 1
+        else:
+            event = OK
+        if wkc >= 0 and (self.lowest_wkc is None or wkc < self.lowest_wkc):
+            self.lowest_wkc = wkc
+        self.last_wkc = wkc
+        index = self.cycles % self.window
+        recent = self._recent
+        recent[self._events[index]] -= 1
+        recent[event] += 1
+        self._events[index] = event
+        self.cycles += 1
+
+    def recent(self):
+        """(cycles, lost frames, timeouts, WKC mismatches) of the rolling window."""
+        recent = self._recent
+        # the empty ring counts as OK cycles until it is full
+        return min(self.cycles, self.window), recent[LOST_FRAME], recent[TIMED_OUT], recent[WKC_MISMATCH]
+
+    def stats(self):
+        """Totals and the rolling rates as a share of the cycles in the window."""
+        cycles, lost, timeouts, mismatches = self.recent()
+        cycles = max(cycles, 1)
+        return {
+            'expected_wkc': self.master.expected_wkc,
+            'last_wkc': self.last_wkc,
+            'lowest_wkc': self.lowest_wkc,
+            'lost_frames': self.lost_frames,
+            'timeouts': self.timeouts,
+            'wkc_mismatches': self.wkc_mismatches,
+            'lost_frame_rate': lost / cycles,
+            'timeout_rate': timeouts / cycles,
+            'wkc_mismatch_rate': mismatches / cycles,
+        }
+
+    def read_error_counters(self):
+        """EscErrorCounters (or None) of every slave, one register block read each."""
+        return [read_error_counters(slave) for slave in self.master.slaves]
+
+
+class ErrorCounterReader(threading.Thread):
+    """
+    Reads the ESC error counters of every slave every period in the background.
+
+    The FPRDs go out from this thread instead of the GUI thread, which only
+    shows the last snapshot in `counters`: one EscErrorCounters (or None
+    where unreadable) per slave.
+    """
+
+    def __init__(self, master, period=ERROR_COUNTERS_PERIOD):
+        super().__init__(name="ESC error counters", daemon=True)
+        self.master = master
+        self.period = period
+        self.counters = [None] * len(master.slaves)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            # one assignment, readers see the old or the new snapshot
+            self.counters = [read_error_counters(slave) for slave in self.master.slaves]
+            if self._stop_event.wait(self.period):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(1.0)
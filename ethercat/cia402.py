@@ -0,0 +1,250 @@
+# This Python file uses the following encoding: utf-8
+"""CiA-402 drive state machine stepped by the statusword of every cycle."""
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+# drive states
+NOT_READY_TO_SWITCH_ON = 'Not ready to switch on'
+SWITCH_ON_DISABLED = 'Switch on disabled'
+READY_TO_SWITCH_ON = 'Ready to switch on'
+SWITCHED_ON = 'Switched on'
+OPERATION_ENABLED = 'Operation enabled'
+QUICK_STOP_ACTIVE = 'Quick stop active'
+FAULT_REACTION_ACTIVE = 'Fault reaction active'
+FAULT = 'Fault'
+
+# controlword commands
+DISABLE_VOLTAGE = 0x0000
+QUICK_STOP = 0x0002
+SHUTDOWN = 0x0006
+SWITCH_ON = 0x0007
+DISABLE_OPERATION = 0x0007
+ENABLE_OPERATION = 0x000F
+FAULT_RESET = 0x0080
+
+# seconds the fault reset bit stays set before another attempt
+FAULT_RESET_HOLD = 0.05
+
+# modes whose target position must follow the actual one until enabled
+_POSITION_MODES = (1, 8)
+
+_FIELDS = {}
+
+
+def mapped_fields(pdo):
+    """Field names of a PDO struct, looked up once per struct type."""
+    fields = _FIELDS.get(type(pdo))
+    if fields is None:
+        fields = _FIELDS[type(pdo)] = frozenset(name for name, _ in type(pdo)._fields_)
+    return fields
+
+
+def is_drive(slave_image):
+    """True if the layout of slave_image maps statusword and controlword, unlike e.g. an IO terminal."""
+    return (slave_image is not None and 'statusword' in mapped_fields(slave_image.inputs)
+            and 'controlword' in mapped_fields(slave_image.outputs))
+
+
+def drive_state(statusword):
+    """Decode the drive state from statusword bits 0-3, 5 and 6."""
+    if statusword & 0x4F == 0x00:
+        return NOT_READY_TO_SWITCH_ON
+    if statusword & 0x4F == 0x40:
+        return SWITCH_ON_DISABLED
+    if statusword & 0x6F == 0x21:
+        return READY_TO_SWITCH_ON
+    if statusword & 0x6F == 0x23:
+        return SWITCHED_ON
+    if statusword & 0x6F == 0x27:
+        return OPERATION_ENABLED
+    if statusword & 0x6F == 0x07:
+        return QUICK_STOP_ACTIVE
+    if statusword & 0x4F == 0x0F:
+        return FAULT_REACTION_ACTIVE
+    if statusword & 0x4F == 0x08:
+        return FAULT
+    return NOT_READY_TO_SWITCH_ON
+
+
+class DriveError(Exception):
+    pass
+
+
+# controlword that moves a drive one step towards the target, per (target, current state);
+# None means the target is reached, a missing entry means wait
+_ENABLE = {
+    SWITCH_ON_DISABLED: SHUTDOWN,
+    READY_TO_SWITCH_ON: SWITCH_ON,
+    SWITCHED_ON: ENABLE_OPERATION,
+    QUICK_STOP_ACTIVE: ENABLE_OPERATION,
+    OPERATION_ENABLED: None,
+}
+_DISABLE = {
+    SWITCH_ON_DISABLED: SHUTDOWN,
+    READY_TO_SWITCH_ON: None,
+    SWITCHED_ON: SHUTDOWN,
+    OPERATION_ENABLED: SHUTDOWN,
+    QUICK_STOP_ACTIVE: DISABLE_VOLTAGE,
+    FAULT: None,
+}
+_QUICK_STOP = {
+    SWITCH_ON_DISABLED: None,
+    READY_TO_SWITCH_ON: QUICK_STOP,
+    SWITCHED_ON: QUICK_STOP,
+    OPERATION_ENABLED: QUICK_STOP,
+    QUICK_STOP_ACTIVE: None,
+    FAULT: None,
+}
+_FAULT_RESET = {
+    SWITCH_ON_DISABLED: None,
+    READY_TO_SWITCH_ON: None,
+    SWITCHED_ON: None,
+    OPERATION_ENABLED: None,
+    QUICK_STOP_ACTIVE: None,
+}
+
+
+class Cia402Drive:
+    """
+    Drives the controlword of one axis from its statusword, one step per cycle.
+
+    update() is meant to be registered as a CyclicWorker callback; it reads
+    `inputs.statusword`, and while a request is pending writes the next
+    controlword into `outputs.controlword`. enable(), disable(),
+    quick_stop() and fault_reset() return a concurrent.futures.Future that
+    is resolved with the reached state on the cyclic thread (or fails with
+    DriveError after `timeout` seconds), so callers must not block the
+    thread that runs update(). A new request replaces a pending one, whose
+    future is cancelled.
+
+    :param slave_image: object with the `inputs`/`outputs` structs of the
+        axis, e.g. a SlaveImage, mapping statusword and controlword.
+    :param fault_resets: fault resets tried by enable() before giving up.
+    """
+
+    def __init__(self, slave_image, timeout=2.0, fault_resets=1):
+        if not is_drive(slave_image):
+            raise ValueError("No statusword and controlword in the process data, not a CiA-402 drive")
+        self.slave_image = slave_image
+        self.timeout = timeout
+        self.fault_resets = fault_resets
+        self.state = drive_state(slave_image.inputs.statusword)
+        self._request = None
+        self._resets = 0
+        self._reset_at = 0.0
+
+    @property
+    def statusword(self):
+        return self.slave_image.inputs.statusword
+
+    @property
+    def enabled(self):
+        return self.state == OPERATION_ENABLED
+
+    def _submit(self, steps):
+        future = Future()
+        previous = self._request
+        # one assignment, the cyclic thread sees either the old or the new request
+        self._request = (steps, future, time.monotonic() + self.timeout)
+        self._resets = 0
+        if previous is not None:
+            previous[1].cancel()
+        return future
+
+    def enable(self):
+        """Shutdown, Switch on, Enable operation (and fault reset) as the drive allows."""
+        return self._submit(_ENABLE)
+
+    def disable(self):
+        """Shutdown to Ready to switch on, the power stage is off."""
+        return self._submit(_DISABLE)
+
+    def quick_stop(self):
+        """Stop on the quick stop ramp, resolved once Quick stop active or Switch on disabled."""
+        return self._submit(_QUICK_STOP)
+
+    def fault_reset(self):
+        return self._submit(_FAULT_RESET)
+
+    def _finish(self, request, result=None, error=None):
+        if self._request is request:
+            self._request = None
+        future = request[1]
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            # cancelled by a newer request meanwhile
+            pass
+
+    def update(self, wkc=None):
+        """Step the state machine, called once per cycle after the inputs were read."""
+        statusword = self.slave_image.inputs.statusword
+        state = self.state = drive_state(statusword)
+        request = self._request
+        if request is None:
+            return
+        steps, future, deadline = request
+        if future.cancelled():
+            if self._request is request:
+                self._request = None
+            return
+        now = time.monotonic()
+        if now > deadline:
+            self._finish(request, error=DriveError(f"Drive stuck in '{state}', statusword 0x{statusword:04X}"))
+            return
+        outputs = self.slave_image.outputs
+
+        if state == FAULT and FAULT not in steps:
+            # the reset is the rising edge of bit 7, held a while for slow drives
+            if not outputs.controlword & FAULT_RESET:
+                resets = max(self.fault_resets, 1) if steps is _FAULT_RESET else self.fault_resets
+                if self._resets >= resets:
+                    self._finish(request, error=DriveError(f"Drive in fault, statusword 0x{statusword:04X}"))
+                    return
+                outputs.controlword = FAULT_RESET
+                self._resets += 1
+                self._reset_at = now
+            elif now - self._reset_at > FAULT_RESET_HOLD:
+                outputs.controlword = DISABLE_VOLTAGE
+            return
+
+        if state in steps:
+            command = steps[state]
+            if command is None:
+                self._finish(request, state)
+                return
+            if (command == ENABLE_OPERATION and getattr(outputs, 'modes_of_operation', None) in _POSITION_MODES
+                    and 'target_position' in mapped_fields(outputs)
+                    and 'position_actual_value' in mapped_fields(self.slave_image.inputs)):
+                # no jump when the position loop closes
+                outputs.target_position = self.slave_image.inputs.position_actual_value
+            outputs.controlword = command
+
+
+class DrivePoller(threading.Thread):
+    """
+    Calls update() of drives every period.
+
+    For process images that are exchanged elsewhere, e.g. in a
+    CyclicProcess, where no CyclicWorker of this process can do it.
+    """
+
+    def __init__(self, drives, period=0.001):
+        super().__init__(name="CiA-402 poller", daemon=True)
+        self.drives = drives
+        self.period = period
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.period):
+            for drive in self.drives:
+                drive.update()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(1.0)
@@ -0,0 +1,504 @@
+# This Python file uses the following encoding: utf-8
+"""
+Local control API: other processes command the axes through a Unix domain socket.
+
+Every message is a fixed header followed by `count` fixed size items:
+
+    header      <IBxHI   body length, message type, item count, sequence number
+    SETPOINTS   <HHBxi   axis, object index, subindex, value
+    DRIVE       <HB      axis, DRIVE_* action
+    READ        <H       axis (no items: every axis)
+    SUBSCRIBE   <I then <H   period in microseconds (0 stops), then the axes
+    STATE       <Q then <HBbHHiii   timestamp (ns, CLOCK_MONOTONIC of the
+                server), then per axis: axis, STATE_* flags, mode display,
+                statusword, error code, actual position, velocity, torque
+
+Requests are answered with ACK (count = items done), STATE or ERROR (the
+body is the message) carrying the sequence number of the request. STATE
+frames of a subscription have sequence number 0. Axes are numbered like
+MasterManager.axes(), starting at 0; AXES lists their names.
+"""
+import collections
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+from ethercat.sdo import INT8, INT16, INT32, UINT16, UINT32, SdoParam
+
+# Socket of the server, ETHERCAT_CONTROL_SOCKET overrides it
+DEFAULT_SOCKET = os.environ.get('ETHERCAT_CONTROL_SOCKET', os.path.join(tempfile.gettempdir(), 'ethercat-control.sock'))
+
+# requests
+MSG_AXES = 1
+MSG_SETPOINTS = 2
+MSG_DRIVE = 3
+MSG_READ = 4
+MSG_SUBSCRIBE = 5
+# replies
+MSG_ACK = 0x80
+MSG_STATE = 0x81
+MSG_ERROR = 0x82
+
+# actions of MSG_DRIVE
+DRIVE_ENABLE = 1
+DRIVE_DISABLE = 2
+DRIVE_QUICK_STOP = 3
+DRIVE_FAULT_RESET = 4
+DRIVE_RESET_TRIP = 5  # acknowledges a safe stop of the segment of the axis
+
+# flags of an axis in MSG_STATE
+STATE_CYCLIC = 0x01
+STATE_ENABLED = 0x02
+STATE_TRIPPED = 0x04
+
+_HEADER = struct.Struct('<IBxHI')
+_SETPOINT = struct.Struct('<HHBxi')
+_DRIVE = struct.Struct('<HB')
+_AXIS = struct.Struct('<H')
+_PERIOD = struct.Struct('<I')
+_TIMESTAMP = struct.Struct('<Q')
+_STATE = struct.Struct('<HBbHHiii')
+
+# Messages above this size close the connection, nothing sent by a client is that big
+MAX_BODY = 1 << 20
+
+# Objects MSG_SETPOINTS may write and their CoE type, for the SDO fallback
+SETPOINT_TYPES = {
+    (0x6040, 0): UINT16,
+    (0x6060, 0): INT8,
+    (0x607A, 0): INT32,
+    (0x60FF, 0): INT32,
+    (0x6071, 0): INT16,
+    (0x60FE, 1): UINT32,
+}
+
+AxisState = collections.namedtuple('AxisState', ['axis', 'flags', 'mode', 'statusword', 'error_code',
+                                                 'position', 'velocity', 'torque'])
+
+
+class ControlError(Exception):
+    """An ERROR reply of the server."""
+
+
+def _recv_exact(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError("Connection closed")
+        received += n
+    return data
+
+
+def _recv_message(sock):
+    """(type, count, sequence, body) of the next message."""
+    length, kind, count, sequence = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if length > MAX_BODY:
+        raise ConnectionError(f"Message of {length} bytes is too big")
+    return kind, count, sequence, _recv_exact(sock, length) if length else b''
+
+
+def _message(kind, count, sequence, body=b''):
+    return _HEADER.pack(len(body), kind, count, sequence) + body
+
+
+def _items(body, count, item, offset=0):
+    """body[offset:] as count items of the struct item, a size that does not match rejects the message."""
+    if len(body) != offset + count * item.size:
+        raise ValueError(f"{count} items of {item.size} bytes do not match a body of {len(body)} bytes")
+    return body[offset:]
+
+
+def _remove_stale_socket(path):
+    """Remove a socket left behind by a server that is gone, refuse to touch anything else."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is no socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Another server is listening on {path}")
+
+
+def _input(inputs, field):
+    # fields a layout leaves out read as 0
+    return getattr(inputs, field, 0)
+
+
+class _CycleWriter:
+    """
+    Writes batches of output fields on the cyclic thread.
+
+    submit() is called from any thread, update() is a CyclicWorker callback
+    and writes every field of a batch in the same cycle, so the setpoints
+    of several axes sent in one message go out in the same frame.
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+        # append() and popleft() of a deque are atomic
+        self._batches = collections.deque()
+        worker.add_callback(self.update)
+
+    def close(self):
+        self.worker.remove_callback(self.update)
+        self._batches.clear()
+
+    def submit(self, writes):
+        self._batches.append(writes)
+
+    def update(self, wkc):
+        batches = self._batches
+        while batches:
+            for outputs, field, value in batches.popleft():
+                setattr(outputs, field, value)
+
+
+class ControlServer:
+    """
+    Serves the axes of a MasterManager on a Unix domain socket.
+
+    One thread accepts connections and every connection gets its own
+    thread, so a slow client does not hold up the others. Setpoints of
+    objects mapped into the process data are written into the output image
+    (on the cyclic thread for segments running on a thread of this process,
+    all setpoints of a message in the same cycle), others by SDO before the
+    reply. A subscription sends MSG_STATE every `period` from a thread of
+    its own connection.
+
+    :param manager: MasterManager whose axes are commanded.
+    :param path: socket path, a stale socket file of a server that is
+        gone is replaced, anything else at that path is left alone.
+    """
+
+    def __init__(self, manager, path=DEFAULT_SOCKET):
+        self.manager = manager
+        self.path = path
+        self._socket = None
+        self._thread = None
+        self._connections = set()
+        self._writers = {}
+        self._inode = None
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        _remove_stale_socket(self.path)
+        self._stopping = False
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._inode = os.stat(self.path).st_ino
+        # only the user of the server and its group may command the axes
+        os.chmod(self.path, 0o660)
+        self._socket.listen()
+        self._thread = threading.Thread(target=self._accept, name="EtherCAT control", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._socket is None:
+            return
+        with self._lock:
+            self._stopping = True
+            connections = list(self._connections)
+            writers = list(self._writers.values())
+            self._writers.clear()
+        # nothing is written into the process data after stop()
+        for writer in writers:
+            writer.close()
+        # shutdown() wakes the accept() and recv() calls blocked in the threads
+        for sock in [self._socket] + connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        self._thread.join(1.0)
+        self._socket = None
+        # only our own socket, another server may have taken the path over
+        try:
+            if os.stat(self.path).st_ino == self._inode:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._connections.add(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="EtherCAT control client", daemon=True).start()
+
+    def _serve(self, conn):
+        send_lock = threading.Lock()
+        subscription = [None]
+
+        def send(data):
+            with send_lock:
+                conn.sendall(data)
+
+        try:
+            while True:
+                kind, count, sequence, body = _recv_message(conn)
+                try:
+                    reply = self._handle(kind, count, sequence, body, send, subscription)
+                except Exception as e:
+                    reply = _message(MSG_ERROR, 0, sequence, str(e).encode())
+                send(reply)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if subscription[0] is not None:
+                subscription[0].set()
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _axis(self, axes, axis):
+        if axis >= len(axes):
+            raise IndexError(f"No axis {axis}, there are {len(axes)}")
+        return axes[axis]
+
+    def _numbers(self, axes, body):
+        """Axis numbers of a READ or SUBSCRIBE request, None (every axis) if there are none."""
+        numbers = [axis for axis, in _AXIS.iter_unpack(body)]
+        for axis in numbers:
+            self._axis(axes, axis)
+        return numbers or None
+
+    def _handle(self, kind, count, sequence, body, send, subscription):
+        axes = self.manager.axes()
+        if kind == MSG_AXES:
+            _items(body, count, _AXIS)
+            names = b''.join(struct.pack('<B', len(name)) + name
+                             for name in (repr(axis).encode()[:255] for axis in axes))
+            return _message(MSG_AXES, len(axes), sequence, names)
+        if kind == MSG_SETPOINTS:
+            self._setpoints(axes, _SETPOINT.iter_unpack(_items(body, count, _SETPOINT)))
+            return _message(MSG_ACK, count, sequence)
+        if kind == MSG_DRIVE:
+            for axis, action in _DRIVE.iter_unpack(_items(body, count, _DRIVE)):
+                self._drive(self._axis(axes, axis), action)
+            return _message(MSG_ACK, count, sequence)
+        if kind == MSG_READ:
+            numbers = self._numbers(axes, _items(body, count, _AXIS))
+            return self._state(axes, numbers, sequence)
+        if kind == MSG_SUBSCRIBE:
+            numbers = self._numbers(axes, _items(body, count, _AXIS, _PERIOD.size))
+            period, = _PERIOD.unpack_from(body)
+            if subscription[0] is not None:
+                subscription[0].set()
+                subscription[0] = None
+            if period:
+                subscription[0] = stop = threading.Event()
+                threading.Thread(target=self._stream, args=(period / 1e6, numbers, send, stop),
+                                 name="EtherCAT control stream", daemon=True).start()
+            return _message(MSG_ACK, count, sequence)
+        raise ValueError(f"Unknown message type {kind}")
+
+    def _writer(self, segment):
+        """_CycleWriter of a segment running on a thread here, None otherwise."""
+        worker = getattr(segment, 'worker', None)
+        if worker is None or not worker.running:
+            return None
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError("Control server stopped")
+            writer = self._writers.get(segment)
+            if writer is None or writer.worker is not worker:
+                if writer is not None:
+                    # the segment was restarted with a new worker
+                    writer.close()
+                writer = self._writers[segment] = _CycleWriter(worker)
+            return writer
+
+    def _setpoints(self, axes, items):
+        # everything is checked first, a bad item rejects the whole message
+        items = list(items)
+        for axis, index, subindex, value in items:
+            self._axis(axes, axis)
+            if (index, subindex) not in SETPOINT_TYPES:
+                raise ValueError(f"0x{index:04X}:{subindex} is not a setpoint")
+        batches = {}
+        for axis, index, subindex, value in items:
+            axis = axes[axis]
+            key = (index, subindex)
+            setpoint = axis.setpoint
+            field = setpoint.pdo_field(index, subindex)
+            writer = self._writer(axis.segment) if field is not None else None
+            if writer is not None:
+                batches.setdefault(writer, []).append((setpoint.slave_image.outputs, field, value))
+            else:
+                setpoint.write(SdoParam(index, subindex, SETPOINT_TYPES[key], value))
+        for writer, writes in batches.items():
+            writer.submit(writes)
+
+    def _drive(self, axis, action):
+        if action == DRIVE_RESET_TRIP:
+            axis.segment.reset_trip()
+            return
+        drive = axis.drive
+        if drive is None:
+            raise RuntimeError(f"{axis} has no cyclic exchange")
+        if action == DRIVE_ENABLE:
+            drive.enable()
+        elif action == DRIVE_DISABLE:
+            drive.disable()
+        elif action == DRIVE_QUICK_STOP:
+            drive.quick_stop()
+        elif action == DRIVE_FAULT_RESET:
+            drive.fault_reset()
+        else:
+            raise ValueError(f"Unknown drive action {action}")
+
+    def _state(self, axes, numbers, sequence):
+        if numbers is None:
+            numbers = range(len(axes))
+        records = [_TIMESTAMP.pack(time.monotonic_ns())]
+        for number in numbers:
+            axis = self._axis(axes, number)
+            slave_image = axis.setpoint.slave_image
+            if slave_image is None:
+                records.append(_STATE.pack(number, 0, 0, 0, 0, 0, 0, 0))
+                continue
+            inputs = slave_image.inputs
+            flags = STATE_CYCLIC
+            if axis.drive is not None and axis.drive.enabled:
+                flags |= STATE_ENABLED
+            if axis.segment.tripped:
+                flags |= STATE_TRIPPED
+            records.append(_STATE.pack(
+                number, flags, _input(inputs, 'modes_of_operation_display'),
+                _input(inputs, 'statusword'), _input(inputs, 'error_code'),
+                _input(inputs, 'position_actual_value'), _input(inputs, 'velocity_actual_value'),
+                _input(inputs, 'torque_actual_value')))
+        return _message(MSG_STATE, len(numbers), sequence, b''.join(records))
+
+    def _stream(self, period, numbers, send, stop):
+        deadline = time.monotonic()
+        while not stop.is_set():
+            try:
+                # the axes are listed again, segments may have been opened or closed
+                send(self._state(self.manager.axes(), numbers, 0))
+            except OSError:
+                return
+            except Exception as e:
+                print(f"Control stream stopped: {e}")
+                return
+            deadline += period
+            stop.wait(max(deadline - time.monotonic(), 0))
+
+
+class ControlClient:
+    """
+    Connection to a ControlServer.
+
+    Every method sends one request and waits for its reply, a ControlError
+    is raised for an ERROR reply. subscribe() turns the connection into a
+    stream of states, commands then go through a second client.
+
+    :param path: socket path of the server.
+    :param timeout: seconds to wait for a reply.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=2.0):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._sequence = 0
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _request(self, kind, count=0, body=b''):
+        self._sequence = self._sequence % 0xFFFFFFFF + 1
+        self._socket.sendall(_message(kind, count, self._sequence, body))
+        while True:
+            reply, count, sequence, body = _recv_message(self._socket)
+            # states of a subscription arriving meanwhile are dropped
+            if sequence == self._sequence:
+                break
+        if reply == MSG_ERROR:
+            raise ControlError(bytes(body).decode(errors='replace'))
+        return reply, count, body
+
+    def axes(self):
+        """Names of the axes, the index in the list is the axis number."""
+        _, count, body = self._request(MSG_AXES)
+        names = []
+        offset = 0
+        for _ in range(count):
+            length = body[offset]
+            names.append(bytes(body[offset + 1:offset + 1 + length]).decode())
+            offset += 1 + length
+        return names
+
+    def write(self, setpoints):
+        """Write (axis, index, subindex, value) setpoints, all in one message."""
+        setpoints = list(setpoints)
+        body = b''.join(_SETPOINT.pack(axis, index, subindex, value) for axis, index, subindex, value in setpoints)
+        self._request(MSG_SETPOINTS, len(setpoints), body)
+
+    def set_velocities(self, velocities):
+        """Target velocity (0x60FF) of several axes at once, {axis: velocity}."""
+        self.write((axis, 0x60FF, 0, velocity) for axis, velocity in velocities.items())
+
+    def drive(self, axes, action):
+        """Request a DRIVE_* action of every axis, the reply does not wait for the drive."""
+        axes = list(axes)
+        self._request(MSG_DRIVE, len(axes), b''.join(_DRIVE.pack(axis, action) for axis in axes))
+
+    @staticmethod
+    def _states(count, body):
+        timestamp, = _TIMESTAMP.unpack_from(body)
+        return timestamp, [AxisState(*record) for record in
+                           _STATE.iter_unpack(body[_TIMESTAMP.size:_TIMESTAMP.size + count * _STATE.size])]
+
+    def read(self, axes=()):
+        """(timestamp in ns, [AxisState]) of the given axes, every axis by default."""
+        axes = list(axes)
+        _, count, body = self._request(MSG_READ, len(axes), b''.join(_AXIS.pack(axis) for axis in axes))
+        return self._states(count, body)
+
+    def subscribe(self, period, axes=()):
+        """
+        Yield (timestamp in ns, [AxisState]) every `period` seconds until the generator is closed.
+
+        The socket timeout does not apply while waiting for states.
+        """
+        axes = list(axes)
+        body = _PERIOD.pack(int(period * 1e6)) + b''.join(_AXIS.pack(axis) for axis in axes)
+        self._request(MSG_SUBSCRIBE, len(axes), body)
+        timeout = self._socket.gettimeout()
+        self._socket.settimeout(None)
+        try:
+            while True:
+                kind, count, sequence, body = _recv_message(self._socket)
+                if kind == MSG_STATE and sequence == 0:
+                    yield self._states(count, body)
+        finally:
+            self._socket.settimeout(timeout)
+            self._request(MSG_SUBSCRIBE, 0, _PERIOD.pack(0))
@@ -0,0 +1,171 @@
+# This Python file uses the following encoding: utf-8
+"""Cyclic process data exchange running on its own thread."""
+import array
+import os
+import threading
+import time
+
+# Supported cycle times in seconds
+CYCLE_TIMES = (0.001, 0.002, 0.004)
+
+# Remaining time before a deadline that is busy-waited instead of slept,
+# time.sleep() overshoots by up to a scheduler tick on a desktop kernel
+SPIN_MARGIN_NS = 200_000
+
+
+class CyclicWorker(threading.Thread):
+    """
+    Runs send_processdata()/receive_processdata() of a master with a fixed cycle.
+
+    Every cycle is scheduled against an absolute deadline (start + n * cycle),
+    so time spent in the exchange or in the callbacks does not add up as drift.
+    Callbacks registered with add_callback() are called on this thread right
+    after receive_processdata() with the working counter of the cycle.
+
+    :param master: opened pysoem master in SAFE-OP or OP state.
+    :param cycle_time: cycle time in seconds, one of CYCLE_TIMES.
+    :param timeout_us: receive timeout passed to receive_processdata().
+    :param image: optional ProcessImage, its outputs are written before every
+        send and its inputs are read after every receive.
+    :param cpu: optional CPU number the thread is pinned to (Linux only).
+    :param history: keep the start time and the exchange duration (ns) of
+        the last `history` cycles in start_history/exchange_history.
+    :param sync: optional object whose update(start, deadline) is called
+        after the callbacks and returns ns added to the next deadline, e.g.
+        a DcClock that keeps the cycle in step with distributed clocks.
+    """
+
+    def __init__(self, master, cycle_time=0.001, timeout_us=1_000, image=None, cpu=None, history=0, sync=None):
+        super().__init__(name="EtherCAT cyclic", daemon=True)
+        if cycle_time not in CYCLE_TIMES:
+            raise ValueError(f"Unsupported cycle time: {cycle_time}")
+        self.master = master
+        self.cycle_ns = int(round(cycle_time * 1e9))
+        self.timeout_us = timeout_us
+        self.image = image
+        self.cpu = cpu
+        self.error = None
+        self.history = history
+        self.sync = sync
+        self.start_history = array.array('q', bytes(8 * history))
+        self.exchange_history = array.array('q', bytes(8 * history))
+        self._callbacks = []
+        self._stop_event = threading.Event()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.cycles = 0
+        self.overruns = 0
+        self._period_sum = 0
+        self._period_min = None
+        self._period_max = 0
+        self._jitter_max = 0
+        self._jitter_sq_sum = 0
+
+    def add_callback(self, func):
+        """Register func(wkc) to be called once per cycle on the cyclic thread."""
+        # the list is replaced, not changed, so the loop never sees it half updated
+        self._callbacks = self._callbacks + [func]
+
+    def remove_callback(self, func):
+        # == and not is: every obj.method access gives a new bound method object
+        self._callbacks = [f for f in self._callbacks if f != func]
+
+    def stop(self, timeout=1.0):
+        """Ask the loop to finish and wait for the thread to end (callable from a callback)."""
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    @property
+    def running(self):
+        return self.is_alive() and not self._stop_event.is_set()
+
+    def stats(self):
+        """Return achieved period, jitter and overruns, all times in seconds."""
+        periods = max(self.cycles - 1, 1)
+        stats = {
+            'cycle_time': self.cycle_ns / 1e9,
+            'cycles': self.cycles,
+            'period_mean': self._period_sum / periods / 1e9,
+            'period_min': (self._period_min or 0) / 1e9,
+            'period_max': self._period_max / 1e9,
+            'jitter_rms': (self._jitter_sq_sum / max(self.cycles, 1)) ** 0.5 / 1e9,
+            'jitter_max': self._jitter_max / 1e9,
+            'overruns': self.overruns,
+        }
+        if self.sync is not None and hasattr(self.sync, 'stats'):
+            stats.update(self.sync.stats())
+        return stats
+
+    def _wait_until(self, deadline):
+        remaining = deadline - time.monotonic_ns()
+        if remaining > SPIN_MARGIN_NS:
+            time.sleep((remaining - SPIN_MARGIN_NS) / 1e9)
+        while time.monotonic_ns() < deadline:
+            pass
+
+    def _pin_cpu(self):
+        if self.cpu is None or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            # pid 0 is the calling thread on Linux
+            os.sched_setaffinity(0, {self.cpu})
+        except OSError as e:
+            print(f"Could not pin the cyclic thread to CPU {self.cpu}: {e}")
+
+    def run(self):
+        self._pin_cpu()
+        master = self.master
+        image = self.image
+        cycle_ns = self.cycle_ns
+        history = self.history
+        sync = self.sync
+        last_start = None
+        deadline = time.monotonic_ns() + cycle_ns
+        try:
+            while not self._stop_event.is_set():
+                self._wait_until(deadline)
+                start = time.monotonic_ns()
+
+                if image is not None:
+                    image.write_outputs()
+                master.send_processdata()
+                wkc = master.receive_processdata(self.timeout_us)
+                if image is not None:
+                    image.read_inputs()
+                if history:
+                    index = self.cycles % history
+                    self.start_history[index] = start
+                    self.exchange_history[index] = time.monotonic_ns() - start
+                for func in self._callbacks:
+                    func(wkc)
+
+                # statistics of this cycle
+                jitter = start - deadline
+                self._jitter_sq_sum += jitter * jitter
+                if jitter > self._jitter_max:
+                    self._jitter_max = jitter
+                if last_start is not None:
+                    period = start - last_start
+                    self._period_sum += period
+                    if self._period_min is None or period < self._period_min:
+                        self._period_min = period
+                    if period > self._period_max:
+                        self._period_max = period
+                last_start = start
+                self.cycles += 1
+
+                deadline += cycle_ns
+                if sync is not None:
+                    deadline += sync.update(start, deadline - cycle_ns)
+                now = time.monotonic_ns()
+                if now >= deadline:
+                    # the cycle took longer than its slot, skip the missed
+                    # deadlines instead of sending a burst of frames
+                    missed = (now - deadline) // cycle_ns + 1
+                    self.overruns += missed
+                    deadline += missed * cycle_ns
+        except Exception as e:
+            self.error = e
+            print(f"Cyclic exchange stopped: {e}")
@@ -0,0 +1,533 @@
+# This Python file uses the following encoding: utf-8
+"""Cyclic exchange in its own OS process, shared with the GUI through shared memory."""
+import ctypes
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from ethercat import backend, scan
+from ethercat.bus_cache import BusCache
+from ethercat.bus_monitor import ERROR_COUNTERS_PERIOD, BusMonitor, EscErrorCounters, read_error_counters
+from ethercat.cyclic import CyclicWorker
+from ethercat.dc import DcClock, configure_dc
+from ethercat.pdo import InputPdo, OutputPdo
+from ethercat.pdo_mapping import discover_layouts, layout_from_entries, slave_key
+from ethercat.slave_state import request_states, state_name
+from ethercat.supervisor import TRIP_NAMES, Supervisor
+
+# Room reserved per slave and direction in the shared process image
+MAX_SLAVES = 64
+PDO_STRIDE = 64
+
+# Command queue slots, must be a power of two
+COMMAND_SLOTS = 256
+
+CMD_STOP = 1
+CMD_SDO_WRITE = 2
+CMD_STATE = 3
+CMD_RESET_TRIP = 4
+
+ALL_SLAVES = 0xFFFF
+
+# op, slave, index, subindex, data length, data
+_COMMAND = struct.Struct('<BxHHBB8s')
+
+_MAGIC = 0x45434154  # 'ECAT'
+
+
+class SharedHeader(ctypes.Structure):
+    _fields_ = [
+        ('magic', ctypes.c_uint32),
+        ('slave_count', ctypes.c_uint32),
+        ('cmd_head', ctypes.c_uint32),  # written by the GUI only
+        ('cmd_tail', ctypes.c_uint32),  # written by the cyclic process only
+        ('running', ctypes.c_uint32),
+        ('wkc', ctypes.c_int32),
+        ('cycles', ctypes.c_uint64),
+        ('overruns', ctypes.c_uint64),
+        ('jitter_max_ns', ctypes.c_uint64),
+        ('period_mean_ns', ctypes.c_uint64),
+        ('dc_slaves', ctypes.c_uint64),
+        ('dc_offset_ns', ctypes.c_int64),
+        ('dc_drift_ppb', ctypes.c_int64),
+        ('heartbeat', ctypes.c_uint32),  # counted up by the GUI
+        ('tripped', ctypes.c_uint32),  # trip reason of the supervisor
+        ('expected_wkc', ctypes.c_int32),
+        ('lowest_wkc', ctypes.c_int32),
+        ('lost_frames', ctypes.c_uint64),
+        ('timeouts', ctypes.c_uint64),
+        ('wkc_mismatches', ctypes.c_uint64),
+        # events within the last recent_cycles cycles
+        ('recent_cycles', ctypes.c_uint32),
+        ('recent_lost_frames', ctypes.c_uint32),
+        ('recent_timeouts', ctypes.c_uint32),
+        ('recent_wkc_mismatches', ctypes.c_uint32),
+        ('error_counters_valid', ctypes.c_uint64),  # bit per slave
+    ]
+
+
+_INPUTS_OFFSET = ctypes.sizeof(SharedHeader)
+_OUTPUTS_OFFSET = _INPUTS_OFFSET + MAX_SLAVES * PDO_STRIDE
+_COMMANDS_OFFSET = _OUTPUTS_OFFSET + MAX_SLAVES * PDO_STRIDE
+_ERRORS_OFFSET = _COMMANDS_OFFSET + COMMAND_SLOTS * _COMMAND.size
+_ERRORS_SIZE = ctypes.sizeof(EscErrorCounters)
+SHARED_SIZE = _ERRORS_OFFSET + MAX_SLAVES * _ERRORS_SIZE
+
+
+class CommandQueue:
+    """
+    Single producer / single consumer ring of fixed size commands in shared memory.
+
+    The GUI only advances cmd_head and the cyclic process only advances
+    cmd_tail, both are aligned 32 bit stores, so neither side needs a lock.
+    A slot is filled completely before cmd_head makes it visible.
+    """
+
+    def __init__(self, buf, header):
+        self._buf = buf
+        self._header = header
+
+    def push(self, op, slave=0, index=0, subindex=0, data=b''):
+        if len(data) > 8:
+            raise ValueError("Command data is limited to 8 bytes")
+        head = self._header.cmd_head
+        if (head - self._header.cmd_tail) & 0xFFFFFFFF >= COMMAND_SLOTS:
+            return False
+        offset = _COMMANDS_OFFSET + (head % COMMAND_SLOTS) * _COMMAND.size
+        _COMMAND.pack_into(self._buf, offset, op, slave, index, subindex, len(data), bytes(data))
+        self._header.cmd_head = (head + 1) & 0xFFFFFFFF
+        return True
+
+    def pop(self):
+        tail = self._header.cmd_tail
+        if tail == self._header.cmd_head:
+            return None
+        offset = _COMMANDS_OFFSET + (tail % COMMAND_SLOTS) * _COMMAND.size
+        op, slave, index, subindex, length, data = _COMMAND.unpack_from(self._buf, offset)
+        self._header.cmd_tail = (tail + 1) & 0xFFFFFFFF
+        return op, slave, index, subindex, data[:length]
+
+
+class SharedProcessImage:
+    """
+    Process image of the cyclic process kept in the shared memory block.
+
+    Used by the cyclic process as `image` of its CyclicWorker: inputs are
+    copied from the slaves into shared memory after every receive and the
+    outputs the GUI wrote there are handed to the slaves before every send.
+    """
+
+    def __init__(self, buf, slaves):
+        self.slaves = list(slaves)
+        self._buf = buf
+        self._inputs = []
+        self._outputs = []
+        for position, slave in enumerate(self.slaves):
+            in_len, out_len = len(slave.input), len(slave.output)
+            if in_len > PDO_STRIDE or out_len > PDO_STRIDE:
+                raise ValueError(f"Process data of slave {slave.name} exceeds {PDO_STRIDE} bytes")
+            in_start = _INPUTS_OFFSET + position * PDO_STRIDE
+            out_start = _OUTPUTS_OFFSET + position * PDO_STRIDE
+            self._inputs.append((slave, buf[in_start:in_start + in_len]))
+            self._outputs.append((slave, buf[out_start:out_start + out_len]))
+
+    def read_inputs(self):
+        for slave, view in self._inputs:
+            view[:] = slave.input
+
+    def write_outputs(self):
+        for slave, view in self._outputs:
+            slave.output = view.tobytes()
+
+    def clear_outputs(self):
+        for slave, view in self._outputs:
+            view[:] = bytes(len(view))
+
+    def release(self):
+        for _, view in self._inputs + self._outputs:
+            view.release()
+        self._inputs = []
+        self._outputs = []
+
+
+def _layout_types(layout):
+    if layout is None:
+        return InputPdo, OutputPdo
+    return layout.input_type, layout.output_type
+
+
+class _SharedAxis:
+    """Input and output struct of one slave in the shared memory block."""
+
+    def __init__(self, buf, position, layout=None):
+        input_type, output_type = _layout_types(layout)
+        self.inputs = input_type.from_buffer(buf, _INPUTS_OFFSET + position * PDO_STRIDE)
+        self.outputs = output_type.from_buffer(buf, _OUTPUTS_OFFSET + position * PDO_STRIDE)
+
+
+def _set_realtime(cpu, priority):
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError as e:
+            print(f"Could not pin the cyclic process to CPU {cpu}: {e}")
+    if priority and hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except (OSError, PermissionError) as e:
+            print(f"SCHED_FIFO not allowed, running with normal priority: {e}")
+
+
+def _process_main(shm_name, backend_name, adapter, cycle_time, cpu, priority, timeout, dc, heartbeat_timeout,
+                  cache_path, conn):
+    """Entry point of the cyclic process."""
+    backend.use(backend_name)
+    _set_realtime(cpu, priority)
+    # the block belongs to the GUI process, which also unlinks it
+    shm = shared_memory.SharedMemory(name=shm_name)
+    header = SharedHeader.from_buffer(shm.buf)
+    commands = CommandQueue(shm.buf, header)
+    master = None
+    image = None
+    axes = []
+    error = None
+
+    def on_trip(reason, position):
+        header.tripped = reason
+        cause = '' if position is None else f' of slave {position + 1}'
+        print(f"{adapter}: safe stop on {TRIP_NAMES[reason]}{cause}")
+
+    try:
+        master = scan.open_bus(adapter, timeout=timeout)
+        if len(master.slaves) > MAX_SLAVES:
+            raise RuntimeError(f"More than {MAX_SLAVES} slaves on {adapter}")
+        master.config_map()
+        if master.state_check(backend.SAFEOP_STATE, 50_000) != backend.SAFEOP_STATE:
+            raise RuntimeError(f"{adapter}: failed to got to safeop state")
+        clock = None
+        if dc:
+            synced = configure_dc(master, cycle_time)
+            if synced:
+                clock = DcClock(master, cycle_time)
+            header.dc_slaves = len(synced)
+        image = SharedProcessImage(shm.buf, master.slaves)
+        if cache_path is not None:
+            layouts = BusCache(cache_path).discover_layouts(adapter, master.slaves)
+        else:
+            layouts = discover_layouts(master.slaves)
+        header.slave_count = len(master.slaves)
+        header.expected_wkc = master.expected_wkc
+        axes = [_SharedAxis(shm.buf, i, layout) for i, layout in enumerate(layouts)]
+        # the supervisor has the last word on the outputs of every cycle
+        supervisor = Supervisor(master, image, axes, heartbeat_timeout=heartbeat_timeout, on_trip=on_trip)
+        worker = CyclicWorker(master, cycle_time, image=supervisor, sync=clock)
+        monitor = BusMonitor(master)
+    except Exception as e:
+        error = str(e)
+    if error is not None:
+        conn.send(('error', error))
+        if master is not None:
+            master.close()
+        # drop every view on the block before closing it
+        if image is not None:
+            image.release()
+        axes = supervisor = None
+        header = commands = None
+        shm.close()
+        return
+
+    heartbeat = [header.heartbeat]
+    # SDO and state changes take milliseconds, they must not run in the cycle
+    pending = []
+    pending_ready = threading.Event()
+
+    def on_cycle(wkc):
+        header.wkc = wkc
+        header.cycles = worker.cycles
+        header.overruns = worker.overruns
+        monitor.update(wkc)
+        header.lost_frames = monitor.lost_frames
+        header.timeouts = monitor.timeouts
+        header.wkc_mismatches = monitor.wkc_mismatches
+        if monitor.lowest_wkc is not None:
+            header.lowest_wkc = monitor.lowest_wkc
+        (header.recent_cycles, header.recent_lost_frames,
+         header.recent_timeouts, header.recent_wkc_mismatches) = monitor.recent()
+        if header.heartbeat != heartbeat[0]:
+            heartbeat[0] = header.heartbeat
+            supervisor.heartbeat()
+        command = commands.pop()
+        while command is not None:
+            if command[0] == CMD_STOP:
+                worker.stop()
+            elif command[0] == CMD_RESET_TRIP:
+                supervisor.reset()
+                header.tripped = supervisor.tripped
+            else:
+                pending.append(command)
+                pending_ready.set()
+            command = commands.pop()
+        if worker.cycles % 1000 == 0:
+            stats = worker.stats()
+            header.jitter_max_ns = int(stats['jitter_max'] * 1e9)
+            header.period_mean_ns = int(stats['period_mean'] * 1e9)
+            if clock is not None:
+                header.dc_offset_ns = int(clock.offset * 1e9)
+                header.dc_drift_ppb = int(clock.drift * 1000)
+
+    def read_errors():
+        valid = 0
+        for position, slave in enumerate(master.slaves):
+            counters = read_error_counters(slave)
+            if counters is not None:
+                start = _ERRORS_OFFSET + position * _ERRORS_SIZE
+                shm.buf[start:start + _ERRORS_SIZE] = bytes(counters)
+                valid |= 1 << position
+        header.error_counters_valid = valid
+
+    def acyclic():
+        next_errors = time.monotonic()
+        while worker.running or pending:
+            if time.monotonic() >= next_errors:
+                read_errors()
+                next_errors = time.monotonic() + ERROR_COUNTERS_PERIOD
+            if not pending_ready.wait(0.1):
+                continue
+            pending_ready.clear()
+            while pending:
+                op, slave, index, subindex, data = pending.pop(0)
+                slaves = master.slaves if slave == ALL_SLAVES else [master.slaves[slave]]
+                try:
+                    if op == CMD_SDO_WRITE:
+                        for target in slaves:
+                            target.sdo_write(index, subindex, data)
+                    elif op == CMD_STATE:
+                        positions = range(len(master.slaves)) if slave == ALL_SLAVES else [slave]
+                        if index != backend.OP_STATE:
+                            # the slaves drop out of the working counter on purpose, the others are still checked
+                            supervisor.park(*positions)
+                        stuck = request_states(slaves, index)
+                        for target, state in stuck:
+                            print(f"{adapter}: slave {target.name} stuck in {state_name(state)}")
+                        if index == backend.OP_STATE:
+                            stuck = [target for target, _ in stuck]
+                            supervisor.unpark(*[position for position in positions
+                                                if not any(master.slaves[position] is target for target in stuck)])
+                except Exception as e:
+                    print(f"{adapter}: command {op} for slave {slave} failed: {e}")
+
+    worker.add_callback(on_cycle)
+    worker.add_callback(supervisor.check)
+    worker.start()
+    acyclic_thread = threading.Thread(target=acyclic, name="EtherCAT acyclic", daemon=True)
+    acyclic_thread.start()
+    master.state = backend.OP_STATE
+    master.write_state()
+    in_op = master.state_check(backend.OP_STATE, 5_000_000) == backend.OP_STATE
+    if in_op:
+        supervisor.arm()
+    header.running = 1
+    # the GUI decodes the shared image with the same layouts
+    mappings = [(slave_key(slave),) + layout.entries() if layout is not None else None
+                for slave, layout in zip(master.slaves, layouts)]
+    conn.send(('ready', [slave.name for slave in master.slaves], in_op, mappings))
+
+    worker.join()
+    acyclic_thread.join(1.0)
+    header.running = 0
+    # zero everything
+    image.clear_outputs()
+    image.write_outputs()
+    master.send_processdata()
+    master.receive_processdata(1_000)
+    master.state = backend.PREOP_STATE
+    master.write_state()
+    master.close()
+    # drop every view on the block before closing it
+    image.release()
+    supervisor.axes = axes = []
+    header = commands = None
+    shm.close()
+
+
+class CyclicProcess:
+    """
+    Runs the bus of one adapter in a separate process.
+
+    The GUI process reads `inputs[position]` and writes `outputs[position]`
+    (views on the shared memory with the PDO layout of each slave) and sends acyclic
+    requests through the lock-free command queue, so nothing in the GUI
+    process competes with the cycle for the GIL.
+
+    :param priority: SCHED_FIFO priority of the cyclic process, 0 keeps the
+        normal scheduler. Needs CAP_SYS_NICE, otherwise a warning is printed.
+    :param dc: synchronize the slaves and the cycle with distributed clocks.
+    :param heartbeat_timeout: seconds without heartbeat() after which the
+        cyclic process stops every axis, None to not watch the GUI.
+    :param cache_path: file of a BusCache the PDO layouts are taken from, None to read them from the slaves.
+    """
+
+    def __init__(self, adapter, cycle_time=0.001, cpu=None, priority=80, dc=False, heartbeat_timeout=None,
+                 cache_path=None):
+        self.adapter = adapter
+        self.cycle_time = cycle_time
+        self.cpu = cpu
+        self.priority = priority
+        self.dc = dc
+        self.heartbeat_timeout = heartbeat_timeout
+        self.cache_path = cache_path
+        self.names = []
+        self.inputs = []
+        self.outputs = []
+        self.in_op = False
+        self._shm = None
+        self._header = None
+        self._commands = None
+        self._process = None
+
+    def start(self, timeout=10.0):
+        """Start the process and wait until its bus is in SAFE-OP or OP. Raises on failure."""
+        self._shm = shared_memory.SharedMemory(create=True, size=SHARED_SIZE)
+        self._header = SharedHeader.from_buffer(self._shm.buf)
+        self._header.magic = _MAGIC
+        self._commands = CommandQueue(self._shm.buf, self._header)
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(
+            target=_process_main, name=f"EtherCAT {self.adapter}",
+            args=(self._shm.name, backend.name(), self.adapter, self.cycle_time, self.cpu, self.priority, timeout,
+                  self.dc, self.heartbeat_timeout, self.cache_path, child_conn),
+            daemon=True)
+        self._process.start()
+        child_conn.close()
+        # the bus scan and the OP transition may take timeout + 5 s
+        if not parent_conn.poll(timeout + 10.0):
+            self.stop()
+            raise TimeoutError(f"Cyclic process on {self.adapter} did not start")
+        message = parent_conn.recv()
+        if message[0] == 'error':
+            self.stop()
+            raise RuntimeError(message[1])
+        _, self.names, self.in_op, mappings = message
+        for position, mapping in enumerate(mappings):
+            input_type, output_type = _layout_types(layout_from_entries(*mapping) if mapping is not None else None)
+            self.inputs.append(input_type.from_buffer(self._shm.buf, _INPUTS_OFFSET + position * PDO_STRIDE))
+            self.outputs.append(output_type.from_buffer(self._shm.buf, _OUTPUTS_OFFSET + position * PDO_STRIDE))
+        return self
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.is_alive() and bool(self._header.running)
+
+    def command(self, op, slave=0, index=0, subindex=0, data=b''):
+        """Queue a command for the cyclic process, False if the queue is full."""
+        return self._commands.push(op, slave, index, subindex, data)
+
+    def sdo_write(self, slave, index, subindex, data):
+        return self.command(CMD_SDO_WRITE, slave, index, subindex, data)
+
+    def set_state(self, state, slave=ALL_SLAVES):
+        return self.command(CMD_STATE, slave, state)
+
+    def heartbeat(self):
+        """Show the supervisor of the cyclic process that the GUI is alive."""
+        header = self._header
+        if header is not None:
+            header.heartbeat = (header.heartbeat + 1) & 0xFFFFFFFF
+
+    @property
+    def tripped(self):
+        return self._header.tripped if self._header is not None else 0
+
+    def reset_trip(self):
+        return self.command(CMD_RESET_TRIP)
+
+    def bus_stats(self):
+        """The BusMonitor.stats() of the cyclic process."""
+        header = self._header
+        cycles = max(header.recent_cycles, 1)
+        return {
+            'expected_wkc': header.expected_wkc,
+            'last_wkc': header.wkc,
+            'lowest_wkc': header.lowest_wkc,
+            'lost_frames': header.lost_frames,
+            'timeouts': header.timeouts,
+            'wkc_mismatches': header.wkc_mismatches,
+            'lost_frame_rate': header.recent_lost_frames / cycles,
+            'timeout_rate': header.recent_timeouts / cycles,
+            'wkc_mismatch_rate': header.recent_wkc_mismatches / cycles,
+        }
+
+    def error_counters(self):
+        """EscErrorCounters (or None) of every slave, refreshed every ERROR_COUNTERS_PERIOD."""
+        header = self._header
+        if header is None:
+            return []
+        counters = []
+        for position in range(len(self.names)):
+            if header.error_counters_valid & (1 << position):
+                start = _ERRORS_OFFSET + position * _ERRORS_SIZE
+                counters.append(EscErrorCounters.from_buffer_copy(self._shm.buf, start))
+            else:
+                counters.append(None)
+        return counters
+
+    def stats(self):
+        header = self._header
+        stats = {
+            'cycle_time': self.cycle_time,
+            'cycles': header.cycles,
+            'period_mean': header.period_mean_ns / 1e9,
+            'jitter_max': header.jitter_max_ns / 1e9,
+            'overruns': header.overruns,
+            'wkc': header.wkc,
+            'tripped': TRIP_NAMES.get(header.tripped, header.tripped),
+        }
+        stats.update(self.bus_stats())
+        if header.dc_slaves:
+            stats['dc_offset'] = header.dc_offset_ns / 1e9
+            stats['dc_drift_ppm'] = header.dc_drift_ppb / 1000
+        return stats
+
+    def stop(self, timeout=2.0):
+        if self._process is not None:
+            if self._process.is_alive():
+                self._commands.push(CMD_STOP)
+                self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+        # the views must be gone before the shared memory can be closed
+        self.inputs = []
+        self.outputs = []
+        self._commands = None
+        self._header = None
+        if self._shm is not None:
+            self._shm.unlink()
+            try:
+                self._shm.close()
+            except BufferError:
+                # a view is still referenced somewhere, the mapping goes with it
+                pass
+            self._shm = None
+
+
+def open_process(adapter, on_slave=None, cancel=None, timeout=10.0, cycle_time=0.001, cpu=None, dc=False,
+                 heartbeat_timeout=None, cache_path=None):
+    """
+    Same contract as scan.open_bus() but returns a started CyclicProcess.
+
+    on_slave(position, name) is called for every slave of the bus. The
+    start cannot be cancelled once the process is running.
+    """
+    if cancel is not None and cancel.is_set():
+        raise scan.ScanCancelled()
+    process = CyclicProcess(adapter, cycle_time, cpu, dc=dc, heartbeat_timeout=heartbeat_timeout,
+                            cache_path=cache_path).start(timeout)
+    if on_slave is not None:
+        for position, name in enumerate(process.names):
+            on_slave(position, name)
+    return process
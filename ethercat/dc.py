@@ -0,0 +1,132 @@
+# This Python file uses the following encoding: utf-8
+"""Distributed clocks: SYNC0 on the slaves and a host cycle that follows the reference clock."""
+
+# Gains of the PI controller that moves the host cycle onto the reference clock,
+# per cycle; small enough that the jitter of one cycle is averaged out
+PHASE_GAIN = 0.1
+DRIFT_GAIN = 0.005
+
+# The correction of one cycle is limited to this share of the cycle time
+MAX_CORRECTION = 0.1
+
+
+def configure_dc(master, cycle_time, shift_time=None):
+    """
+    Switch on distributed clocks and SYNC0 of every slave that has a clock.
+
+    Call after config_map() and before going to OP. SYNC0 fires
+    `shift_time` after every multiple of the cycle on the reference clock,
+    by default half a cycle, which leaves the host half a cycle to get its
+    frame through before the outputs are taken over.
+
+    Returns the slaves that were synchronized, an empty list if the bus has
+    no DC capable slave (the cycle then stays free running).
+    """
+    if not master.config_dc():
+        return []
+    cycle_ns = int(round(cycle_time * 1e9))
+    shift_ns = cycle_ns // 2 if shift_time is None else int(round(shift_time * 1e9))
+    synced = []
+    for slave in master.slaves:
+        # older pysoem versions do not tell, the ESC ignores the registers then
+        if getattr(slave, 'hasdc', True):
+            slave.dc_sync(True, cycle_ns, shift_ns)
+            synced.append(slave)
+    return synced
+
+
+class DcClock:
+    """
+    Keeps the cycle of a CyclicWorker in step with the DC reference clock.
+
+    Passed as `sync` to the worker, update() is called once per cycle and
+    returns a correction in ns for the next deadline: a PI controller on the
+    phase of the frame on the reference clock (master.dc_time) against
+    `offset_time`, so frames always leave the same time before SYNC0 and
+    the host clock running faster or slower than the slaves is made up
+    for by the integral part.
+
+    `offset` is the last phase error and `drift` the rate of the reference
+    clock against the host clock in ppm, measured since reset().
+
+    :param master: pysoem master after configure_dc().
+    :param cycle_time: cycle time of the worker in seconds.
+    :param offset_time: phase of the frame on the reference clock, seconds
+        after every multiple of the cycle; must be before SYNC0.
+    """
+
+    def __init__(self, master, cycle_time, offset_time=0.00005):
+        self.master = master
+        self.cycle_ns = int(round(cycle_time * 1e9))
+        self.offset_ns = int(round(offset_time * 1e9))
+        self._max_correction = int(self.cycle_ns * MAX_CORRECTION)
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.correction = 0
+        self._integral = 0.0
+        self._last_dc = None
+        self._first = None
+        self._delta = 0
+        self._delta_max = 0
+        self._delta_sq_sum = 0
+        self._drift = 0.0
+
+    @property
+    def offset(self):
+        """Last phase error of the host cycle in seconds, positive when late."""
+        return self._delta / 1e9
+
+    @property
+    def drift(self):
+        """Reference clock against host clock in ppm, positive when the slaves run fast."""
+        return self._drift
+
+    def update(self, start, deadline):
+        """
+        Correction in ns of the next deadline, from the dc_time of the cycle that began at start.
+
+        Only the scheduled deadline is controlled, the wake-up latency
+        (start - deadline) of this cycle is taken out of the phase.
+        """
+        dc_time = self.master.dc_time
+        if dc_time == self._last_dc:
+            # lost frame, the reference clock was not read this cycle
+            return 0
+        self._last_dc = dc_time
+        cycle_ns = self.cycle_ns
+        delta = (dc_time - (start - deadline) - self.offset_ns) % cycle_ns
+        if delta > cycle_ns // 2:
+            delta -= cycle_ns
+        self._delta = delta
+        self.samples += 1
+        self._delta_sq_sum += delta * delta
+        if abs(delta) > self._delta_max:
+            self._delta_max = abs(delta)
+
+        if self._first is None:
+            self._first = (start, dc_time)
+        elif start > self._first[0]:
+            host = start - self._first[0]
+            self._drift = ((dc_time - self._first[1]) - host) / host * 1e6
+
+        self._integral += delta
+        correction = -int(PHASE_GAIN * delta + DRIFT_GAIN * self._integral)
+        limit = self._max_correction
+        if correction > limit:
+            correction = limit
+        elif correction < -limit:
+            correction = -limit
+        self.correction = correction
+        return correction
+
+    def stats(self):
+        """Phase error and drift, times in seconds."""
+        return {
+            'dc_offset': self._delta / 1e9,
+            'dc_offset_max': self._delta_max / 1e9,
+            'dc_offset_rms': (self._delta_sq_sum / max(self.samples, 1)) ** 0.5 / 1e9,
+            'dc_drift_ppm': self._drift,
+            'dc_correction': self.correction / 1e9,
+        }
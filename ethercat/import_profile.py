@@ -0,0 +1,82 @@
+# This Python file uses the following encoding: utf-8
+"""Import times of an application start, to find what makes a cold start slow."""
+import builtins
+import sys
+import threading
+import time
+
+# Modules listed by report()
+REPORT_COUNT = 10
+
+
+class ImportProfile:
+    """
+    Measures every import that loads a new module while the application starts.
+
+    start() puts a wrapper around builtins.__import__, as early as possible
+    in the main script; report() removes it and prints the total time and
+    the slowest modules. As with python -X importtime, the time of a module
+    is its own, without the modules it imports in turn. Only imports of the
+    thread that called start() are measured, relative imports count for the
+    module that does them.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.times = {}
+        self._stack = []
+        self._original = None
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.get_ident()
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original is None:
+            return
+        # someone wrapped __import__ after us (e.g. shiboken), then the wrapper stays and passes through
+        if builtins.__import__ == self._import:
+            builtins.__import__ = self._original
+        self._thread = None
+
+    def _loading(self, name, fromlist, level):
+        """Name of the module this import loads, None if everything is loaded already."""
+        if level or threading.get_ident() != self._thread:
+            return None
+        if name not in sys.modules:
+            return name
+        for item in fromlist or ():
+            # from package import submodule
+            if item != '*' and not hasattr(sys.modules[name], item) and f'{name}.{item}' not in sys.modules:
+                return f'{name}.{item}'
+        return None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = self._loading(name, fromlist, level)
+        if module is None:
+            return self._original(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            self.times[module] = self.times.get(module, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def report(self, count=REPORT_COUNT):
+        """Stop measuring and print the time since start() and the slowest imports."""
+        self.stop()
+        if self.started is None:
+            return
+        total = time.perf_counter() - self.started
+        imports = sum(self.times.values())
+        print(f"Started in {total:.2f} s, {imports:.2f} s of it importing {len(self.times)} modules")
+        slowest = sorted(self.times.items(), key=lambda item: item[1], reverse=True)[:count]
+        for module, seconds in slowest:
+            print(f"  {seconds * 1000:7.1f} ms  {module}")
@@ -0,0 +1,466 @@
+# This Python file uses the following encoding: utf-8
+"""Several EtherCAT segments, one per adapter, each with its own cyclic worker."""
+import os
+
+from ethercat import backend, scan
+from ethercat.bus_monitor import BusMonitor, ErrorCounterReader
+from ethercat.cia402 import Cia402Drive, DrivePoller, is_drive
+from ethercat.cyclic import CyclicWorker
+from ethercat.dc import DcClock, configure_dc
+from ethercat.pdo import ProcessImage
+from ethercat.pdo_mapping import discover_layouts
+from ethercat.recorder import TelemetryRecorder
+from ethercat.sdo_cache import SdoCache
+from ethercat.setpoint import SetpointWriter
+from ethercat.slave_state import request_state
+from ethercat.supervisor import TRIP_NAMES, Supervisor
+
+
+class Axis:
+    """One slave of one segment as seen by the application."""
+
+    def __init__(self, segment, position):
+        self.segment = segment
+        self.position = position
+
+    @property
+    def slave(self):
+        """pysoem slave, only for segments running on a thread of this process."""
+        return self.segment.master.slaves[self.position]
+
+    @property
+    def sdo(self):
+        return self.segment.sdo_caches[self.position]
+
+    @property
+    def setpoint(self):
+        return self.segment.setpoints[self.position]
+
+    @property
+    def drive(self):
+        """Cia402Drive of this slave, None while its process data is not exchanged or it is no drive."""
+        return self.segment.drives[self.position]
+
+    @property
+    def name(self):
+        return self.sdo.name
+
+    def set_state(self, state, timeout=5.0):
+        """Change the EtherCAT state of this slave only, see Segment.set_slave_state()."""
+        return self.segment.set_slave_state(self.position, state, timeout)
+
+    def __repr__(self):
+        return f"{self.segment.adapter} / Slave {self.position + 1}: {self.name}"
+
+
+class Segment:
+    """
+    An opened master on one adapter.
+
+    :param adapter: adapter name the master was opened on.
+    :param master: pysoem master after config_init().
+    :param cycle_time: cycle time of the worker in seconds.
+    :param cpu: CPU the cyclic worker is pinned to, or None.
+    :param dc: synchronize the slaves with distributed clocks and the cycle
+        with the reference clock, see ethercat.dc.
+    :param heartbeat_timeout: seconds without heartbeat() after which the
+        Supervisor stops every axis, None to not watch the application.
+    :param cache: optional BusCache, the PDO layouts of slaves found in it
+        are not read again.
+    """
+
+    def __init__(self, adapter, master, cycle_time=0.001, cpu=None, dc=False, heartbeat_timeout=None, cache=None):
+        self.adapter = adapter
+        self.master = master
+        self.cycle_time = cycle_time
+        self.cpu = cpu
+        self.dc = dc
+        self.heartbeat_timeout = heartbeat_timeout
+        self.cache = cache
+        self.image = None
+        self.worker = None
+        self.clock = None
+        self.supervisor = None
+        self.monitor = None
+        self.error_reader = None
+        self.recorder = None
+        # a new segment always starts with empty caches
+        self.sdo_caches = [SdoCache(slave) for slave in master.slaves]
+        self.setpoints = [SetpointWriter(None, cache) for cache in self.sdo_caches]
+        self.drives = [None] * len(master.slaves)
+
+    @property
+    def running(self):
+        return self.worker is not None
+
+    @property
+    def slave_count(self):
+        return len(self.master.slaves)
+
+    def stats(self):
+        if self.worker is None:
+            return None
+        stats = self.worker.stats()
+        stats.update(self.supervisor.stats())
+        stats.update(self.monitor.stats())
+        return stats
+
+    def bus_stats(self):
+        """Working counter and lost frame counts and rates, see BusMonitor.stats(); None without cyclic exchange."""
+        monitor = self.monitor
+        return monitor.stats() if monitor is not None else None
+
+    def error_counters(self):
+        """ESC error counters of every slave (None where unreadable), read in the background about once a second."""
+        reader = self.error_reader
+        return list(reader.counters) if reader is not None else [None] * self.slave_count
+
+    @property
+    def tripped(self):
+        return self.supervisor is not None and bool(self.supervisor.tripped)
+
+    def heartbeat(self):
+        if self.supervisor is not None:
+            self.supervisor.heartbeat()
+
+    def reset_trip(self):
+        """Acknowledge a safe stop of the Supervisor, the drives must be enabled again."""
+        if self.supervisor is not None:
+            self.supervisor.reset()
+
+    def _on_trip(self, reason, position):
+        cause = '' if position is None else f' of slave {position + 1}'
+        print(f'{self.adapter}: safe stop on {TRIP_NAMES[reason]}{cause}')
+
+    def start(self):
+        """Map the process data, go to OP and start the cyclic exchange. Returns True in OP."""
+        self.master.config_map()
+        if self.master.state_check(backend.SAFEOP_STATE, 50_000) != backend.SAFEOP_STATE:
+            print(f'{self.adapter}: failed to got to safeop state, setpoints are written by SDO')
+            return False
+        if self.dc:
+            synced = configure_dc(self.master, self.cycle_time)
+            if synced:
+                self.clock = DcClock(self.master, self.cycle_time)
+                print(f'{self.adapter}: SYNC0 on {len(synced)} of {self.slave_count} slaves')
+            else:
+                print(f'{self.adapter}: no distributed clocks, the cycle is free running')
+        # decoded with the mapping each slave type reports, read once per type
+        if self.cache is not None:
+            layouts = self.cache.discover_layouts(self.adapter, self.master.slaves)
+        else:
+            layouts = discover_layouts(self.master.slaves)
+        self.image = ProcessImage(self.master.slaves, strict=False, layouts=layouts)
+        # the supervisor has the last word on the outputs of every cycle
+        self.supervisor = Supervisor(self.master, self.image, heartbeat_timeout=self.heartbeat_timeout,
+                                     on_trip=self._on_trip)
+        self.worker = CyclicWorker(self.master, self.cycle_time, image=self.supervisor, cpu=self.cpu,
+                                   sync=self.clock)
+        self.drives = [Cia402Drive(slave_image) if is_drive(slave_image) else None
+                       for slave_image in self.image.slaves]
+        self.monitor = BusMonitor(self.master)
+        self.worker.add_callback(self.monitor.update)
+        self.worker.add_callback(self._update_drives)
+        self.worker.add_callback(self.supervisor.check)
+        self.worker.start()
+        self.error_reader = ErrorCounterReader(self.master)
+        self.error_reader.start()
+        for i, setpoint in enumerate(self.setpoints):
+            setpoint.slave_image = self.image[i]
+        self.master.state = backend.OP_STATE
+        self.master.write_state()
+        if self.master.state_check(backend.OP_STATE, 5_000_000) != backend.OP_STATE:
+            print(f'{self.adapter}: failed to got to op state')
+            # unbind the worker, the error reader and the setpoints again
+            self.stop()
+            return False
+        self.supervisor.arm()
+        return True
+
+    def _update_drives(self, wkc):
+        for drive in self.drives:
+            if drive is not None:
+                drive.update(wkc)
+
+    def set_slave_state(self, position, state, timeout=5.0):
+        """Move one slave to state while the others keep exchanging process data. Returns the state reached."""
+        supervisor = self.supervisor
+        if supervisor is not None and state != backend.OP_STATE:
+            # the slave drops out of the working counter on purpose
+            supervisor.park(position)
+        reached = request_state(self.master.slaves[position], state, timeout)
+        if supervisor is not None and reached == backend.OP_STATE:
+            supervisor.unpark(position)
+        return reached
+
+    def start_recording(self, path):
+        """Record the inputs of every mapped slave each cycle into path."""
+        if self.worker is None:
+            raise RuntimeError(f"{self.adapter}: no cyclic exchange to record")
+        self.stop_recording()
+        self.recorder = TelemetryRecorder.from_image(path, self.image).start()
+        self.worker.add_callback(self.recorder.record)
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.worker.remove_callback(self.recorder.record)
+        self.recorder.stop()
+        print(f'{self.adapter}: {self.recorder.written} samples recorded, {self.recorder.dropped} dropped')
+        self.recorder = None
+
+    def stop(self):
+        """Stop the cyclic exchange, zero the outputs and go back to PRE-OP."""
+        if self.worker is None:
+            return
+        self.stop_recording()
+        self.error_reader.stop()
+        self.error_reader = None
+        self.worker.stop()
+        print(f'{self.adapter}: cyclic exchange stopped', self.worker.stats())
+        self.worker = None
+        self.clock = None
+        self.supervisor = None
+        self.monitor = None
+        self.drives = [None] * len(self.drives)
+        for setpoint in self.setpoints:
+            setpoint.slave_image = None
+        # zero everything
+        self.image.clear_outputs()
+        self.image.write_outputs()
+        self.image = None
+        self.master.send_processdata()
+        self.master.receive_processdata(1_000)
+        self.master.state = backend.PREOP_STATE
+        self.master.write_state()
+
+    def close(self):
+        self.stop()
+        self.master.close()
+
+
+class RemoteSdo:
+    """SDO writes to one slave of a CyclicProcess, sent through its command queue."""
+
+    def __init__(self, process, position):
+        self.process = process
+        self.position = position
+
+    @property
+    def name(self):
+        return self.process.names[self.position]
+
+    def sdo_write(self, index, subindex, data, ca=False):
+        if ca:
+            raise ValueError("Complete access is not supported through the command queue")
+        if not self.process.sdo_write(self.position, index, subindex, data):
+            raise RuntimeError(f"Command queue of {self.process.adapter} is full")
+
+
+class _SharedSlave:
+    def __init__(self, process, position):
+        self.inputs = process.inputs[position]
+        self.outputs = process.outputs[position]
+
+
+class ProcessSegment:
+    """
+    A segment whose cyclic exchange runs in a CyclicProcess.
+
+    Offers the same sdo_caches/setpoints as Segment, setpoints go into the
+    shared output image and SDO writes through the command queue. There is
+    no pysoem master in this process, so `master` is None.
+    """
+
+    def __init__(self, adapter, process):
+        self.adapter = adapter
+        self.process = process
+        self.master = None
+        self.sdo_caches = [RemoteSdo(process, i) for i in range(len(process.names))]
+        self.setpoints = [SetpointWriter(_SharedSlave(process, i), sdo)
+                          for i, sdo in enumerate(self.sdo_caches)]
+        # the statusword is only in shared memory here, so it is polled
+        self.drives = [Cia402Drive(setpoint.slave_image) if is_drive(setpoint.slave_image) else None
+                       for setpoint in self.setpoints]
+        self.poller = DrivePoller([drive for drive in self.drives if drive is not None], process.cycle_time)
+        self.poller.start()
+
+    @property
+    def running(self):
+        return self.process.running
+
+    @property
+    def slave_count(self):
+        return len(self.process.names)
+
+    def stats(self):
+        return self.process.stats()
+
+    def bus_stats(self):
+        return self.process.bus_stats() if self.process.running else None
+
+    def error_counters(self):
+        """ESC error counters as last read by the cyclic process, about once a second."""
+        return self.process.error_counters()
+
+    @property
+    def tripped(self):
+        return self.process.running and bool(self.process.tripped)
+
+    def heartbeat(self):
+        self.process.heartbeat()
+
+    def reset_trip(self):
+        if not self.process.reset_trip():
+            raise RuntimeError(f"Command queue of {self.process.adapter} is full")
+
+    def start(self):
+        return self.process.in_op
+
+    def set_slave_state(self, position, state, timeout=5.0):
+        """Queue a state change for one slave, the cyclic process carries it out. Returns None."""
+        if not self.process.set_state(state, position):
+            raise RuntimeError(f"Command queue of {self.process.adapter} is full")
+        return None
+
+    def stop(self):
+        if self.poller is not None:
+            self.poller.stop()
+            # the drives hold views on the shared memory
+            self.poller = None
+        self.drives = [None] * len(self.drives)
+        for setpoint in self.setpoints:
+            setpoint.slave_image = None
+        self.process.stop()
+
+    def close(self):
+        self.stop()
+
+
+class MasterManager:
+    """
+    Keeps one Segment per adapter and presents their slaves as one list.
+
+    Every segment gets its own CyclicWorker, or its own CyclicProcess with
+    processes=True. Workers are pinned round robin to the CPUs in `cpus`,
+    by default every CPU the process may run on except the first one, which
+    is left to the GUI. With dc=True the slaves of every segment get SYNC0
+    and each cycle follows the reference clock of its segment. With a
+    heartbeat_timeout, heartbeat() must be called more often than that or
+    every segment stops its axes. A BusCache as `cache` keeps the PDO
+    layouts of every bus between starts.
+    """
+
+    def __init__(self, cycle_time=0.001, cpus=None, processes=False, dc=False, heartbeat_timeout=None,
+                 cache=None):
+        self.cycle_time = cycle_time
+        self.processes = processes
+        self.dc = dc
+        self.heartbeat_timeout = heartbeat_timeout
+        self.cache = cache
+        if cpus is None and hasattr(os, 'sched_getaffinity'):
+            cpus = sorted(os.sched_getaffinity(0))[1:]
+        self.cpus = list(cpus or [])
+        self.segments = {}
+        self._next_cpu = 0
+
+    def __contains__(self, adapter):
+        return adapter in self.segments
+
+    def _take_cpu(self):
+        if not self.cpus:
+            return None
+        cpu = self.cpus[self._next_cpu % len(self.cpus)]
+        self._next_cpu += 1
+        return cpu
+
+    def add(self, adapter, master):
+        """
+        Register a bus opened elsewhere (e.g. by ScanService) as a new segment.
+
+        master is a pysoem master after config_init() or, with processes=True,
+        a started CyclicProcess.
+        """
+        if adapter in self.segments:
+            raise ValueError(f"Adapter {adapter} is already open")
+        return self.attach(self.create_segment(adapter, master))
+
+    def create_segment(self, adapter, master):
+        """Segment for a bus opened elsewhere, not registered yet. Takes the same master as add()."""
+        if self.processes:
+            return ProcessSegment(adapter, master)
+        return Segment(adapter, master, self.cycle_time, self._take_cpu(), self.dc, self.heartbeat_timeout,
+                       self.cache)
+
+    def attach(self, segment):
+        """Register a segment made by create_segment() or starter(), e.g. once it reaches the GUI thread."""
+        if segment.adapter in self.segments:
+            raise ValueError(f"Adapter {segment.adapter} is already open")
+        self.segments[segment.adapter] = segment
+        return segment
+
+    def opener(self):
+        """Function with the signature of scan.open_bus() matching the processes setting."""
+        if not self.processes:
+            return scan.open_bus
+        # multiprocessing and shared memory are only loaded when they are used
+        from ethercat.cyclic_process import open_process
+        cpu = self._take_cpu()
+
+        # the cyclic process opens the cache file on its own
+        cache_path = self.cache.path if self.cache is not None else None
+
+        def open_cyclic_process(adapter, on_slave=None, cancel=None, timeout=10.0):
+            return open_process(adapter, on_slave, cancel, timeout, self.cycle_time, cpu, self.dc,
+                                self.heartbeat_timeout, cache_path)
+        return open_cyclic_process
+
+    def starter(self):
+        """
+        Function with the signature of scan.open_bus() that also brings the segment up.
+
+        It opens the bus, creates the segment and starts its cyclic exchange
+        on the calling thread, e.g. in a ScanService job, and returns the
+        segment without registering it; attach() does that afterwards.
+        """
+        opener = self.opener()
+
+        def open_segment(adapter, on_slave=None, cancel=None, timeout=10.0):
+            segment = self.create_segment(adapter, opener(adapter, on_slave, cancel, timeout))
+            try:
+                segment.start()
+            except Exception:
+                segment.close()
+                raise
+            return segment
+        return open_segment
+
+    def open(self, adapter, timeout=10.0):
+        """Open adapter on the calling thread, add it as a segment and start its cyclic exchange."""
+        if adapter in self.segments:
+            raise ValueError(f"Adapter {adapter} is already open")
+        return self.attach(self.starter()(adapter, timeout=timeout))
+
+    def close(self, adapter):
+        segment = self.segments.pop(adapter, None)
+        if segment is not None:
+            segment.close()
+
+    def close_all(self):
+        for adapter in list(self.segments):
+            self.close(adapter)
+
+    def axes(self):
+        """All slaves of all segments, in adapter order then bus position."""
+        return [Axis(segment, position)
+                for segment in self.segments.values()
+                for position in range(segment.slave_count)]
+
+    def stats(self):
+        return {adapter: segment.stats() for adapter, segment in self.segments.items()}
+
+    def heartbeat(self):
+        """Tell the supervisor of every segment that the application is alive."""
+        for segment in self.segments.values():
+            segment.heartbeat()
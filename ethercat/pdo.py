@@ -0,0 +1,151 @@
+# This Python file uses the following encoding: utf-8
+"""Process data layouts of the drives and the in-place process image."""
+import ctypes
+
+
+class InputPdo(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [
+        ('modes_of_operation_display', ctypes.c_int8),
+        ('statusword', ctypes.c_uint16),
+        ('position_demand_value', ctypes.c_int32),
+        ('position_actual_value', ctypes.c_int32),
+        ('velocity_demand_value', ctypes.c_int32),
+        ('velocity_actual_value', ctypes.c_int32),
+        ('torque_demand_value', ctypes.c_int32),
+        ('torque_actual_value', ctypes.c_int32),
+        ('digital_input', ctypes.c_uint32),
+    ]
+
+
+class OutputPdo(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [
+        ('modes_of_operation', ctypes.c_int8),
+        ('controlword', ctypes.c_uint16),
+        ('target_position', ctypes.c_int32),
+        ('target_velocity', ctypes.c_int32),
+        ('target_torque', ctypes.c_int32),
+        ('digital_output', ctypes.c_uint32),
+    ]
+
+
+modes_of_operation = {
+    'No mode': 0,
+    'Profile position mode': 1,
+    'Profile velocity mode': 3,
+    'Profile Torque mode': 4,
+    'Homing mode': 6,
+    'Cyclic synchronous position mode': 8,
+    'Cyclic synchronous velocity mode': 9,
+    'Cyclic synchronous torque mode': 10,
+}
+
+
+def convert_input_data(data):
+    return InputPdo.from_buffer_copy(data)
+
+
+class SlaveImage:
+    """
+    Preallocated input/output buffers of one slave with the PDO structs mapped onto them.
+
+    `inputs` and `outputs` are InputPdo/OutputPdo instances created with
+    from_buffer(), so reading or writing a field works directly on the
+    buffer and no struct is allocated per cycle. in_buf/out_buf are
+    writable memoryviews of the process data size to map onto instead of
+    buffers of its own, ProcessImage passes slices of one block.
+    """
+
+    def __init__(self, slave, input_type=InputPdo, output_type=OutputPdo, in_buf=None, out_buf=None):
+        if len(slave.input) < ctypes.sizeof(input_type) or len(slave.output) < ctypes.sizeof(output_type):
+            raise ValueError(f"Process data of slave {slave.name} does not match "
+                             f"{input_type.__name__}/{output_type.__name__}")
+        self.slave = slave
+        self.input_type = input_type
+        self.output_type = output_type
+        self._in_buf = in_buf if in_buf is not None else bytearray(len(slave.input))
+        self._out_buf = out_buf if out_buf is not None else bytearray(len(slave.output))
+        self._in_view = memoryview(self._in_buf)
+        self.inputs = input_type.from_buffer(self._in_buf)
+        self.outputs = output_type.from_buffer(self._out_buf)
+
+    def read_inputs(self):
+        # the bytes returned by the stack are copied into the mapped buffer in place
+        self._in_view[:] = self.slave.input
+
+    def write_outputs(self):
+        # the stack takes a bytes object, that is the only copy of the outputs
+        self.slave.output = bytes(self._out_buf)
+
+    def clear_outputs(self):
+        ctypes.memset(ctypes.addressof(self.outputs), 0, len(self._out_buf))
+
+    @property
+    def input_buffer(self):
+        return self._in_view
+
+    @property
+    def output_buffer(self):
+        return memoryview(self._out_buf)
+
+
+class ProcessImage:
+    """
+    One SlaveImage per slave, e.g. ProcessImage(master.slaves) after config_map().
+
+    With strict=False, slaves whose process data does not match the structs
+    get None instead of a SlaveImage and are left out of the exchange.
+    `layouts` gives a PdoLayout per slave (see pdo_mapping.discover_layouts),
+    its structs replace input_type/output_type wherever it is not None.
+
+    The buffers of all slaves are slices of one input and one output block
+    in bus order, `input_offsets`/`output_offsets` give where each slave
+    starts. pdo_array.array_views() maps NumPy arrays over a run of them.
+    """
+
+    def __init__(self, slaves, input_type=InputPdo, output_type=OutputPdo, strict=True, layouts=None):
+        slaves = list(slaves)
+        self.input_offsets = []
+        self.output_offsets = []
+        in_size = out_size = 0
+        for slave in slaves:
+            self.input_offsets.append(in_size)
+            self.output_offsets.append(out_size)
+            in_size += len(slave.input)
+            out_size += len(slave.output)
+        self.input_buffer = memoryview(bytearray(in_size))
+        self.output_buffer = memoryview(bytearray(out_size))
+        self.slaves = []
+        for i, slave in enumerate(slaves):
+            layout = layouts[i] if layouts is not None else None
+            in_buf = self.input_buffer[self.input_offsets[i]:self.input_offsets[i] + len(slave.input)]
+            out_buf = self.output_buffer[self.output_offsets[i]:self.output_offsets[i] + len(slave.output)]
+            try:
+                if layout is not None:
+                    self.slaves.append(SlaveImage(slave, layout.input_type, layout.output_type, in_buf, out_buf))
+                else:
+                    self.slaves.append(SlaveImage(slave, input_type, output_type, in_buf, out_buf))
+            except ValueError:
+                if strict:
+                    raise
+                self.slaves.append(None)
+        self._mapped = [slave_image for slave_image in self.slaves if slave_image is not None]
+
+    def __len__(self):
+        return len(self.slaves)
+
+    def __getitem__(self, index):
+        return self.slaves[index]
+
+    def read_inputs(self):
+        for slave_image in self._mapped:
+            slave_image.read_inputs()
+
+    def write_outputs(self):
+        for slave_image in self._mapped:
+            slave_image.write_outputs()
+
+    def clear_outputs(self):
+        for slave_image in self._mapped:
+            slave_image.clear_outputs()
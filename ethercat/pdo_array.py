@@ -0,0 +1,79 @@
+# This Python file uses the following encoding: utf-8
+"""NumPy structured arrays over the process image, one row per slave."""
+import ctypes
+
+import numpy as np
+
+# ctypes field types and their little-endian NumPy equivalents
+_NUMPY_TYPES = {
+    ctypes.c_int8: 'i1',
+    ctypes.c_uint8: 'u1',
+    ctypes.c_int16: '<i2',
+    ctypes.c_uint16: '<u2',
+    ctypes.c_int32: '<i4',
+    ctypes.c_uint32: '<u4',
+    ctypes.c_int64: '<i8',
+    ctypes.c_uint64: '<u8',
+    ctypes.c_float: '<f4',
+    ctypes.c_double: '<f8',
+}
+
+
+def dtype_from_struct(struct_type, itemsize=None):
+    """
+    Build a structured dtype with the same field names and offsets as a ctypes struct.
+
+    :param struct_type: ctypes.Structure subclass such as InputPdo.
+    :param itemsize: row size in bytes, defaults to sizeof(struct_type). A larger
+        value leaves room for objects mapped behind the known fields.
+    """
+    names, formats, offsets = [], [], []
+    for name, field_type in struct_type._fields_:
+        # arrays, e.g. the gaps of a mapped PdoLayout, become subarray fields
+        if hasattr(field_type, '_length_'):
+            element, shape = field_type._type_, (field_type._length_,)
+        else:
+            element, shape = field_type, ()
+        if element not in _NUMPY_TYPES:
+            raise TypeError(f"Unsupported field type {field_type.__name__} of {name}")
+        names.append(name)
+        formats.append((_NUMPY_TYPES[element], shape) if shape else _NUMPY_TYPES[element])
+        offsets.append(getattr(struct_type, name).offset)
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': itemsize or ctypes.sizeof(struct_type),
+    })
+
+
+def array_views(image, start=0, stop=None):
+    """
+    Inputs and outputs of image[start:stop] as structured arrays, one row per slave.
+
+    The arrays are views on the buffers of the ProcessImage, so they work
+    with the CyclicWorker and Supervisor exchanging that image, e.g.
+    outputs['target_velocity'][:] = 500 sets every axis in one operation.
+    All slaves of the range must be mapped with the same structs and have
+    the same process data sizes, returns (inputs, outputs).
+    """
+    positions = range(len(image))[start:stop]
+    if not positions:
+        raise ValueError("No slaves for the array views")
+    first = image[positions[0]]
+    for position in positions:
+        slave_image = image[position]
+        if (slave_image is None
+                or slave_image.input_type is not first.input_type
+                or slave_image.output_type is not first.output_type
+                or len(slave_image.input_buffer) != len(first.input_buffer)
+                or len(slave_image.output_buffer) != len(first.output_buffer)):
+            raise ValueError(f"Slave {position} is not mapped like slave {positions[0]}")
+    input_dtype = dtype_from_struct(first.input_type, len(first.input_buffer))
+    output_dtype = dtype_from_struct(first.output_type, len(first.output_buffer))
+    # the slaves follow each other in the blocks, so the rows are back to back
+    inputs = np.frombuffer(image.input_buffer, dtype=input_dtype, count=len(positions),
+                           offset=image.input_offsets[positions[0]])
+    outputs = np.frombuffer(image.output_buffer, dtype=output_dtype, count=len(positions),
+                            offset=image.output_offsets[positions[0]])
+    return inputs, outputs
@@ -0,0 +1,212 @@
+# This Python file uses the following encoding: utf-8
+"""PDO layouts read from the slaves themselves instead of the fixed InputPdo/OutputPdo."""
+import ctypes
+import struct
+import threading
+
+# CiA-402 objects, field name (the one InputPdo/OutputPdo use where they have
+# it) and whether the value is signed; the size comes from the mapping entry
+OBJECTS = {
+    (0x603F, 0): ('error_code', False),
+    (0x6040, 0): ('controlword', False),
+    (0x6041, 0): ('statusword', False),
+    (0x6060, 0): ('modes_of_operation', True),
+    (0x6061, 0): ('modes_of_operation_display', True),
+    (0x6062, 0): ('position_demand_value', True),
+    (0x6064, 0): ('position_actual_value', True),
+    (0x606B, 0): ('velocity_demand_value', True),
+    (0x606C, 0): ('velocity_actual_value', True),
+    (0x6071, 0): ('target_torque', True),
+    (0x6072, 0): ('max_torque', False),
+    (0x6074, 0): ('torque_demand_value', True),
+    (0x6077, 0): ('torque_actual_value', True),
+    (0x6078, 0): ('current_actual_value', True),
+    (0x607A, 0): ('target_position', True),
+    (0x60B0, 0): ('position_offset', True),
+    (0x60B1, 0): ('velocity_offset', True),
+    (0x60B2, 0): ('torque_offset', True),
+    (0x60B8, 0): ('touch_probe_function', False),
+    (0x60B9, 0): ('touch_probe_status', False),
+    (0x60BA, 0): ('touch_probe_1_positive_edge', True),
+    (0x60F4, 0): ('following_error_actual_value', True),
+    (0x60FD, 0): ('digital_input', False),
+    (0x60FE, 1): ('digital_output', False),
+    (0x60FF, 0): ('target_velocity', True),
+}
+
+_INTEGERS = {
+    (8, True): ctypes.c_int8, (8, False): ctypes.c_uint8,
+    (16, True): ctypes.c_int16, (16, False): ctypes.c_uint16,
+    (32, True): ctypes.c_int32, (32, False): ctypes.c_uint32,
+    (64, True): ctypes.c_int64, (64, False): ctypes.c_uint64,
+}
+
+# sync manager PDO assignment objects
+RX_ASSIGNMENT = 0x1C12
+TX_ASSIGNMENT = 0x1C13
+
+
+def decode_entry(entry):
+    """(index, subindex, bits) of a 0x16xx/0x1Axx mapping entry."""
+    return entry >> 16, (entry >> 8) & 0xFF, entry & 0xFF
+
+
+def _read(slave, index, subindex, fmt):
+    data = slave.sdo_read(index, subindex)
+    return struct.unpack_from(fmt, data.ljust(struct.calcsize(fmt), b'\0'))[0]
+
+
+def read_entries(slave, assignment):
+    """(index, subindex, bits) of every object mapped by the PDOs assigned in 0x1C12 or 0x1C13."""
+    entries = []
+    for i in range(1, _read(slave, assignment, 0, '<B') + 1):
+        pdo = _read(slave, assignment, i, '<H')
+        for j in range(1, _read(slave, pdo, 0, '<B') + 1):
+            entries.append(decode_entry(_read(slave, pdo, j, '<I')))
+    return entries
+
+
+def build_struct(name, entries):
+    """
+    Packed ctypes struct with one field per mapping entry.
+
+    Known objects get their OBJECTS name, others obj_IIII_SS. Gaps (index 0)
+    and entries that are not whole bytes become byte arrays named
+    `_gap_<offset>`, so the offsets of every following field stay right.
+    """
+    fields = []
+    names = set()
+    bits = 0
+    gap = 0
+    for index, subindex, size in entries:
+        known = OBJECTS.get((index, subindex))
+        field_type = None
+        if index and size % 8 == 0 and bits % 8 == 0:
+            signed = known[1] if known else False
+            field_type = _INTEGERS.get((size, signed)) or ctypes.c_uint8 * (size // 8)
+        if field_type is None:
+            gap += size
+        else:
+            if gap:
+                fields.append((f'_gap_{(bits - gap) // 8}', ctypes.c_uint8 * ((gap + 7) // 8)))
+                gap = 0
+            field = known[0] if known else f'obj_{index:04X}_{subindex:02X}'
+            if field in names:
+                field = f'{field}_{len(fields)}'
+            names.add(field)
+            fields.append((field, field_type))
+        bits += size
+    if gap:
+        fields.append((f'_gap_{(bits - gap) // 8}', ctypes.c_uint8 * ((gap + 7) // 8)))
+    return type(name, (ctypes.Structure,), {'_pack_': 1, '_fields_': fields})
+
+
+class PdoLayout:
+    """
+    Input and output structs of one slave type, built from its PDO mapping.
+
+    input_type/output_type are used like InputPdo/OutputPdo, e.g. for a
+    SlaveImage; input_dtype/output_dtype are the NumPy equivalents and
+    only built (and NumPy only imported) when asked for.
+
+    :param rx_entries: (index, subindex, bits) of the outputs, from 0x1C12.
+    :param tx_entries: (index, subindex, bits) of the inputs, from 0x1C13.
+    """
+
+    def __init__(self, name, rx_entries, tx_entries):
+        self.name = name
+        self.rx_entries = list(rx_entries)
+        self.tx_entries = list(tx_entries)
+        type_name = ''.join(c for c in name.title() if c.isalnum()) or 'Slave'
+        self.input_type = build_struct(f'{type_name}Inputs', self.tx_entries)
+        self.output_type = build_struct(f'{type_name}Outputs', self.rx_entries)
+        self._dtypes = None
+
+    def _build_dtypes(self):
+        from ethercat.pdo_array import dtype_from_struct
+        self._dtypes = dtype_from_struct(self.input_type), dtype_from_struct(self.output_type)
+
+    @property
+    def input_dtype(self):
+        if self._dtypes is None:
+            self._build_dtypes()
+        return self._dtypes[0]
+
+    @property
+    def output_dtype(self):
+        if self._dtypes is None:
+            self._build_dtypes()
+        return self._dtypes[1]
+
+    def matches(self, slave):
+        """True if the structs cover the process data the master mapped for slave."""
+        return (len(slave.input) == ctypes.sizeof(self.input_type)
+                and len(slave.output) == ctypes.sizeof(self.output_type))
+
+    def entries(self):
+        """Picklable description, PdoLayout(*layout.entries()) builds the same layout."""
+        return self.name, self.rx_entries, self.tx_entries
+
+    def __repr__(self):
+        return (f"PdoLayout({self.name}: {ctypes.sizeof(self.input_type)} bytes in, "
+                f"{ctypes.sizeof(self.output_type)} bytes out)")
+
+
+# one layout per slave type, read from the first slave of that type
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def slave_key(slave):
+    return slave.man, slave.id, slave.rev
+
+
+def layout_for(slave):
+    """
+    The PdoLayout of slave, read by SDO only for the first slave of its type.
+
+    Returns None if the slave has no readable mapping (no CoE, or a fixed
+    mapping from the SII only); the fixed InputPdo/OutputPdo are used then.
+    """
+    key = slave_key(slave)
+    with _layouts_lock:
+        if key in _layouts:
+            return _layouts[key]
+    try:
+        layout = PdoLayout(slave.name, read_entries(slave, RX_ASSIGNMENT), read_entries(slave, TX_ASSIGNMENT))
+    except Exception as e:
+        print(f"PDO mapping of {slave.name} not readable, using the fixed layout: {e}")
+        layout = None
+    with _layouts_lock:
+        return _layouts.setdefault(key, layout)
+
+
+def layout_from_entries(key, name, rx_entries, tx_entries):
+    """Cached PdoLayout from entries read elsewhere, e.g. by a CyclicProcess."""
+    with _layouts_lock:
+        layout = _layouts.get(key)
+        if layout is None:
+            layout = _layouts[key] = PdoLayout(name, rx_entries, tx_entries)
+        return layout
+
+
+def discover_layouts(slaves):
+    """
+    PdoLayout of every slave (None where the mapping is unknown or does not match).
+
+    Call in PRE-OP or later, after config_map() so the sizes can be checked.
+    """
+    layouts = []
+    for slave in slaves:
+        layout = layout_for(slave)
+        if layout is not None and not layout.matches(slave):
+            print(f"PDO mapping of {slave.name} does not match its process data "
+                  f"({len(slave.input)}/{len(slave.output)} bytes), using the fixed layout")
+            layout = None
+        layouts.append(layout)
+    return layouts
+
+
+def clear_cache():
+    with _layouts_lock:
+        _layouts.clear()
@@ -0,0 +1,98 @@
+# This Python file uses the following encoding: utf-8
+"""Small status panel with the working counter and error statistics of every segment."""
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor
+from PySide6.QtWidgets import QLabel, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
+
+# Refresh rate of the counters, the table of ESC error counters is rebuilt every ERRORS_EVERY refreshes
+REFRESH_HZ = 2
+ERRORS_EVERY = 2
+
+# A segment is shown as degraded above this share of bad cycles in the rolling window
+DEGRADED_RATE = 0.001
+
+_OK = QColor('#2ca02c')
+_DEGRADED = QColor('#ff7f0e')
+_DOWN = QColor('#d62728')
+
+
+class BusStatusWindow(QWidget):
+    """
+    Lost frames, timeouts and working counter mismatches of every segment of
+    a MasterManager, with the ESC error counters of every slave below.
+
+    Nothing is read from the bus here: the segments read the error counters
+    in the background, the window only shows their last snapshot.
+
+    :param manager: MasterManager whose segments are shown.
+    """
+
+    def __init__(self, manager, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Bus status")
+        self.manager = manager
+        self.summary = QLabel(self)
+        self.summary.setTextFormat(Qt.RichText)
+        self.slaves = QTableWidget(0, 3, self)
+        self.slaves.setHorizontalHeaderLabels(["Slave", "Errors", "Counters"])
+        self.slaves.horizontalHeader().setStretchLastSection(True)
+        self.slaves.verticalHeader().setVisible(False)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary)
+        layout.addWidget(self.slaves)
+        self.resize(520, 360)
+
+        self._refreshes = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000 // REFRESH_HZ)
+        self.refresh()
+
+    def refresh(self):
+        lines = []
+        for adapter, segment in self.manager.segments.items():
+            stats = segment.bus_stats()
+            if stats is None:
+                lines.append(f"<b>{adapter}</b>: no cyclic exchange")
+                continue
+            bad = stats['lost_frame_rate'] + stats['timeout_rate'] + stats['wkc_mismatch_rate']
+            if stats['last_wkc'] is None or stats['last_wkc'] < 0:
+                color = _DOWN
+            elif bad > DEGRADED_RATE:
+                color = _DEGRADED
+            else:
+                color = _OK
+            lines.append(
+                f"<b style='color:{color.name()}'>{adapter}</b>: "
+                f"WKC {stats['last_wkc']}/{stats['expected_wkc']} (lowest {stats['lowest_wkc']}), "
+                f"lost frames {stats['lost_frames']} ({stats['lost_frame_rate']:.2%}), "
+                f"timeouts {stats['timeouts']} ({stats['timeout_rate']:.2%}), "
+                f"WKC mismatches {stats['wkc_mismatches']} ({stats['wkc_mismatch_rate']:.2%})")
+        self.summary.setText("<br>".join(lines) or "No adapter open")
+
+        if self._refreshes % ERRORS_EVERY == 0:
+            self.refresh_errors()
+        self._refreshes += 1
+
+    def refresh_errors(self):
+        rows = [repr(axis) for axis in self.manager.axes()]
+        counters = []
+        for segment in self.manager.segments.values():
+            counters.extend(segment.error_counters())
+        self.slaves.setRowCount(len(rows))
+        for row, (name, errors) in enumerate(zip(rows, counters)):
+            self.slaves.setItem(row, 0, QTableWidgetItem(name))
+            if errors is None:
+                total = QTableWidgetItem("-")
+                detail = QTableWidgetItem("not readable")
+            else:
+                total = QTableWidgetItem(str(errors.total()))
+                if errors.total():
+                    total.setForeground(_DEGRADED)
+                detail = QTableWidgetItem(", ".join(f"{register} {count}" for register, count in errors.nonzero().items()))
+            self.slaves.setItem(row, 1, total)
+            self.slaves.setItem(row, 2, detail)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
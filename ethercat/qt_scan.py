@@ -0,0 +1,91 @@
+# This Python file uses the following encoding: utf-8
+"""Qt front end of ethercat.scan, runs the scans on a QThread and streams the results."""
+import threading
+
+from PySide6.QtCore import QObject, QThread, Signal
+
+from ethercat import scan
+
+
+class _ScanThread(QThread):
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.job = job
+
+    def run(self):
+        self.job()
+
+
+class ScanService(QObject):
+    """
+    Background adapter discovery and bus scan for the widgets.
+
+    Results arrive through the signals on the GUI thread while the scan is
+    still running. Only one scan runs at a time, cancel() aborts it.
+    """
+
+    adapterFound = Signal(str, str)
+    adaptersDone = Signal(int)
+    slaveFound = Signal(int, str)
+    busOpened = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._thread = None
+        self._cancel = threading.Event()
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.isRunning()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _start(self, job):
+        if self.busy:
+            self.failed.emit('A scan is already running')
+            return False
+        self._cancel = threading.Event()
+        self._thread = _ScanThread(job, self)
+        self._thread.start()
+        return True
+
+    def find_adapters(self):
+        def job():
+            try:
+                adapters = scan.find_adapters(self.adapterFound.emit, self._cancel)
+                self.adaptersDone.emit(len(adapters))
+            except scan.ScanCancelled:
+                self.failed.emit('Adapter scan cancelled')
+            except Exception as e:
+                self.failed.emit(str(e))
+
+        return self._start(job)
+
+    def open_bus(self, adapter, timeout=10.0, opener=scan.open_bus):
+        """
+        Open adapter in the background, busOpened carries what opener returned.
+
+        opener has the signature of scan.open_bus(), e.g. MasterManager.opener(), which opens
+        a CyclicProcess with processes=True; MasterManager.add() turns the result into a segment.
+        MasterManager.starter() also starts the segment in the background, busOpened then
+        carries the running segment for MasterManager.attach().
+        """
+        def job():
+            try:
+                master = opener(
+                    adapter,
+                    lambda position, slave: self.slaveFound.emit(position, str(getattr(slave, 'name', slave))),
+                    self._cancel, timeout)
+                self.busOpened.emit(master)
+            except scan.ScanCancelled:
+                self.failed.emit('Bus scan cancelled')
+            except Exception as e:
+                self.failed.emit(str(e))
+
+        return self._start(job)
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.wait()
@@ -0,0 +1,109 @@
+# This Python file uses the following encoding: utf-8
+"""Live trend window for InputPdo fields of running axes."""
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor, QPainter, QPen
+from PySide6.QtWidgets import QHBoxLayout, QListWidget, QListWidgetItem, QWidget
+
+from ethercat.pdo import InputPdo
+from ethercat.trend import TrendBuffer, minmax_decimate
+
+# Redraw rate of the window, independent of the cycle time
+REFRESH_HZ = 25
+
+COLORS = ['#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd', '#8c564b', '#e377c2', '#17becf']
+
+
+class TrendPlot(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.buffer = None
+        self.setMinimumSize(400, 250)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        if self.buffer is None or not self.buffer.count:
+            return
+        width = max(self.width(), 1)
+        height = self.height()
+        columns = [(field, name, minmax_decimate(self.buffer.latest(trace, self.buffer.capacity), width))
+                   for name, field, trace in self.buffer.traces]
+        low = min((c[0] for _, _, cols in columns for c in cols), default=0)
+        high = max((c[1] for _, _, cols in columns for c in cols), default=0)
+        span = (high - low) or 1.0
+
+        def y(value):
+            return height - 1 - (value - low) * (height - 20) / span - 10
+
+        for i, (field, name, cols) in enumerate(columns):
+            painter.setPen(QPen(QColor(COLORS[i % len(COLORS)])))
+            # one vertical line per pixel column from its min to its max
+            offset = width - len(cols)
+            for x, (vmin, vmax) in enumerate(cols):
+                painter.drawLine(offset + x, int(y(vmin)), offset + x, int(y(vmax)))
+            painter.drawText(5, 15 + 15 * i, f"{name} {field}")
+        painter.setPen(QPen(Qt.black))
+        painter.drawText(width - 120, 15, f"max {high:g}")
+        painter.drawText(width - 120, height - 5, f"min {low:g}")
+
+
+class TrendWindow(QWidget):
+    """
+    Trend of the checked InputPdo fields of some axes.
+
+    Sampling happens in a CyclicWorker callback that only exists while the
+    window is open, the picture is redrawn REFRESH_HZ times a second from
+    the buffer no matter how fast the cycle runs.
+
+    :param worker: CyclicWorker of the segment the axes belong to.
+    :param slaves: (name, inputs) of every traced axis.
+    """
+
+    def __init__(self, worker, slaves, fields=('velocity_actual_value', 'torque_actual_value'),
+                 capacity=10000, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Trend")
+        self.worker = worker
+        self.slaves = list(slaves)
+        self.capacity = capacity
+        self.buffer = None
+
+        self.fields = QListWidget(self)
+        # the fields of the first axis, its layout may differ from InputPdo
+        layout = type(self.slaves[0][1]) if self.slaves else InputPdo
+        for name, _ in layout._fields_:
+            if name.startswith('_gap_'):
+                continue
+            item = QListWidgetItem(name, self.fields)
+            item.setCheckState(Qt.Checked if name in fields else Qt.Unchecked)
+        self.fields.itemChanged.connect(self.fields_changed)
+        self.fields.setMaximumWidth(220)
+        self.plot = TrendPlot(self)
+        layout = QHBoxLayout(self)
+        layout.addWidget(self.fields)
+        layout.addWidget(self.plot)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.plot.update)
+        self.timer.start(1000 // REFRESH_HZ)
+        self.fields_changed()
+
+    def checked_fields(self):
+        return [self.fields.item(i).text() for i in range(self.fields.count())
+                if self.fields.item(i).checkState() == Qt.Checked]
+
+    def fields_changed(self, item=None):
+        self.detach()
+        self.buffer = TrendBuffer(self.slaves, self.checked_fields(), self.capacity)
+        self.plot.buffer = self.buffer
+        self.worker.add_callback(self.buffer.sample)
+
+    def detach(self):
+        if self.buffer is not None:
+            self.worker.remove_callback(self.buffer.sample)
+            self.buffer = None
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.detach()
+        super().closeEvent(event)
@@ -0,0 +1,273 @@
+# This Python file uses the following encoding: utf-8
+"""High-rate recording of the raw input process data to a compact binary file."""
+import ctypes
+import mmap
+import os
+import struct
+import threading
+import time
+
+from ethercat.pdo import InputPdo
+
+# File layout:
+#   header    HEADER_SIZE bytes, _HEADER, then one _SLAVE per slave, then
+#             every distinct input layout as _LAYOUT followed by one _FIELD
+#             per struct field
+#   samples   sample_count * sample_size bytes, each sample is a little-endian
+#             uint64 timestamp in ns followed by the raw inputs of every slave
+MAGIC = b'ECTR'
+VERSION = 2
+HEADER_SIZE = 4096
+
+# magic, version, slave count, layout count, sample size, sample count
+_HEADER = struct.Struct('<4sHHHxxIQ')
+# record size, layout number
+_SLAVE = struct.Struct('<IHxx')
+# struct size, field count
+_LAYOUT = struct.Struct('<IHxx')
+# name, ctypes type code, offset, size
+_FIELD = struct.Struct('<32scxHH')
+_TIMESTAMP = struct.Struct('<Q')
+
+_SIMPLE_TYPES = {t._type_: t for t in (
+    ctypes.c_int8, ctypes.c_uint8, ctypes.c_int16, ctypes.c_uint16,
+    ctypes.c_int32, ctypes.c_uint32, ctypes.c_int64, ctypes.c_uint64,
+    ctypes.c_float, ctypes.c_double)}
+
+
+class TelemetryRecorder:
+    """
+    Records every cycle's raw inputs with a timestamp.
+
+    record() only copies the inputs into a preallocated ring buffer and is
+    meant to be registered as a CyclicWorker callback. A writer thread moves
+    the samples from the ring into a memory-mapped file that grows in chunks
+    of `chunk_samples`. When the writer falls behind, samples are dropped
+    and counted instead of slowing down the cycle.
+
+    :param path: output file.
+    :param sources: one buffer per slave with its raw inputs, e.g. the
+        input_buffer of every SlaveImage.
+    :param layouts: ctypes struct describing the inputs of each slave, or
+        one struct for all of them.
+    :param capacity: samples the ring buffer holds.
+    """
+
+    def __init__(self, path, sources, layouts=InputPdo, capacity=8192, chunk_samples=65536):
+        self.path = path
+        self.sources = [memoryview(source) for source in sources]
+        if not self.sources:
+            raise ValueError("Nothing to record")
+        if isinstance(layouts, type):
+            layouts = [layouts] * len(self.sources)
+        self.layouts = list(layouts)
+        if len(self.layouts) != len(self.sources):
+            raise ValueError("One layout per slave is needed")
+        for source, layout in zip(self.sources, self.layouts):
+            if len(source) < ctypes.sizeof(layout):
+                raise ValueError(f"{layout.__name__} is bigger than the {len(source)} bytes of inputs")
+        # the header describes every layout once
+        self._distinct = list(dict.fromkeys(self.layouts))
+        self.record_sizes = [len(source) for source in self.sources]
+        self.sample_size = _TIMESTAMP.size + sum(self.record_sizes)
+        self.capacity = capacity
+        self.chunk_samples = chunk_samples
+        self.dropped = 0
+        self.written = 0
+
+        self._ring = bytearray(capacity * self.sample_size)
+        self._ring_view = memoryview(self._ring)
+        # the cyclic thread only advances _head, the writer only _tail
+        self._head = 0
+        self._tail = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._file = None
+        self._map = None
+        self._map_start = 0
+        self._map_samples = 0
+
+    @classmethod
+    def from_image(cls, path, image, **kwargs):
+        """Recorder for every mapped slave of a ProcessImage, each with its own layout."""
+        mapped = [slave_image for slave_image in image.slaves if slave_image is not None]
+        kwargs.setdefault('layouts', [type(slave_image.inputs) for slave_image in mapped])
+        return cls(path, [slave_image.input_buffer for slave_image in mapped], **kwargs)
+
+    def record(self, wkc=None):
+        """Append the current inputs, called once per cycle on the cyclic thread."""
+        head = self._head
+        if head - self._tail >= self.capacity:
+            self.dropped += 1
+            return
+        offset = (head % self.capacity) * self.sample_size
+        _TIMESTAMP.pack_into(self._ring, offset, time.time_ns())
+        offset += _TIMESTAMP.size
+        view = self._ring_view
+        for source, size in zip(self.sources, self.record_sizes):
+            view[offset:offset + size] = source
+            offset += size
+        self._head = head + 1
+
+    def _header_size(self):
+        return (_HEADER.size + len(self.layouts) * _SLAVE.size
+                + sum(_LAYOUT.size + len(layout._fields_) * _FIELD.size for layout in self._distinct))
+
+    def _write_header(self, sample_count):
+        header = bytearray(HEADER_SIZE)
+        _HEADER.pack_into(header, 0, MAGIC, VERSION, len(self.sources), len(self._distinct), self.sample_size,
+                          sample_count)
+        offset = _HEADER.size
+        for size, layout in zip(self.record_sizes, self.layouts):
+            _SLAVE.pack_into(header, offset, size, self._distinct.index(layout))
+            offset += _SLAVE.size
+        for layout in self._distinct:
+            _LAYOUT.pack_into(header, offset, ctypes.sizeof(layout), len(layout._fields_))
+            offset += _LAYOUT.size
+            for name, field_type in layout._fields_:
+                descriptor = getattr(layout, name)
+                if hasattr(field_type, '_length_'):
+                    # arrays, e.g. gaps of a mapped layout, are stored as their element type, the size gives the length
+                    code = field_type._type_._type_
+                else:
+                    code = field_type._type_
+                _FIELD.pack_into(header, offset, name.encode(), code.encode(), descriptor.offset, descriptor.size)
+                offset += _FIELD.size
+        return header
+
+    def _update_count(self):
+        _HEADER.pack_into(self._header_map, 0, MAGIC, VERSION, len(self.sources), len(self._distinct),
+                          self.sample_size, self.written)
+
+    def _map_chunk(self):
+        if self._map is not None:
+            self._map.close()
+        self._map_start = self.written
+        self._map_samples = self.chunk_samples
+        start = HEADER_SIZE + self._map_start * self.sample_size
+        length = self.chunk_samples * self.sample_size
+        os.ftruncate(self._file.fileno(), start + length)
+        # mmap offsets must be page aligned
+        aligned = start - start % mmap.ALLOCATIONGRANULARITY
+        self._map = mmap.mmap(self._file.fileno(), length + start - aligned, offset=aligned)
+        self._map_offset = start - aligned
+
+    def start(self):
+        if self._header_size() > HEADER_SIZE:
+            raise ValueError("Too many slaves or fields for the file header")
+        self._file = open(self.path, 'w+b')
+        self._file.write(self._write_header(0))
+        self._file.flush()
+        self._header_map = mmap.mmap(self._file.fileno(), HEADER_SIZE)
+        self._map_chunk()
+        self._thread = threading.Thread(target=self._run, name="Telemetry writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _flush_ring(self):
+        while self._tail < self._head:
+            if self.written - self._map_start >= self._map_samples:
+                self._map_chunk()
+            # copy as many samples as fit without wrapping the ring or the chunk
+            first = self._tail % self.capacity
+            count = min(self._head - self._tail,
+                        self.capacity - first,
+                        self._map_samples - (self.written - self._map_start))
+            src = first * self.sample_size
+            dst = self._map_offset + (self.written - self._map_start) * self.sample_size
+            length = count * self.sample_size
+            self._map[dst:dst + length] = self._ring_view[src:src + length]
+            self._tail += count
+            self.written += count
+        self._update_count()
+
+    def _run(self):
+        while not self._stop_event.wait(0.05):
+            self._flush_ring()
+        self._flush_ring()
+
+    def stop(self):
+        """Write the remaining samples and close the file."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self._map.close()
+        self._header_map.flush()
+        self._header_map.close()
+        # cut the unused part of the last chunk
+        self._file.truncate(HEADER_SIZE + self.written * self.sample_size)
+        self._file.close()
+
+
+def _read_fields(header, offset, field_count, name):
+    fields = []
+    for i in range(field_count):
+        field_name, code, _, size = _FIELD.unpack_from(header, offset + i * _FIELD.size)
+        field_type = _SIMPLE_TYPES[code.decode()]
+        if size != ctypes.sizeof(field_type):
+            field_type = field_type * (size // ctypes.sizeof(field_type))
+        fields.append((field_name.rstrip(b'\0').decode(), field_type))
+    return type(name, (ctypes.Structure,), {'_pack_': 1, '_fields_': fields})
+
+
+def _read_layouts(header):
+    """(sample count, [(record size, input struct)] of every slave) from a file header."""
+    magic, version, slave_count, layout_count, _, sample_count = _HEADER.unpack_from(header, 0)
+    if magic != MAGIC:
+        raise ValueError("not a telemetry recording")
+    if version != VERSION:
+        raise ValueError(f"recording version {version} is not supported, only {VERSION}")
+    offset = _HEADER.size
+    slaves = [_SLAVE.unpack_from(header, offset + i * _SLAVE.size) for i in range(slave_count)]
+    offset += slave_count * _SLAVE.size
+    distinct = []
+    for i in range(layout_count):
+        _, field_count = _LAYOUT.unpack_from(header, offset)
+        offset += _LAYOUT.size
+        distinct.append(_read_fields(header, offset, field_count, f'RecordedInputs{i}'))
+        offset += field_count * _FIELD.size
+    return sample_count, [(record_size, distinct[index]) for record_size, index in slaves]
+
+
+def read_recording(path):
+    """
+    Read a recording, returns (info, samples).
+
+    info holds slave_count, sample_count and the rebuilt input struct of
+    every slave as 'layouts'; samples is a generator of
+    (timestamp_ns, [inputs of each slave in its layout]).
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    try:
+        sample_count, slaves = _read_layouts(header)
+    except struct.error:
+        raise ValueError(f"{path} is not a telemetry recording")
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}")
+    layouts = [layout for _, layout in slaves]
+    info = {
+        'slave_count': len(slaves),
+        'sample_count': sample_count,
+        'layouts': layouts,
+    }
+    offsets = []
+    offset = _TIMESTAMP.size
+    for record_size, _ in slaves:
+        offsets.append(offset)
+        offset += record_size
+    sample_size = offset
+
+    def samples():
+        with open(path, 'rb') as f:
+            f.seek(HEADER_SIZE)
+            for _ in range(sample_count):
+                data = f.read(sample_size)
+                if len(data) < sample_size:
+                    return
+                timestamp, = _TIMESTAMP.unpack_from(data, 0)
+                yield timestamp, [layout.from_buffer_copy(data, start) for layout, start in zip(layouts, offsets)]
+
+    return info, samples()
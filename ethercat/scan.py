@@ -0,0 +1,100 @@
+# This Python file uses the following encoding: utf-8
+"""Adapter discovery and bus enumeration that can be cancelled and timed out."""
+import threading
+
+from ethercat import backend
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+def find_adapters(on_adapter=None, cancel=None):
+    """
+    List the network adapters, calling on_adapter(name, desc) for each one.
+
+    :param cancel: optional threading.Event, stops reporting once set.
+    """
+    adapters = []
+    for adapter in backend.get().find_adapters():
+        if cancel is not None and cancel.is_set():
+            raise ScanCancelled()
+        adapters.append(adapter)
+        if on_adapter is not None:
+            on_adapter(adapter.name, adapter.desc)
+    return adapters
+
+
+def _run_abandonable(func, cancel, timeout, on_abandon):
+    """
+    Run func() on a helper thread and wait for it with a timeout.
+
+    SOEM calls cannot be interrupted, so on timeout or cancellation the
+    helper is left running and on_abandon(result) cleans up once it ends.
+    """
+    done = threading.Event()
+    outcome = {}
+    lock = threading.Lock()
+
+    def target():
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+        with lock:
+            done.set()
+            abandoned = outcome.get('abandoned', False)
+        if abandoned and 'result' in outcome:
+            on_abandon(outcome['result'])
+
+    threading.Thread(target=target, name="EtherCAT scan", daemon=True).start()
+    waited = 0.0
+    while not done.wait(0.05):
+        waited += 0.05
+        reason = None
+        if cancel is not None and cancel.is_set():
+            reason = ScanCancelled()
+        elif timeout is not None and waited >= timeout:
+            reason = TimeoutError(f"Bus scan did not finish within {timeout} s")
+        if reason is not None:
+            with lock:
+                if not done.is_set():
+                    outcome['abandoned'] = True
+                    raise reason
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def open_bus(adapter, on_slave=None, cancel=None, timeout=10.0):
+    """
+    Open a master on adapter and enumerate its slaves with config_init().
+
+    on_slave(position, slave) is called for every slave found. Returns the
+    opened master, raises TimeoutError or ScanCancelled; the master is
+    closed in those cases.
+    """
+    master = backend.get().Master()
+
+    def init():
+        master.open(adapter)
+        try:
+            count = master.config_init()
+        except Exception:
+            master.close()
+            raise
+        return count
+
+    count = _run_abandonable(init, cancel, timeout, lambda count: master.close())
+    try:
+        if count <= 0:
+            raise RuntimeError('no device found')
+        for position, slave in enumerate(master.slaves):
+            if cancel is not None and cancel.is_set():
+                raise ScanCancelled()
+            if on_slave is not None:
+                on_slave(position, slave)
+    except Exception:
+        master.close()
+        raise
+    return master
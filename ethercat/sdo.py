@@ -0,0 +1,124 @@
+# This Python file uses the following encoding: utf-8
+"""Declarative SDO parameter sets and a batched writer for many slaves."""
+import struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from ethercat.pdo import modes_of_operation
+
+# CoE data types as little-endian struct formats
+INT8 = '<b'
+UINT8 = '<B'
+INT16 = '<h'
+UINT16 = '<H'
+INT32 = '<i'
+UINT32 = '<I'
+
+
+class SdoParam(namedtuple('SdoParam', ['index', 'subindex', 'type', 'value', 'comment'])):
+    """One object dictionary entry to write: (index, subindex, type, value, comment)."""
+
+    def __new__(cls, index, subindex, type, value, comment=''):
+        return super().__new__(cls, index, subindex, type, value, comment)
+
+    def encode(self):
+        return struct.pack(self.type, self.value)
+
+
+# Vendor ID and product code of the TMCM-1617, TMCM1617_PARAMS are manufacturer objects of it
+TMCM1617_VENDOR_ID = 0x0286
+TMCM1617_PRODUCT_CODE = 0x1617
+
+TMCM1617_PARAMS = [
+    SdoParam(0x2003, 0, UINT32, 2000, 'limit maximum current'),
+    SdoParam(0x2041, 1, UINT16, 50, 'set torque control P value'),
+    SdoParam(0x2041, 2, UINT16, 20, 'set torque control I value'),
+    SdoParam(0x2050, 0, UINT8, 3, 'set motor type = BLDC'),
+    SdoParam(0x2055, 0, UINT8, 2, 'set commutation mode = Hall sensors'),
+    SdoParam(0x2070, 2, UINT8, 1, 'inverse hall direction'),
+    SdoParam(0x2070, 4, INT16, 10500, 'tune hall PHI_E offset'),
+]
+
+
+def is_tmcm1617(slave):
+    """True for a TMCM-1617, drives of other vendors must not get TMCM1617_PARAMS."""
+    return slave.man == TMCM1617_VENDOR_ID and slave.id == TMCM1617_PRODUCT_CODE
+
+
+def mode_param(mode):
+    """Mode of operation (0x6060) by name from modes_of_operation."""
+    return SdoParam(0x6060, 0, INT8, modes_of_operation[mode], 'mode of operation')
+
+
+def target_speed_param(target_speed):
+    return SdoParam(0x60FF, 0, INT32, target_speed, 'target velocity')
+
+
+def target_torque_param(target_torque):
+    return SdoParam(0x6071, 0, INT16, target_torque, 'target torque')
+
+
+def controlword_param(controlword):
+    return SdoParam(0x6040, 0, UINT16, controlword, 'controlword')
+
+
+def _group_writes(params, complete_access):
+    """
+    Split params into (index, subindex, data, ca) mailbox writes, keeping their order.
+
+    Entries of an index listed in complete_access are merged into one
+    complete access write when they cover subindex 1..n without gaps.
+    """
+    params = list(params)
+    groups = {}
+    for param in params:
+        if param.index in complete_access and param.subindex > 0:
+            groups.setdefault(param.index, []).append(param)
+    merged = set()
+    for index, group in groups.items():
+        if sorted(p.subindex for p in group) == list(range(1, len(group) + 1)):
+            merged.add(index)
+
+    writes = []
+    for param in params:
+        if param.index not in merged or param.subindex == 0:
+            writes.append((param.index, param.subindex, param.encode(), False))
+        elif param is groups[param.index][0]:
+            group = sorted(groups[param.index], key=lambda p: p.subindex)
+            writes.append((param.index, 1, b''.join(p.encode() for p in group), True))
+    return writes
+
+
+def apply_parameters(slave, params, complete_access=()):
+    """
+    Write a parameter set to one slave.
+
+    :param slave: pysoem slave in PRE-OP or higher.
+    :param params: iterable of SdoParam.
+    :param complete_access: indexes the drive accepts complete access writes for.
+    """
+    for index, subindex, data, ca in _group_writes(params, complete_access):
+        slave.sdo_write(index, subindex, data, ca)
+
+
+def configure_slaves(slaves, params, complete_access=(), max_workers=None):
+    """
+    Write the same parameter set to several slaves at once.
+
+    Every slave gets its own worker thread, so the mailbox round trips of
+    different slaves overlap instead of running one after another.
+    Returns a list of (slave, exception) for the slaves that failed.
+    """
+    slaves = list(slaves)
+    if not slaves:
+        return []
+    params = list(params)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers or len(slaves)) as executor:
+        futures = [(slave, executor.submit(apply_parameters, slave, params, complete_access))
+                   for slave in slaves]
+        for slave, future in futures:
+            error = future.exception()
+            if error is not None:
+                failed.append((slave, error))
+    return failed
@@ -0,0 +1,80 @@
+# This Python file uses the following encoding: utf-8
+"""Object dictionary cache per slave with write-through and change suppression."""
+
+
+class SdoCache:
+    """
+    Wraps a pysoem slave and remembers the last value written or read per (index, subindex).
+
+    sdo_write() skips the mailbox transfer when the cached value is the
+    same, sdo_read() answers from the cache unless refresh=True. All other
+    attributes are forwarded to the slave, so the cache can be passed
+    wherever a slave is expected (e.g. to apply_parameters()).
+
+    The cache is dropped whenever the EtherCAT state of the slave differs
+    from the state seen at the last access. Objects that are mapped into
+    the process data are overwritten by the cyclic exchange and should not
+    be read from the cache while the slave is in OP.
+    """
+
+    def __init__(self, slave):
+        self.slave = slave
+        self.hits = 0
+        self.transfers = 0
+        self._values = {}
+        self._state = slave.state
+
+    def __getattr__(self, name):
+        return getattr(self.slave, name)
+
+    def _check_state(self):
+        state = self.slave.state
+        if state != self._state:
+            self._values.clear()
+            self._state = state
+
+    def invalidate(self, index=None, subindex=None):
+        """Forget everything, one index, or one entry."""
+        if index is None:
+            self._values.clear()
+        elif subindex is None:
+            for key in [key for key in self._values if key[0] == index]:
+                del self._values[key]
+        else:
+            self._values.pop((index, subindex), None)
+
+    def sdo_write(self, index, subindex, data, ca=False, force=False):
+        """Write through to the slave unless the value is already there. Returns True if written."""
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError(f"SDO data must be bytes, not {type(data).__name__}")
+        self._check_state()
+        data = bytes(data)
+        key = (index, subindex)
+        if not ca and not force and self._values.get(key) == data:
+            self.hits += 1
+            return False
+        try:
+            self.slave.sdo_write(index, subindex, data, ca)
+        except Exception:
+            # the value on the slave is unknown after a failed write
+            self.invalidate(index, None if ca else subindex)
+            raise
+        self.transfers += 1
+        if ca:
+            # a complete access write covers every subindex of the object
+            self.invalidate(index)
+        else:
+            self._values[key] = data
+        return True
+
+    def sdo_read(self, index, subindex, size=0, ca=False, refresh=False):
+        self._check_state()
+        key = (index, subindex)
+        if not ca and not refresh and key in self._values:
+            self.hits += 1
+            return self._values[key]
+        data = self.slave.sdo_read(index, subindex, size, ca)
+        self.transfers += 1
+        if not ca:
+            self._values[key] = bytes(data)
+        return data
@@ -0,0 +1,55 @@
+# This Python file uses the following encoding: utf-8
+"""Runtime setpoints written into the cyclic output image, SDO only as fallback."""
+
+# CiA-402 objects and the OutputPdo field they are mapped to
+OUTPUT_OBJECTS = {
+    (0x6040, 0): 'controlword',
+    (0x6060, 0): 'modes_of_operation',
+    (0x607A, 0): 'target_position',
+    (0x60FF, 0): 'target_velocity',
+    (0x6071, 0): 'target_torque',
+    (0x60FE, 1): 'digital_output',
+}
+
+
+class SetpointWriter:
+    """
+    Applies SdoParam setpoints of one slave.
+
+    Objects mapped into the output image are written into the mapped field
+    and go out with the next cycle. Everything else is written with an
+    acyclic SDO through `sdo` (a slave or an SdoCache).
+
+    :param slave_image: SlaveImage of the slave, or None while no cyclic
+        exchange is running.
+    :param sdo: object with sdo_write(index, subindex, data, ca).
+    """
+
+    def __init__(self, slave_image, sdo):
+        self.slave_image = slave_image
+        self.sdo = sdo
+
+    @property
+    def cyclic(self):
+        return self.slave_image is not None
+
+    def pdo_field(self, index, subindex=0):
+        """Name of the output field index:subindex is mapped to, or None."""
+        if self.slave_image is None:
+            return None
+        field = OUTPUT_OBJECTS.get((index, subindex))
+        if field is None or not hasattr(self.slave_image.outputs, field):
+            return None
+        return field
+
+    def write(self, param):
+        """Write one SdoParam, returns 'pdo' or 'sdo' depending on the path taken."""
+        field = self.pdo_field(param.index, param.subindex)
+        if field is not None:
+            setattr(self.slave_image.outputs, field, param.value)
+            return 'pdo'
+        self.sdo.sdo_write(param.index, param.subindex, param.encode(), False)
+        return 'sdo'
+
+    def apply(self, params):
+        return [self.write(param) for param in params]
@@ -0,0 +1,648 @@
+# This Python file uses the following encoding: utf-8
+"""
+In-process simulation of an EtherCAT bus with CiA-402 drives.
+
+The module has the part of the pysoem API the applications use
+(find_adapters, Master, the slaves' sdo_read/sdo_write, input/output and
+the AL states), select it with ETHERCAT_BACKEND=sim or backend.use('sim').
+
+Every simulated drive has the InputPdo/OutputPdo process data, a CiA-402
+state machine driven by the controlword (0x6040) and a simple motion
+model for the velocity, position and torque modes. The drive runs in
+wall clock time, so it also moves when it is only commanded by SDO.
+Mailbox round trips take `config.mailbox_latency` seconds.
+"""
+import ctypes
+import os
+import random
+import struct
+import threading
+import time
+
+from ethercat.backend import (NONE_STATE, INIT_STATE, PREOP_STATE, BOOT_STATE, SAFEOP_STATE, OP_STATE,
+                              STATE_ACK, STATE_ERROR)
+from ethercat.pdo import InputPdo, OutputPdo
+
+
+class SimConfig:
+    """
+    Bus layout and timing of the simulation, read from the environment by default.
+
+    :param slaves: drives on every simulated adapter.
+    :param mailbox_latency: duration of one SDO round trip in seconds.
+    :param adapters: names of the simulated adapters.
+    :param frame_loss: probability that a process data frame gets lost.
+    :param watchdog: seconds without process data after which a slave in
+        OP falls back to SAFE-OP with an error.
+    :param dc_drift_ppm: how much faster the DC reference clock runs than
+        the host clock.
+    """
+
+    def __init__(self, slaves=4, mailbox_latency=0.0005, adapters=('sim0', 'sim1'), frame_loss=0.0,
+                 watchdog=0.1, dc_drift_ppm=0.0, seed=None):
+        self.slaves = slaves
+        self.mailbox_latency = mailbox_latency
+        self.adapters = tuple(adapters)
+        self.frame_loss = frame_loss
+        self.watchdog = watchdog
+        self.dc_drift_ppm = dc_drift_ppm
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls):
+        return cls(slaves=int(os.environ.get('ETHERCAT_SIM_SLAVES', 4)),
+                   mailbox_latency=float(os.environ.get('ETHERCAT_SIM_MAILBOX_LATENCY', 0.0005)),
+                   frame_loss=float(os.environ.get('ETHERCAT_SIM_FRAME_LOSS', 0.0)),
+                   dc_drift_ppm=float(os.environ.get('ETHERCAT_SIM_DC_DRIFT_PPM', 0.0)))
+
+
+config = SimConfig.from_env()
+
+
+def configure(**kwargs):
+    """Change the simulation, e.g. configure(slaves=32, mailbox_latency=0.002)."""
+    for key, value in kwargs.items():
+        if key == 'seed':
+            config.random.seed(value)
+        elif not hasattr(config, key):
+            raise AttributeError(f"Unknown simulation setting {key}")
+        else:
+            setattr(config, key, value)
+    return config
+
+
+def power_cycle(adapter=None):
+    """Switch the drives of one or every adapter off and on, they lose every parameter written by SDO."""
+    if adapter is None:
+        _object_dictionaries.clear()
+    else:
+        _object_dictionaries.pop(adapter, None)
+
+
+class SdoError(Exception):
+    """Same fields as pysoem.SdoError."""
+
+    def __init__(self, slave_pos, index, subindex, abort_code, desc):
+        super().__init__(slave_pos, index, subindex, abort_code, desc)
+        self.slave_pos = slave_pos
+        self.index = index
+        self.subindex = subindex
+        self.abort_code = abort_code
+        self.desc = desc
+
+
+class Adapter:
+
+    def __init__(self, name, desc):
+        self.name = name
+        self.desc = desc
+
+
+def find_adapters():
+    return [Adapter(name, f"Simulated EtherCAT segment {name}") for name in config.adapters]
+
+
+# CiA-402 drive states
+NOT_READY_TO_SWITCH_ON = 'Not ready to switch on'
+SWITCH_ON_DISABLED = 'Switch on disabled'
+READY_TO_SWITCH_ON = 'Ready to switch on'
+SWITCHED_ON = 'Switched on'
+OPERATION_ENABLED = 'Operation enabled'
+QUICK_STOP_ACTIVE = 'Quick stop active'
+FAULT_REACTION_ACTIVE = 'Fault reaction active'
+FAULT = 'Fault'
+
+# statusword bits 0-3, 5 and 6 of every state, remote (bit 9) is always set
+_STATUSWORD = {
+    NOT_READY_TO_SWITCH_ON: 0x0000,
+    SWITCH_ON_DISABLED: 0x0040,
+    READY_TO_SWITCH_ON: 0x0021,
+    SWITCHED_ON: 0x0023,
+    OPERATION_ENABLED: 0x0027,
+    QUICK_STOP_ACTIVE: 0x0007,
+    FAULT_REACTION_ACTIVE: 0x000F,
+    FAULT: 0x0008,
+}
+_REMOTE = 0x0200
+_TARGET_REACHED = 0x0400
+
+# objects backed by drive variables: (index, subindex) -> (attribute, format, writable)
+_VARIABLES = {
+    (0x603F, 0): ('error_code', '<H', False),
+    (0x6040, 0): ('controlword', '<H', True),
+    (0x6041, 0): ('statusword', '<H', False),
+    (0x6060, 0): ('mode', '<b', True),
+    (0x6061, 0): ('mode_display', '<b', False),
+    (0x6062, 0): ('position_demand', '<i', False),
+    (0x6064, 0): ('position_actual', '<i', False),
+    (0x606B, 0): ('velocity_demand', '<i', False),
+    (0x606C, 0): ('velocity_actual', '<i', False),
+    (0x6071, 0): ('target_torque', '<h', True),
+    (0x6074, 0): ('torque_demand', '<h', False),
+    (0x6077, 0): ('torque_actual', '<h', False),
+    (0x607A, 0): ('target_position', '<i', True),
+    (0x6081, 0): ('profile_velocity', '<I', True),
+    (0x6083, 0): ('profile_acceleration', '<I', True),
+    (0x6084, 0): ('profile_deceleration', '<I', True),
+    (0x6085, 0): ('quick_stop_deceleration', '<I', True),
+    (0x60FD, 0): ('digital_input', '<I', False),
+    (0x60FE, 1): ('digital_output', '<I', True),
+    (0x60FF, 0): ('target_velocity', '<i', True),
+}
+
+# PDO mapping matching InputPdo/OutputPdo, entries are index << 16 | subindex << 8 | bits
+_RX_MAPPING = [0x60600008, 0x60400010, 0x607A0020, 0x60FF0020, 0x60710020, 0x60FE0120]
+_TX_MAPPING = [0x60610008, 0x60410010, 0x60620020, 0x60640020, 0x606B0020, 0x606C0020,
+               0x60740020, 0x60770020, 0x60FD0020]
+
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+def _int32(value):
+    return (int(value) + 0x80000000) % 0x100000000 - 0x80000000
+
+
+class Drive:
+    """CiA-402 state machine and motion model of one simulated drive."""
+
+    # torque per unit of target torque in the torque modes, in velocity units per s²
+    TORQUE_GAIN = 100
+
+    def __init__(self):
+        self.state = SWITCH_ON_DISABLED
+        self.error_code = 0
+        self.controlword = 0
+        self.mode = 0
+        self.target_position = 0
+        self.target_velocity = 0
+        self.target_torque = 0
+        self.digital_output = 0
+        self.digital_input = 0
+        self.profile_velocity = 10_000
+        self.profile_acceleration = 100_000
+        self.profile_deceleration = 100_000
+        self.quick_stop_deceleration = 1_000_000
+        self.position = 0.0
+        self.velocity = 0.0
+        self.velocity_command = 0.0
+        self.torque = 0.0
+        self._last = time.monotonic()
+
+    # read-only objects
+    @property
+    def statusword(self):
+        statusword = _STATUSWORD[self.state] | _REMOTE
+        if self.state == OPERATION_ENABLED and abs(self.velocity - self.velocity_command) < 1:
+            statusword |= _TARGET_REACHED
+        return statusword
+
+    @property
+    def mode_display(self):
+        return self.mode
+
+    @property
+    def position_demand(self):
+        return _int32(self.target_position if self.mode in (1, 8) else self.position)
+
+    @property
+    def position_actual(self):
+        return _int32(self.position)
+
+    @property
+    def velocity_demand(self):
+        return _int32(self.velocity_command)
+
+    @property
+    def velocity_actual(self):
+        return _int32(self.velocity)
+
+    @property
+    def torque_demand(self):
+        return int(_clamp(self.torque, -0x8000, 0x7FFF))
+
+    torque_actual = torque_demand
+
+    def set_controlword(self, controlword):
+        """Apply a controlword to the state machine like the drive firmware does."""
+        rising = controlword & ~self.controlword
+        self.controlword = controlword
+        state = self.state
+        if state == FAULT:
+            if rising & 0x0080:
+                self.error_code = 0
+                self.state = SWITCH_ON_DISABLED
+            return
+        if state in (NOT_READY_TO_SWITCH_ON, FAULT_REACTION_ACTIVE):
+            return
+        if controlword & 0x0002 == 0:
+            # disable voltage
+            self.state = SWITCH_ON_DISABLED
+        elif controlword & 0x0004 == 0:
+            # quick stop
+            if state == OPERATION_ENABLED:
+                self.state = QUICK_STOP_ACTIVE
+            elif state in (READY_TO_SWITCH_ON, SWITCHED_ON):
+                self.state = SWITCH_ON_DISABLED
+        elif controlword & 0x0001 == 0:
+            # shutdown
+            if state in (SWITCH_ON_DISABLED, SWITCHED_ON, OPERATION_ENABLED):
+                self.state = READY_TO_SWITCH_ON
+        elif controlword & 0x0008 == 0:
+            # switch on / disable operation
+            if state in (READY_TO_SWITCH_ON, OPERATION_ENABLED):
+                self.state = SWITCHED_ON
+        else:
+            # enable operation
+            if state in (SWITCHED_ON, QUICK_STOP_ACTIVE):
+                self.state = OPERATION_ENABLED
+
+    def fault(self, error_code=0x5000):
+        self.error_code = error_code
+        self.state = FAULT
+
+    def disable(self):
+        """Drop the power stage, e.g. when the slave leaves OP."""
+        if self.state in (SWITCHED_ON, OPERATION_ENABLED, QUICK_STOP_ACTIVE):
+            self.state = SWITCH_ON_DISABLED
+
+    def advance(self, now=None):
+        """Move the motor from the last update to now (monotonic seconds)."""
+        if now is None:
+            now = time.monotonic()
+        dt = now - self._last
+        if dt <= 0:
+            return
+        self._last = now
+        velocity = self.velocity
+        if self.state == OPERATION_ENABLED:
+            if self.mode in (3, 9):
+                command = float(self.target_velocity)
+                rate = self.profile_acceleration
+            elif self.mode in (1, 8):
+                # follow the target position, limited by the profile velocity in profile position mode
+                command = (self.target_position - self.position) / dt
+                if self.mode == 1:
+                    command = _clamp(command, -self.profile_velocity, self.profile_velocity)
+                rate = float('inf') if self.mode == 8 else self.profile_acceleration
+            elif self.mode in (4, 10):
+                command = velocity + self.target_torque * self.TORQUE_GAIN * dt
+                rate = float('inf')
+            elif self.mode == 6:
+                command = _clamp(-self.position / dt, -self.profile_velocity, self.profile_velocity)
+                rate = self.profile_acceleration
+            else:
+                command = velocity
+                rate = 0
+        elif self.state == QUICK_STOP_ACTIVE:
+            command = 0.0
+            rate = self.quick_stop_deceleration
+        else:
+            # power stage off, the motor coasts down
+            command = 0.0
+            rate = self.profile_deceleration
+        step = rate * dt
+        new_velocity = velocity + _clamp(command - velocity, -step, step)
+        self.position += (velocity + new_velocity) / 2 * dt
+        if self.mode in (4, 10) and self.state == OPERATION_ENABLED:
+            self.torque = self.target_torque
+        else:
+            self.torque = (new_velocity - velocity) / dt / self.TORQUE_GAIN
+        self.velocity = new_velocity
+        self.velocity_command = command
+        if self.state == QUICK_STOP_ACTIVE and new_velocity == 0:
+            self.state = SWITCH_ON_DISABLED
+
+
+class SimSlave:
+    """One simulated drive with the attributes and methods of a pysoem slave."""
+
+    def __init__(self, master, position, name='TMCM-1617', man=0x0286, id=0x00001617, rev=0x00010000):
+        self._master = master
+        self.position = position
+        self.name = name
+        self.man = man
+        self.id = id
+        self.rev = rev
+        self.config_func = None
+        self.setup_func = None
+        self.state = PREOP_STATE
+        self.al_status = 0
+        self.is_lost = False
+        self.hasdc = True
+        self.dc_sync_settings = None
+        self.drive = Drive()
+        self._al_state = PREOP_STATE
+        self._mapped = False
+        self._outputs = OutputPdo()
+        self._inputs = InputPdo()
+        self._last_pdo = None
+        self._lock = threading.Lock()
+        self._mailbox = threading.Lock()
+        # ESC registers from 0x0300 on: RX/forwarded/processing/PDI error and lost link counters
+        self._error_counters = bytearray(0x14)
+        self._objects = {
+            (0x1018, 1): struct.pack('<I', man),
+            (0x1018, 2): struct.pack('<I', id),
+            (0x1018, 3): struct.pack('<I', rev),
+            (0x1018, 4): struct.pack('<I', 1000 + position),
+            (0x1C12, 0): struct.pack('<B', 1),
+            (0x1C12, 1): struct.pack('<H', 0x1600),
+            (0x1C13, 0): struct.pack('<B', 1),
+            (0x1C13, 1): struct.pack('<H', 0x1A00),
+        }
+        for index, mapping in ((0x1600, _RX_MAPPING), (0x1A00, _TX_MAPPING)):
+            self._objects[(index, 0)] = struct.pack('<B', len(mapping))
+            for subindex, entry in enumerate(mapping, 1):
+                self._objects[(index, subindex)] = struct.pack('<I', entry)
+
+    # process data
+    @property
+    def input(self):
+        if not self._mapped:
+            return b''
+        return bytes(self._inputs)
+
+    @property
+    def output(self):
+        if not self._mapped:
+            return b''
+        return bytes(self._outputs)
+
+    @output.setter
+    def output(self, data):
+        if not isinstance(data, bytes):
+            raise TypeError("output must be bytes")
+        if len(data) != ctypes.sizeof(self._outputs):
+            raise AttributeError(f"size mismatch, expected {ctypes.sizeof(self._outputs)} bytes")
+        ctypes.memmove(ctypes.addressof(self._outputs), data, len(data))
+
+    def _exchange(self, now):
+        """Process data cycle of this slave, returns its working counter."""
+        if self.is_lost or not self._mapped:
+            return 0
+        with self._lock:
+            self._check_watchdog(now)
+            drive = self.drive
+            if self._al_state == OP_STATE:
+                outputs = self._outputs
+                drive.mode = outputs.modes_of_operation
+                drive.target_position = outputs.target_position
+                drive.target_velocity = outputs.target_velocity
+                drive.target_torque = outputs.target_torque
+                drive.digital_output = outputs.digital_output
+                if outputs.controlword != drive.controlword:
+                    drive.set_controlword(outputs.controlword)
+                self._last_pdo = now
+            drive.advance(now)
+            if self._al_state not in (SAFEOP_STATE, OP_STATE):
+                return 0
+            inputs = self._inputs
+            inputs.modes_of_operation_display = drive.mode_display
+            inputs.statusword = drive.statusword
+            inputs.position_demand_value = drive.position_demand
+            inputs.position_actual_value = drive.position_actual
+            inputs.velocity_demand_value = drive.velocity_demand
+            inputs.velocity_actual_value = drive.velocity_actual
+            inputs.torque_demand_value = drive.torque_demand
+            inputs.torque_actual_value = drive.torque_actual
+            inputs.digital_input = drive.digital_input
+            # inputs read, outputs written only in OP
+            return 3 if self._al_state == OP_STATE else 1
+
+    def _check_watchdog(self, now):
+        if (self._al_state == OP_STATE and self._last_pdo is not None
+                and now - self._last_pdo > config.watchdog):
+            # sync manager watchdog
+            self._al_state = SAFEOP_STATE | STATE_ERROR
+            self.al_status = 0x001B
+            self.drive.disable()
+
+    # AL state
+    def _request_state(self, state):
+        with self._lock:
+            self._check_watchdog(time.monotonic())
+            requested = state & 0x0F
+            current = self._al_state & 0x0F
+            if state & STATE_ACK:
+                self._al_state = current
+                self.al_status = 0
+                if requested == NONE_STATE:
+                    return
+            if self._al_state & STATE_ERROR:
+                # an error must be acknowledged first
+                return
+            if requested in (SAFEOP_STATE, OP_STATE) and not self._mapped:
+                self._al_state = current | STATE_ERROR
+                self.al_status = 0x001D
+                return
+            if requested == OP_STATE and current not in (SAFEOP_STATE, OP_STATE):
+                self._al_state = current | STATE_ERROR
+                self.al_status = 0x0011
+                return
+            if current == OP_STATE and requested != OP_STATE:
+                self.drive.disable()
+            if requested == OP_STATE and current != OP_STATE:
+                self._last_pdo = time.monotonic()
+            if requested in (INIT_STATE, PREOP_STATE, BOOT_STATE, SAFEOP_STATE, OP_STATE):
+                self._al_state = requested
+
+    def write_state(self):
+        self._request_state(self.state)
+
+    def read_state(self):
+        with self._lock:
+            self._check_watchdog(time.monotonic())
+            self.state = self._al_state
+        return self.state
+
+    def state_check(self, expected_state, timeout=2000):
+        return self.read_state()
+
+    # mailbox
+    def _mailbox_round_trip(self, index, subindex):
+        time.sleep(config.mailbox_latency)
+        if self.is_lost:
+            raise SdoError(self.position, index, subindex, 0x05040000, "SDO protocol timed out")
+        if self._al_state & 0x0F in (NONE_STATE, INIT_STATE):
+            raise SdoError(self.position, index, subindex, 0x08000022,
+                           "Data cannot be transferred or stored because of the present device state")
+
+    def _write_object(self, index, subindex, data):
+        variable = _VARIABLES.get((index, subindex))
+        if variable is None:
+            self._objects[(index, subindex)] = bytes(data)
+            return len(data)
+        attribute, fmt, writable = variable
+        size = struct.calcsize(fmt)
+        if not writable:
+            raise SdoError(self.position, index, subindex, 0x06010002, "Attempt to write a read only object")
+        if len(data) < size:
+            raise SdoError(self.position, index, subindex, 0x06070010,
+                           "Data type does not match, length of service parameter does not match")
+        value, = struct.unpack_from(fmt, data)
+        drive = self.drive
+        drive.advance()
+        if attribute == 'controlword':
+            drive.set_controlword(value)
+        else:
+            setattr(drive, attribute, value)
+        return size
+
+    def _read_object(self, index, subindex):
+        variable = _VARIABLES.get((index, subindex))
+        if variable is not None:
+            attribute, fmt, _ = variable
+            self.drive.advance()
+            return struct.pack(fmt, getattr(self.drive, attribute))
+        try:
+            return self._objects[(index, subindex)]
+        except KeyError:
+            raise SdoError(self.position, index, subindex, 0x06020000,
+                           "The object does not exist in the object directory") from None
+
+    def sdo_write(self, index, subindex, data, ca=False):
+        if not isinstance(data, bytes):
+            raise TypeError("data must be bytes")
+        with self._mailbox:
+            self._mailbox_round_trip(index, subindex)
+            with self._lock:
+                if not ca:
+                    self._write_object(index, subindex, data)
+                    return
+                # complete access writes the subindexes one after the other
+                offset = 0
+                while offset < len(data):
+                    offset += self._write_object(index, subindex, data[offset:])
+                    subindex += 1
+
+    def sdo_read(self, index, subindex, size=0, ca=False):
+        with self._mailbox:
+            self._mailbox_round_trip(index, subindex)
+            with self._lock:
+                if not ca:
+                    data = self._read_object(index, subindex)
+                else:
+                    data = b''
+                    while (index, subindex) in self._objects or (index, subindex) in _VARIABLES:
+                        data += self._read_object(index, subindex)
+                        subindex += 1
+        return data[:size] if size else data
+
+    def _fprd(self, address, size, timeout_us=2000):
+        offset = address - 0x0300
+        if offset < 0 or offset + size > len(self._error_counters):
+            # only the error counters are simulated
+            return bytes(size)
+        return bytes(self._error_counters[offset:offset + size])
+
+    def _count_error(self, register):
+        # the counters of a real ESC stop at 0xFF
+        self._error_counters[register] = min(self._error_counters[register] + 1, 0xFF)
+
+    def dc_sync(self, act, sync0_cycle_time, sync0_shift_time=0, sync1_cycle_time=None):
+        self.dc_sync_settings = (act, sync0_cycle_time, sync0_shift_time, sync1_cycle_time)
+
+    def inject_fault(self, error_code=0x5000):
+        """Put the drive into the CiA-402 fault state."""
+        with self._lock:
+            self.drive.fault(error_code)
+
+
+# object dictionary of every simulated drive by adapter and position
+_object_dictionaries = {}
+
+
+class Master:
+    """A simulated master with the methods of pysoem.Master."""
+
+    def __init__(self):
+        self.slaves = []
+        self.state = NONE_STATE
+        self.expected_wkc = 0
+        self.dc_time = 0
+        self.in_op = False
+        self.do_check_state = False
+        self._adapter = None
+        self._dc = None
+        self._sent = False
+
+    def open(self, ifname, ifname_red=None):
+        if ifname not in config.adapters:
+            raise ConnectionError(f"could not open interface {ifname}")
+        self._adapter = ifname
+
+    def close(self):
+        self._adapter = None
+
+    def _check_open(self):
+        if self._adapter is None:
+            raise ConnectionError("master is not open")
+
+    def config_init(self, usetable=False):
+        self._check_open()
+        self.slaves = [SimSlave(self, position) for position in range(config.slaves)]
+        # the drives stay powered while the adapter is closed, what was written by SDO is still there
+        kept = _object_dictionaries.setdefault(self._adapter, {})
+        for position, slave in enumerate(self.slaves):
+            slave._objects = kept.setdefault(position, slave._objects)
+        self.state = PREOP_STATE
+        return len(self.slaves)
+
+    def config_map(self):
+        self._check_open()
+        for position, slave in enumerate(self.slaves):
+            if slave.config_func is not None:
+                slave.config_func(position)
+            slave._mapped = True
+        # like SOEM, mapping requests SAFE-OP from every slave
+        for slave in self.slaves:
+            slave._request_state(SAFEOP_STATE)
+        self.expected_wkc = 3 * len(self.slaves)
+        return len(self.slaves) * (ctypes.sizeof(InputPdo) + ctypes.sizeof(OutputPdo))
+
+    def config_dc(self):
+        self._check_open()
+        if not any(slave.hasdc for slave in self.slaves):
+            return False
+        # the reference clock starts at the wall clock and then runs at its own rate
+        self._dc = (time.time_ns(), time.monotonic_ns(), 1.0 + config.dc_drift_ppm * 1e-6)
+        self.dc_time = self._dc[0]
+        return True
+
+    def _read_dc(self):
+        origin, start, rate = self._dc
+        self.dc_time = origin + int((time.monotonic_ns() - start) * rate)
+
+    def write_state(self):
+        for slave in self.slaves:
+            slave._request_state(self.state)
+
+    def read_state(self):
+        states = [slave.read_state() for slave in self.slaves]
+        self.state = min(states, default=NONE_STATE)
+        return self.state
+
+    def state_check(self, expected_state, timeout=50_000):
+        # simulated slaves change state immediately, there is nothing to wait for
+        return self.read_state()
+
+    def send_processdata(self):
+        self._check_open()
+        self._sent = True
+
+    def receive_processdata(self, timeout=2000):
+        self._check_open()
+        if not self._sent:
+            return -1
+        self._sent = False
+        if config.frame_loss and config.random.random() < config.frame_loss:
+            if self.slaves:
+                # the frame was corrupted on its way in at some slave
+                config.random.choice(self.slaves)._count_error(0x00)
+            return -1
+        now = time.monotonic()
+        if self._dc is not None:
+            self._read_dc()
+        return sum(slave._exchange(now) for slave in self.slaves)
@@ -0,0 +1,82 @@
+# This Python file uses the following encoding: utf-8
+"""EtherCAT state changes of single slaves while the rest of the bus keeps running."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ethercat import backend
+
+STATE_NAMES = {
+    backend.NONE_STATE: 'NONE',
+    backend.INIT_STATE: 'INIT',
+    backend.PREOP_STATE: 'PRE-OP',
+    backend.BOOT_STATE: 'BOOT',
+    backend.SAFEOP_STATE: 'SAFE-OP',
+    backend.OP_STATE: 'OP',
+}
+
+
+def state_name(state):
+    name = STATE_NAMES.get(state & 0x0F, hex(state))
+    if state & backend.STATE_ERROR:
+        name += ' + ERROR'
+    return name
+
+
+# slaves go up one state at a time, going down may skip states
+_ORDER = (backend.INIT_STATE, backend.PREOP_STATE, backend.SAFEOP_STATE, backend.OP_STATE)
+
+
+def _steps(current, state):
+    if current in _ORDER and state in _ORDER and _ORDER.index(state) > _ORDER.index(current):
+        return _ORDER[_ORDER.index(current) + 1:_ORDER.index(state) + 1]
+    return (state,)
+
+
+def _change(slave, state, deadline, poll):
+    slave.state = state
+    slave.write_state()
+    while True:
+        # short checks, so the mailbox and the cycle are not blocked for long
+        current = slave.state_check(state, 1_000)
+        if current == state or time.monotonic() >= deadline:
+            return current
+        time.sleep(poll)
+
+
+def request_state(slave, state, timeout=5.0, poll=0.001):
+    """
+    Move one slave to state and wait until it gets there, returns the state reached.
+
+    Only this slave is addressed, the cyclic exchange of the other slaves
+    goes on (their working counter share stays in the frame, so the
+    segment sees a lower WKC until the slave is back in OP). A pending AL
+    error is acknowledged first, going up passes every state in between
+    (e.g. PRE-OP, SAFE-OP, OP).
+    """
+    deadline = time.monotonic() + timeout
+    current = slave.state_check(state, 1_000)
+    if current == state:
+        return current
+    if current & backend.STATE_ERROR:
+        slave.state = (current & 0x0F) | backend.STATE_ACK
+        slave.write_state()
+        current &= 0x0F
+    for step in _steps(current, state):
+        current = _change(slave, step, deadline, poll)
+        if current != step:
+            break
+    return current
+
+
+def request_states(slaves, state, timeout=5.0, max_workers=None):
+    """
+    Move several slaves to state at once, each one polled on its own thread.
+
+    Returns a list of (slave, state reached) for the slaves that did not get there.
+    """
+    slaves = list(slaves)
+    if not slaves:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or len(slaves)) as executor:
+        reached = list(executor.map(lambda slave: request_state(slave, state, timeout), slaves))
+    return [(slave, current) for slave, current in zip(slaves, reached) if current != state]
@@ -0,0 +1,183 @@
+# This Python file uses the following encoding: utf-8
+"""Supervision of the cyclic exchange, stops every axis in the next cycle on a failure."""
+import threading
+import time
+
+from ethercat.cia402 import QUICK_STOP, is_drive, mapped_fields
+
+# trip reasons
+TRIP_NONE = 0
+TRIP_WKC = 1
+TRIP_FAULT = 2
+TRIP_HEARTBEAT = 3
+
+TRIP_NAMES = {
+    TRIP_NONE: 'none',
+    TRIP_WKC: 'working counter',
+    TRIP_FAULT: 'drive fault',
+    TRIP_HEARTBEAT: 'heartbeat timeout',
+}
+
+# statusword bit 3
+_FAULT_BIT = 0x0008
+
+
+def wkc_share(slave):
+    """Working counter slave adds in OP: 2 for writing its outputs and 1 for reading its inputs."""
+    return (2 if len(slave.output) else 0) + (1 if len(slave.input) else 0)
+
+
+class Supervisor:
+    """
+    Watches every cycle and forces a safe stop without waiting for the GUI.
+
+    Used as `image` of a CyclicWorker in front of the real process image
+    and registered with check() as a callback. After every receive it
+    trips on
+      - a working counter below master.expected_wkc for `wkc_misses` cycles
+        in a row, less the share of slaves taken out of OP on purpose
+        (park()); a lost frame always counts as a miss,
+      - the fault bit of a statusword coming up,
+      - no heartbeat() for `heartbeat_timeout` seconds (None switches it off).
+    From the next send on, and every send after until reset(), the outputs
+    of every axis are overwritten with quick stop, zero velocity and torque
+    and the actual position as target, whatever the GUI writes meanwhile.
+
+    Nothing is checked before arm(), e.g. while the bus is still going to OP.
+
+    :param image: ProcessImage or another image with read_inputs()/write_outputs().
+    :param axes: objects with `inputs`/`outputs` structs (or None) by bus
+        position, `image.slaves` by default; only the CiA-402 drives among
+        them are supervised, see cia402.is_drive().
+    :param on_trip: optional on_trip(reason, position) called on the cyclic
+        thread when it trips, position is None if no single slave is the cause.
+    """
+
+    def __init__(self, master, image, axes=None, wkc_misses=3, heartbeat_timeout=None, on_trip=None):
+        self.master = master
+        self.image = image
+        if axes is None:
+            axes = image.slaves
+        # IO terminals and other slaves without statusword are left alone
+        self.positions = [position for position, axis in enumerate(axes) if is_drive(axis)]
+        self.axes = [axes[position] for position in self.positions]
+        self.wkc_misses = wkc_misses
+        self.heartbeat_timeout = heartbeat_timeout
+        self.on_trip = on_trip
+        self.armed = False
+        self.tripped = TRIP_NONE
+        self.trip_position = None
+        self.trips = 0
+        self.reaction_time = None
+        self._misses = 0
+        self._faults = [False] * len(self.axes)
+        self._heartbeat = time.monotonic()
+        self._trip_ns = None
+        self._parked = set()
+        self._parked_wkc = 0
+        self._lock = threading.Lock()
+
+    def arm(self):
+        """Start checking, with every fault already present counted as known."""
+        self._misses = 0
+        self._faults = [bool(axis.inputs.statusword & _FAULT_BIT) for axis in self.axes]
+        self._heartbeat = time.monotonic()
+        self.armed = True
+
+    def disarm(self):
+        self.armed = False
+
+    def heartbeat(self):
+        """Called regularly by the GUI, e.g. from a QTimer, to show it is alive."""
+        self._heartbeat = time.monotonic()
+
+    def reset(self):
+        """Acknowledge a trip, the outputs are the application's again."""
+        if self.tripped:
+            print(f"Supervisor reset after {TRIP_NAMES[self.tripped]}")
+        self.arm()
+        self.tripped = TRIP_NONE
+        self.trip_position = None
+
+    def _set_parked(self, parked):
+        self._parked = parked
+        # one int assignment, check() sees the old or the new value
+        self._parked_wkc = sum(wkc_share(self.master.slaves[position]) for position in parked)
+
+    def park(self, *positions):
+        """The slaves at positions leave OP on purpose, their working counter is not expected until unpark()."""
+        with self._lock:
+            self._set_parked(self._parked | set(positions))
+
+    def unpark(self, *positions):
+        """The slaves at positions are back in OP."""
+        with self._lock:
+            self._set_parked(self._parked - set(positions))
+            self._misses = 0
+
+    def _trip(self, reason, position=None):
+        self.tripped = reason
+        self.trip_position = position
+        self.trips += 1
+        self._trip_ns = time.monotonic_ns()
+        if self.on_trip is not None:
+            self.on_trip(reason, position)
+
+    def check(self, wkc):
+        """CyclicWorker callback, looks at the inputs just received."""
+        if not self.armed or self.tripped:
+            return
+        if wkc < 0 or wkc < self.master.expected_wkc - self._parked_wkc:
+            self._misses += 1
+            if self._misses >= self.wkc_misses:
+                self._trip(TRIP_WKC)
+                return
+        else:
+            self._misses = 0
+        faults = self._faults
+        for i, axis in enumerate(self.axes):
+            fault = bool(axis.inputs.statusword & _FAULT_BIT)
+            if fault and not faults[i]:
+                faults[i] = True
+                self._trip(TRIP_FAULT, self.positions[i])
+                return
+            faults[i] = fault
+        timeout = self.heartbeat_timeout
+        if timeout is not None and time.monotonic() - self._heartbeat > timeout:
+            self._trip(TRIP_HEARTBEAT)
+
+    def _safe_outputs(self):
+        for axis in self.axes:
+            outputs = axis.outputs
+            # the layout of a slave may leave some of these out
+            mapped = mapped_fields(outputs)
+            if 'controlword' in mapped:
+                outputs.controlword = QUICK_STOP
+            if 'target_velocity' in mapped:
+                outputs.target_velocity = 0
+            if 'target_torque' in mapped:
+                outputs.target_torque = 0
+            if 'target_position' in mapped and 'position_actual_value' in mapped_fields(axis.inputs):
+                outputs.target_position = axis.inputs.position_actual_value
+
+    def read_inputs(self):
+        self.image.read_inputs()
+
+    def write_outputs(self):
+        if self.tripped:
+            self._safe_outputs()
+            if self._trip_ns is not None:
+                # from the inputs that tripped to the first safe frame
+                self.reaction_time = (time.monotonic_ns() - self._trip_ns) / 1e9
+                self._trip_ns = None
+        self.image.write_outputs()
+
+    def clear_outputs(self):
+        self.image.clear_outputs()
+
+    def stats(self):
+        return {
+            'tripped': TRIP_NAMES[self.tripped],
+            'trips': self.trips,
+            'reaction_time': self.reaction_time,
+        }
@@ -0,0 +1,247 @@
+# This Python file uses the following encoding: utf-8
+"""Trapezoidal and jerk-limited (S-curve) setpoints for the cyclic synchronous modes."""
+import math
+
+import numpy as np
+
+# 7 motion segments followed by one that holds the target
+SEGMENTS = 8
+
+
+def _trapezoid(distance, v_max, a_max):
+    """(duration, acceleration at start, jerk) of each segment of a rest-to-rest move."""
+    t_acc = v_max / a_max
+    if a_max * t_acc * t_acc > distance:
+        # the maximum velocity is never reached
+        t_acc = math.sqrt(distance / a_max)
+        t_const = 0.0
+    else:
+        t_const = (distance - a_max * t_acc * t_acc) / v_max
+    return [(t_acc, a_max, 0.0), (t_const, 0.0, 0.0), (t_acc, -a_max, 0.0)]
+
+
+def _scurve_ramp(v, a_max, j_max):
+    """Jerk time, constant acceleration time and peak acceleration to get from rest to v."""
+    if v * j_max < a_max * a_max:
+        a = math.sqrt(v * j_max)
+        return a / j_max, 0.0, a
+    return a_max / j_max, v / a_max - a_max / j_max, a_max
+
+
+def _scurve(distance, v_max, a_max, j_max):
+    """Segments of a rest-to-rest move with limited jerk, see _trapezoid()."""
+
+    def ramps_distance(v):
+        # speeding up and slowing down are point symmetric, together they cover v * ramp time
+        t_jerk, t_acc, _ = _scurve_ramp(v, a_max, j_max)
+        return v * (2 * t_jerk + t_acc)
+
+    v = v_max
+    if ramps_distance(v) > distance:
+        # the distance is too short for v_max, find the peak velocity that fits
+        low, high = 0.0, v_max
+        for _ in range(60):
+            v = (low + high) / 2
+            if ramps_distance(v) > distance:
+                high = v
+            else:
+                low = v
+        v = low
+    t_jerk, t_acc, a = _scurve_ramp(v, a_max, j_max)
+    t_const = (distance - ramps_distance(v)) / v if v > 0 else 0.0
+    return [
+        (t_jerk, 0.0, j_max), (t_acc, a, 0.0), (t_jerk, a, -j_max),
+        (max(t_const, 0.0), 0.0, 0.0),
+        (t_jerk, 0.0, -j_max), (t_acc, -a, 0.0), (t_jerk, -a, j_max),
+    ]
+
+
+def _profile(distance, v_max, a_max, j_max):
+    if distance <= 0:
+        return []
+    if j_max is None:
+        return _trapezoid(distance, v_max, a_max)
+    return _scurve(distance, v_max, a_max, j_max)
+
+
+def _table(segments, start, target, scale):
+    """Start time, position, velocity, acceleration and jerk of every segment."""
+    rows = []
+    t = p = v = 0.0
+    for duration, a0, jerk in segments:
+        rows.append((t, start + scale * p, scale * v, scale * a0, scale * jerk))
+        p += v * duration + a0 * duration ** 2 / 2 + jerk * duration ** 3 / 6
+        v += a0 * duration + jerk * duration ** 2 / 2
+        t += duration
+    while len(rows) < SEGMENTS:
+        # rounding leaves a tiny error, the hold segment sits exactly on the target
+        rows.append((t, target, 0.0, 0.0, 0.0))
+    return rows
+
+
+class _Plan:
+
+    def __init__(self, tables, t0):
+        table = np.array(tables, dtype=float).reshape(len(tables), SEGMENTS, 5)
+        self.t0 = t0
+        self.starts = table[:, :, 0]
+        self.p0 = table[:, :, 1]
+        self.v0 = table[:, :, 2]
+        self.a0 = table[:, :, 3]
+        self.jerk = table[:, :, 4]
+        self.ends = np.empty_like(self.starts)
+        self.ends[:, :-1] = self.starts[:, 1:]
+        self.ends[:, -1] = np.inf
+        self.duration = float(self.starts[:, -1].max())
+        # current segment per axis, only moves forward
+        self.index = np.zeros(len(tables), dtype=np.intp)
+
+
+class TrajectoryGenerator:
+    """
+    Setpoints of several axes for every cycle of a CyclicWorker.
+
+    move_to() plans a rest-to-rest move of every axis up front, trapezoidal
+    or with limited jerk (S-curve) when j_max is given. Each cycle, step()
+    only looks up the current segment of every axis and evaluates one cubic,
+    for all axes at once with NumPy, so the cost per cycle does not depend
+    on the length of the move.
+
+    Units are those of the drive: position in counts, velocity in counts/s,
+    acceleration in counts/s² and jerk in counts/s³.
+
+    :param axes: number of axes.
+    :param cycle_time: cycle time of the worker in seconds.
+    """
+
+    def __init__(self, axes, cycle_time=0.001):
+        self.axes = axes
+        self.cycle_time = cycle_time
+        self.time = 0.0
+        self.position = np.zeros(axes)
+        self.velocity = np.zeros(axes)
+        self._rows = np.arange(axes)
+        self._plan = None
+
+    @property
+    def done(self):
+        plan = self._plan
+        return plan is None or self.time - plan.t0 >= plan.duration
+
+    def reset(self, position):
+        """Drop the current move and hold position, e.g. the actual positions before enabling."""
+        self._plan = None
+        self.position = np.array(position, dtype=float).reshape(self.axes)
+        self.velocity = np.zeros(self.axes)
+
+    def move_to(self, target, v_max, a_max, j_max=None, synchronized=False):
+        """
+        Plan a move of every axis from its current setpoint to target, starting with the next cycle.
+
+        v_max, a_max and j_max are scalars or one value per axis. With
+        synchronized=True all axes start and stop together on one path
+        (the slowest axis sets the pace), as needed for coordinated motion.
+        Returns the duration of the move in seconds.
+        """
+        if not self.done:
+            raise RuntimeError("The axes are still moving")
+        start = self.position.copy()
+        target = np.broadcast_to(np.asarray(target, dtype=float), (self.axes,))
+        distance = target - start
+        v_max = np.broadcast_to(np.asarray(v_max, dtype=float), (self.axes,))
+        a_max = np.broadcast_to(np.asarray(a_max, dtype=float), (self.axes,))
+        if j_max is not None:
+            j_max = np.broadcast_to(np.asarray(j_max, dtype=float), (self.axes,))
+        if np.any(v_max <= 0) or np.any(a_max <= 0) or (j_max is not None and np.any(j_max <= 0)):
+            raise ValueError("Velocity, acceleration and jerk limits must be positive")
+
+        tables = []
+        if synchronized:
+            # one normalized path from 0 to 1 within the limits of every axis
+            moving = np.abs(distance) > 0
+            if moving.any():
+                length = np.abs(distance[moving])
+                segments = _profile(1.0, float(np.min(v_max[moving] / length)), float(np.min(a_max[moving] / length)),
+                                    None if j_max is None else float(np.min(j_max[moving] / length)))
+            else:
+                segments = []
+            for axis in range(self.axes):
+                tables.append(_table(segments, start[axis], target[axis], distance[axis]))
+        else:
+            for axis in range(self.axes):
+                segments = _profile(abs(distance[axis]), v_max[axis], a_max[axis],
+                                    None if j_max is None else j_max[axis])
+                tables.append(_table(segments, start[axis], target[axis], math.copysign(1.0, distance[axis])))
+        plan = _Plan(tables, self.time + self.cycle_time)
+        # one assignment, the cyclic thread sees the whole plan or none of it
+        self._plan = plan
+        return plan.duration
+
+    def sample(self, t):
+        """Position and velocity setpoints of every axis at time t of the current move."""
+        plan = self._plan
+        if plan is None:
+            return self.position, self.velocity
+        t = max(t - plan.t0, 0.0)
+        rows = self._rows
+        index = plan.index
+        # at most a few segments are crossed per cycle
+        while True:
+            crossed = t >= plan.ends[rows, index]
+            if not crossed.any():
+                break
+            index[crossed] += 1
+        tau = t - plan.starts[rows, index]
+        a0 = plan.a0[rows, index]
+        jerk = plan.jerk[rows, index]
+        v0 = plan.v0[rows, index]
+        position = plan.p0[rows, index] + tau * (v0 + tau * (a0 / 2 + tau * jerk / 6))
+        velocity = v0 + tau * (a0 + tau * jerk / 2)
+        return position, velocity
+
+    def step(self):
+        """Advance by one cycle and return the new (position, velocity) setpoints."""
+        self.time += self.cycle_time
+        self.position, self.velocity = self.sample(self.time)
+        return self.position, self.velocity
+
+    def callback(self, image, slaves=None, position=True, velocity=True, velocity_scale=1.0):
+        """
+        Return a CyclicWorker callback that steps the generator and writes its setpoints.
+
+        :param image: ArrayProcessImage (written column wise) or ProcessImage.
+        :param slaves: positions in the image of the axes, in axis order;
+            the first `axes` slaves by default.
+        :param position: write target_position (CSP).
+        :param velocity: write target_velocity (CSV, or velocity feed forward).
+        :param velocity_scale: drive velocity units per count/s.
+        """
+        if slaves is None:
+            slaves = range(self.axes)
+        slaves = list(slaves)
+        if len(slaves) != self.axes:
+            raise ValueError(f"{len(slaves)} slaves for {self.axes} axes")
+
+        if isinstance(getattr(image, 'outputs', None), np.ndarray):
+            select = np.asarray(slaves)
+            positions = image.outputs['target_position']
+            velocities = image.outputs['target_velocity']
+
+            def write_columns(wkc=None):
+                p, v = self.step()
+                if position:
+                    positions[select] = np.rint(p)
+                if velocity:
+                    velocities[select] = np.rint(v * velocity_scale)
+            return write_columns
+
+        outputs = [image[slave].outputs for slave in slaves]
+
+        def write_structs(wkc=None):
+            p, v = self.step()
+            for i, output in enumerate(outputs):
+                if position:
+                    output.target_position = int(round(p[i]))
+                if velocity:
+                    output.target_velocity = int(round(v[i] * velocity_scale))
+        return write_structs
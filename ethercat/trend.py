@@ -0,0 +1,63 @@
+# This Python file uses the following encoding: utf-8
+"""Sample ring buffers for live trends of InputPdo fields and min/max decimation."""
+import array
+
+
+class TrendBuffer:
+    """
+    Keeps the last `capacity` values of some input fields of some slaves.
+
+    sample() is registered as a CyclicWorker callback only while a trend
+    window is open, so without a window nothing runs in the cycle. Each
+    trace is a fixed array written round robin by the cyclic thread and
+    read by the GUI thread, a torn read only shows one stale sample.
+
+    :param slaves: (name, inputs) per traced slave, inputs being the
+        InputPdo mapped on the process image (SlaveImage.inputs).
+    :param fields: InputPdo field names traced for every slave.
+    """
+
+    def __init__(self, slaves, fields, capacity=10000):
+        self.capacity = capacity
+        self.fields = list(fields)
+        self.count = 0
+        self.traces = []
+        self._sources = []
+        for name, inputs in slaves:
+            for field in self.fields:
+                trace = array.array('d', bytes(8 * capacity))
+                self.traces.append((name, field, trace))
+                self._sources.append((inputs, field, trace))
+
+    def sample(self, wkc=None):
+        index = self.count % self.capacity
+        for inputs, field, trace in self._sources:
+            trace[index] = getattr(inputs, field)
+        self.count += 1
+
+    def latest(self, trace, length):
+        """The newest `length` samples of a trace in time order."""
+        count = min(self.count, self.capacity, length)
+        end = self.count % self.capacity
+        start = end - count
+        if start >= 0:
+            return trace[start:end]
+        return trace[start:] + trace[:end]
+
+
+def minmax_decimate(samples, width):
+    """
+    Reduce samples to at most `width` (min, max) pairs, one per pixel column.
+
+    Unlike plain subsampling every spike stays visible.
+    """
+    count = len(samples)
+    if count <= width:
+        return [(value, value) for value in samples]
+    columns = []
+    for column in range(width):
+        start = column * count // width
+        end = (column + 1) * count // width
+        chunk = samples[start:end]
+        columns.append((min(chunk), max(chunk)))
+    return columns
@@ -0,0 +1,303 @@
+# This Python file uses the following encoding: utf-8
+"""
+Headless control of the servo drives, the EtherCAT core of the GUIs without Qt.
+
+    python3 servoctl.py scan                                 adapters on this PC
+    python3 servoctl.py scan eth0                            slaves on eth0
+    python3 servoctl.py configure eth0                       parameters of the TMCM-1617 drives, only where needed
+    python3 servoctl.py enable eth0 --axis 1                 enable and hold until Ctrl-C
+    python3 servoctl.py move eth0 --axis 1 --velocity 500 --duration 5
+    python3 servoctl.py run eth0 eth1                        service mode, cyclic exchange until SIGTERM
+
+In service mode other processes command the axes through the control
+socket, see ethercat/control_server.py for the protocol and the client.
+
+Axes are the slave positions on the adapter starting at 1 like in the
+GUI, every slave when --axis is left out. Without hardware:
+
+    ETHERCAT_BACKEND=sim python3 servoctl.py move sim0 --axis 1 --velocity 500 --duration 2
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+from ethercat import backend, scan
+from ethercat.bus_cache import DEFAULT_PATH, BusCache, slave_identity
+from ethercat.control_server import DEFAULT_SOCKET, ControlServer
+from ethercat.master_manager import MasterManager
+from ethercat.pdo import modes_of_operation
+from ethercat.sdo import (TMCM1617_PARAMS, configure_slaves, is_tmcm1617, mode_param, target_speed_param,
+                          target_torque_param)
+from ethercat.slave_state import state_name
+
+# The supervisor stops every axis when this process has not sent a heartbeat
+# for HEARTBEAT_TIMEOUT seconds, it is sent every HEARTBEAT_PERIOD seconds
+HEARTBEAT_TIMEOUT = 0.5
+HEARTBEAT_PERIOD = 0.1
+
+# Seconds to wait for a drive to reach the requested CiA-402 state
+DRIVE_TIMEOUT = 5.0
+
+
+def stop_event():
+    """Event set by SIGINT or SIGTERM, so a service manager can stop the process cleanly."""
+    stop = threading.Event()
+
+    def handler(signum, frame):
+        stop.set()
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+    return stop
+
+
+def open_cache(args):
+    return None if args.no_cache else BusCache(args.cache)
+
+
+def open_manager(args, adapters):
+    """MasterManager with every adapter open and in OP, None if one of them failed."""
+    manager = MasterManager(args.cycle_time, processes=args.processes, dc=args.dc,
+                            heartbeat_timeout=HEARTBEAT_TIMEOUT, cache=open_cache(args))
+    for adapter in adapters:
+        try:
+            segment = manager.open(adapter, args.timeout)
+        except Exception as e:
+            print(f"{adapter}: {e}")
+            manager.close_all()
+            return None
+        if not segment.running:
+            print(f"{adapter}: no cyclic exchange")
+            manager.close_all()
+            return None
+        print(f"{adapter}: {segment.slave_count} slaves in OP")
+    return manager
+
+
+def select(adapter, items, positions):
+    """Slaves or axes of adapter by their 1-based position, all of them without positions."""
+    for position in positions or ():
+        if not 1 <= position <= len(items):
+            raise SystemExit(f"{adapter} has no slave {position}, it has {len(items)}")
+    return [items[position - 1] for position in positions] if positions else list(items)
+
+
+def select_axes(manager, adapter, positions):
+    return select(adapter, [axis for axis in manager.axes() if axis.segment.adapter == adapter], positions)
+
+
+def enable_axes(axes):
+    """Enable every axis and wait for it, returns False if one of them did not get there."""
+    ok = True
+    for axis in axes:
+        if axis.segment.tripped:
+            # a new command acknowledges the safe stop
+            axis.segment.reset_trip()
+        if axis.drive is None:
+            print(f"{axis}: not in the process data")
+            ok = False
+            continue
+        future = axis.drive.enable()
+        try:
+            print(f"{axis}: {future.result(DRIVE_TIMEOUT)}")
+        except Exception as e:
+            print(f"{axis}: enable failed: {e}")
+            ok = False
+    return ok
+
+
+def disable_axes(axes):
+    for axis in axes:
+        if axis.drive is None:
+            continue
+        axis.setpoint.write(target_speed_param(0))
+        try:
+            print(f"{axis}: {axis.drive.disable().result(DRIVE_TIMEOUT)}")
+        except Exception as e:
+            print(f"{axis}: disable failed: {e}")
+
+
+def print_status(manager):
+    for adapter, segment in manager.segments.items():
+        stats = segment.bus_stats()
+        if stats is None:
+            print(f"{adapter}: no cyclic exchange")
+            continue
+        stopped = f", safe stop on {segment.stats()['tripped']}" if segment.tripped else ''
+        print(f"{adapter}: WKC {stats['last_wkc']}/{stats['expected_wkc']}, lost frames {stats['lost_frames']}, "
+              f"timeouts {stats['timeouts']}, WKC mismatches {stats['wkc_mismatches']}{stopped}")
+
+
+def hold(manager, stop, duration=None, status_period=None):
+    """Keep the heartbeat going until stop is set or duration seconds are over."""
+    end = None if duration is None else time.monotonic() + duration
+    next_status = None if status_period is None else time.monotonic() + status_period
+    while not stop.wait(HEARTBEAT_PERIOD):
+        manager.heartbeat()
+        now = time.monotonic()
+        if end is not None and now >= end:
+            break
+        if next_status is not None and now >= next_status:
+            print_status(manager)
+            next_status = now + status_period
+
+
+def cmd_scan(args):
+    if not args.adapters:
+        for adapter in scan.find_adapters():
+            print(f"{adapter.name}\t{adapter.desc}")
+        return 0
+    for adapter in args.adapters:
+        try:
+            master = scan.open_bus(adapter, timeout=args.timeout)
+        except Exception as e:
+            print(f"{adapter}: {e}")
+            return 1
+        try:
+            for position, slave in enumerate(master.slaves):
+                man, product, rev, serial, _ = slave_identity(slave, position)
+                print(f"{adapter} / Slave {position + 1}: {slave.name} vendor 0x{man:08X} product 0x{product:08X} "
+                      f"revision 0x{rev:08X} serial {'-' if serial is None else serial} "
+                      f"{state_name(slave.state)}")
+        finally:
+            master.close()
+    return 0
+
+
+def cmd_configure(args):
+    try:
+        master = scan.open_bus(args.adapter, timeout=args.timeout)
+    except Exception as e:
+        print(f"{args.adapter}: {e}")
+        return 1
+    try:
+        positions = []
+        for position in select(args.adapter, range(len(master.slaves)), args.axis):
+            slave = master.slaves[position]
+            if is_tmcm1617(slave):
+                positions.append(position)
+            elif args.axis:
+                # the manufacturer objects of the TMCM-1617 mean something else on other drives
+                print(f"{args.adapter} / Slave {position + 1}: {slave.name} is no TMCM-1617, skipped")
+        cache = open_cache(args)
+        if cache is not None:
+            failed = cache.configure(args.adapter, master.slaves, TMCM1617_PARAMS, positions=positions)
+        else:
+            failed = configure_slaves([master.slaves[position] for position in positions], TMCM1617_PARAMS)
+        for slave, error in failed:
+            print(f"Configuration of {slave.name} failed: {error}")
+        print(f"{args.adapter}: {len(positions) - len(failed)} of {len(positions)} slaves configured")
+        return 1 if failed else 0
+    finally:
+        master.close()
+
+
+def cmd_enable(args):
+    stop = stop_event()
+    manager = open_manager(args, [args.adapter])
+    if manager is None:
+        return 1
+    try:
+        axes = select_axes(manager, args.adapter, args.axis)
+        if not enable_axes(axes):
+            return 1
+        print("Enabled, Ctrl-C disables the axes")
+        hold(manager, stop)
+        disable_axes(axes)
+        return 0
+    finally:
+        manager.close_all()
+
+
+def cmd_move(args):
+    stop = stop_event()
+    manager = open_manager(args, [args.adapter])
+    if manager is None:
+        return 1
+    try:
+        axes = select_axes(manager, args.adapter, args.axis)
+        params = [mode_param(args.mode), target_speed_param(args.velocity)]
+        if args.torque is not None:
+            params.append(target_torque_param(args.torque))
+        for axis in axes:
+            print(f"{axis}: {args.mode} at {args.velocity} via {', '.join(axis.setpoint.apply(params))}")
+        if not enable_axes(axes):
+            disable_axes(axes)
+            return 1
+        hold(manager, stop, args.duration)
+        disable_axes(axes)
+        return 0
+    finally:
+        manager.close_all()
+
+
+def cmd_run(args):
+    stop = stop_event()
+    manager = open_manager(args, args.adapters)
+    if manager is None:
+        return 1
+    server = None
+    try:
+        if not args.no_control:
+            server = ControlServer(manager, args.socket).start()
+            print(f"Control API on {args.socket}")
+        print(f"Running {', '.join(args.adapters)}, SIGTERM or Ctrl-C stops")
+        hold(manager, stop, status_period=args.status)
+        return 0
+    finally:
+        if server is not None:
+            server.stop()
+        manager.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', default=os.environ.get(backend.BACKEND_ENV, 'pysoem'),
+                        choices=sorted(backend.BACKENDS))
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds a bus scan may take")
+    parser.add_argument('--cycle-time', type=float, default=0.001)
+    parser.add_argument('--processes', action='store_true', help="run every cyclic exchange in its own process")
+    parser.add_argument('--dc', action='store_true', help="synchronize the slaves with distributed clocks")
+    parser.add_argument('--cache', default=DEFAULT_PATH, help="bus cache file")
+    parser.add_argument('--no-cache', action='store_true', help="discover and configure everything again")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('scan', help="list the adapters, or the slaves of the given adapters")
+    command.add_argument('adapters', nargs='*')
+    command.set_defaults(func=cmd_scan)
+
+    command = commands.add_parser('configure', help="write the TMCM-1617 parameters to the TMCM-1617 drives in PRE-OP")
+    command.add_argument('adapter')
+    command.add_argument('--axis', type=int, action='append')
+    command.set_defaults(func=cmd_configure)
+
+    command = commands.add_parser('enable', help="go to OP and enable the axes until stopped")
+    command.add_argument('adapter')
+    command.add_argument('--axis', type=int, action='append')
+    command.set_defaults(func=cmd_enable)
+
+    command = commands.add_parser('move', help="run the axes at a velocity")
+    command.add_argument('adapter')
+    command.add_argument('--axis', type=int, action='append')
+    command.add_argument('--mode', default='Profile velocity mode', choices=list(modes_of_operation))
+    command.add_argument('--velocity', type=int, required=True)
+    command.add_argument('--torque', type=int)
+    command.add_argument('--duration', type=float, help="seconds to move, until Ctrl-C by default")
+    command.set_defaults(func=cmd_move)
+
+    command = commands.add_parser('run', help="service mode: keep the adapters in OP until SIGTERM")
+    command.add_argument('adapters', nargs='+')
+    command.add_argument('--status', type=float, default=10.0, help="seconds between two status lines")
+    command.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket of the control API")
+    command.add_argument('--no-control', action='store_true', help="do not serve the control API")
+    command.set_defaults(func=cmd_run)
+
+    args = parser.parse_args()
+    backend.use(args.backend)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
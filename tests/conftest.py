@@ -0,0 +1,54 @@
+# This Python file uses the following encoding: utf-8
+"""Fixtures of the test suite, everything runs on the simulated bus (ETHERCAT_BACKEND=sim)."""
+import os
+import sys
+
+import pytest
+
+# the shared EtherCAT core lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+os.environ['ETHERCAT_BACKEND'] = 'sim'
+
+from ethercat import backend, scan, simulator
+
+backend.use('sim')
+
+
+@pytest.fixture
+def sim():
+    """The simulator with four freshly powered drives and no lost frames."""
+    simulator.configure(slaves=4, frame_loss=0.0, seed=0)
+    simulator.power_cycle()
+    yield simulator
+    simulator.configure(frame_loss=0.0)
+
+
+@pytest.fixture
+def master(sim):
+    """A master on sim0 with the process data mapped, the slaves are in SAFE-OP."""
+    master = scan.open_bus('sim0')
+    master.config_map()
+    yield master
+    master.close()
+
+
+@pytest.fixture
+def go_op(master):
+    """Request OP from every slave of master."""
+    def go_op():
+        master.state = backend.OP_STATE
+        master.write_state()
+        assert master.state_check(backend.OP_STATE) == backend.OP_STATE
+    return go_op
+
+
+@pytest.fixture
+def cycle(master):
+    """One process data exchange of master through an image, like CyclicWorker does it. Returns the wkc."""
+    def cycle(image):
+        image.write_outputs()
+        master.send_processdata()
+        wkc = master.receive_processdata(1_000)
+        image.read_inputs()
+        return wkc
+    return cycle
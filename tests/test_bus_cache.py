@@ -0,0 +1,65 @@
+# This Python file uses the following encoding: utf-8
+from ethercat import scan
+from ethercat.bus_cache import BusCache
+from ethercat.sdo import TMCM1617_PARAMS
+
+
+def count_writes(slaves):
+    """Wraps sdo_write of slaves, returns the list the positions of the written slaves go into."""
+    writes = []
+    for position, slave in enumerate(slaves):
+        def sdo_write(index, subindex, data, ca=False, position=position, write=slave.sdo_write):
+            writes.append(position)
+            return write(index, subindex, data, ca)
+        slave.sdo_write = sdo_write
+    return writes
+
+
+def restart(path):
+    """Open sim0 again with a cache loaded from path, like the next start of the application."""
+    return scan.open_bus('sim0'), BusCache(path)
+
+
+def test_skips_unchanged_slaves(sim, tmp_path):
+    path = tmp_path / 'cache.json'
+    master, cache = restart(path)
+    writes = count_writes(master.slaves)
+    assert cache.configure('sim0', master.slaves, TMCM1617_PARAMS) == []
+    assert sorted(set(writes)) == [0, 1, 2, 3]
+    master.close()
+
+    master, cache = restart(path)
+    writes = count_writes(master.slaves)
+    assert cache.configure('sim0', master.slaves, TMCM1617_PARAMS) == []
+    assert writes == []
+    master.close()
+
+
+def test_configures_a_slave_changed_by_hand(sim, tmp_path):
+    path = tmp_path / 'cache.json'
+    master, cache = restart(path)
+    cache.configure('sim0', master.slaves, TMCM1617_PARAMS)
+    param = TMCM1617_PARAMS[0]
+    master.slaves[2].sdo_write(param.index, param.subindex, param._replace(value=param.value + 1).encode())
+    master.close()
+
+    master, cache = restart(path)
+    writes = count_writes(master.slaves)
+    assert cache.configure('sim0', master.slaves, TMCM1617_PARAMS) == []
+    assert set(writes) == {2}
+    master.close()
+
+
+def test_power_cycle_configures_again(sim, tmp_path):
+    path = tmp_path / 'cache.json'
+    master, cache = restart(path)
+    cache.configure('sim0', master.slaves, TMCM1617_PARAMS)
+    master.close()
+    # the parameters are in the RAM of the drives
+    sim.power_cycle()
+
+    master, cache = restart(path)
+    writes = count_writes(master.slaves)
+    cache.configure('sim0', master.slaves, TMCM1617_PARAMS)
+    assert sorted(set(writes)) == [0, 1, 2, 3]
+    master.close()
@@ -0,0 +1,54 @@
+# This Python file uses the following encoding: utf-8
+import ctypes
+import struct
+import time
+
+import pytest
+
+from ethercat.cia402 import FAULT, OPERATION_ENABLED, Cia402Drive, drive_state
+from ethercat.pdo import ProcessImage
+
+
+def run_until_done(drive, future, image, cycle, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not future.done() and time.monotonic() < deadline:
+        drive.update(cycle(image))
+        time.sleep(0.001)
+    return future.result(0)
+
+
+def test_enable_reaches_operation_enabled(master, go_op, cycle):
+    image = ProcessImage(master.slaves)
+    go_op()
+    cycle(image)
+    drive = Cia402Drive(image[0])
+    assert run_until_done(drive, drive.enable(), image, cycle) == OPERATION_ENABLED
+    assert drive.enabled
+    # the drive itself agrees, not only the process image
+    statusword, = struct.unpack('<H', master.slaves[0].sdo_read(0x6041, 0))
+    assert drive_state(statusword) == OPERATION_ENABLED
+
+
+def test_enable_resets_a_fault(master, go_op, cycle):
+    image = ProcessImage(master.slaves)
+    go_op()
+    master.slaves[1].inject_fault()
+    cycle(image)
+    drive = Cia402Drive(image[1])
+    assert drive.state == FAULT
+    assert run_until_done(drive, drive.enable(), image, cycle) == OPERATION_ENABLED
+
+
+def test_rejects_slave_without_statusword():
+    class Inputs(ctypes.Structure):
+        _fields_ = [('digital_input', ctypes.c_uint32)]
+
+    class Outputs(ctypes.Structure):
+        _fields_ = [('digital_output', ctypes.c_uint32)]
+
+    class Terminal:
+        inputs = Inputs()
+        outputs = Outputs()
+
+    with pytest.raises(ValueError):
+        Cia402Drive(Terminal())
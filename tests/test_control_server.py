@@ -0,0 +1,74 @@
+# This Python file uses the following encoding: utf-8
+import time
+
+import pytest
+
+from ethercat.control_server import (DRIVE_ENABLE, STATE_CYCLIC, STATE_ENABLED, ControlClient, ControlError,
+                                     ControlServer)
+from ethercat.master_manager import MasterManager
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.fixture
+def manager(sim):
+    manager = MasterManager(cycle_time=0.002, cpus=[])
+    manager.open('sim0')
+    yield manager
+    manager.close_all()
+
+
+@pytest.fixture
+def client(manager, tmp_path):
+    path = str(tmp_path / 'control.sock')
+    server = ControlServer(manager, path).start()
+    with ControlClient(path) as client:
+        yield client
+    server.stop()
+
+
+def test_lists_the_axes(manager, client):
+    assert client.axes() == [repr(axis) for axis in manager.axes()]
+
+
+def test_setpoints_go_into_the_output_image(manager, client):
+    image = manager.segments['sim0'].image
+    client.set_velocities({0: 250, 3: -250})
+    # written on the cyclic thread, all of them in the same cycle
+    assert wait_for(lambda: image[3].outputs.target_velocity == -250)
+    assert image[0].outputs.target_velocity == 250
+    assert image[1].outputs.target_velocity == 0
+
+
+def test_reads_the_state(manager, client):
+    image = manager.segments['sim0'].image
+    timestamp, states = client.read()
+    assert timestamp > 0
+    assert [state.axis for state in states] == [0, 1, 2, 3]
+    assert all(state.flags & STATE_CYCLIC for state in states)
+    _, (state,) = client.read([2])
+    assert state.axis == 2
+    assert state.statusword == image[2].inputs.statusword
+
+    client.drive([1], DRIVE_ENABLE)
+    assert wait_for(lambda: client.read([1])[1][0].flags & STATE_ENABLED)
+
+
+def test_errors_are_replied(client):
+    with pytest.raises(ControlError, match='No axis 9'):
+        client.write([(9, 0x60FF, 0, 100)])
+    with pytest.raises(ControlError, match='not a setpoint'):
+        client.write([(0, 0x2003, 0, 100)])
+    with pytest.raises(ControlError, match='Unknown drive action'):
+        client.drive([0], 99)
+    with pytest.raises(ControlError, match='No axis 4'):
+        client.read([4])
+    # the connection is still usable
+    assert len(client.axes()) == 4
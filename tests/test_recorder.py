@@ -0,0 +1,48 @@
+# This Python file uses the following encoding: utf-8
+import ctypes
+import struct
+
+import pytest
+
+from ethercat.pdo import InputPdo, ProcessImage
+from ethercat.recorder import TelemetryRecorder, read_recording
+
+
+def test_round_trip(master, go_op, cycle, tmp_path):
+    image = ProcessImage(master.slaves)
+    go_op()
+    path = tmp_path / 'run.ectr'
+    recorder = TelemetryRecorder.from_image(path, image, chunk_samples=16).start()
+    expected = []
+    for _ in range(50):
+        cycle(image)
+        recorder.record()
+        expected.append([bytes(slave_image.input_buffer) for slave_image in image.slaves])
+    recorder.stop()
+    assert recorder.written == 50
+    assert recorder.dropped == 0
+
+    info, samples = read_recording(path)
+    assert info['slave_count'] == len(image)
+    assert info['sample_count'] == 50
+    assert [layout._fields_ for layout in info['layouts']] == [InputPdo._fields_] * len(image)
+    samples = list(samples)
+    assert len(samples) == 50
+    previous = 0
+    for (timestamp, inputs), recorded in zip(samples, expected):
+        assert timestamp >= previous
+        previous = timestamp
+        assert [bytes(pdo) for pdo in inputs] == [data[:ctypes.sizeof(InputPdo)] for data in recorded]
+
+
+def test_rejects_other_versions(master, tmp_path):
+    path = tmp_path / 'run.ectr'
+    recorder = TelemetryRecorder.from_image(path, ProcessImage(master.slaves)).start()
+    recorder.record()
+    recorder.stop()
+    data = bytearray(path.read_bytes())
+    # version follows the magic
+    struct.pack_into('<H', data, 4, 1)
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match='version 1'):
+        read_recording(path)
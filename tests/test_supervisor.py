@@ -0,0 +1,70 @@
+# This Python file uses the following encoding: utf-8
+from ethercat import backend
+from ethercat.cia402 import QUICK_STOP
+from ethercat.pdo import OutputPdo, ProcessImage
+from ethercat.supervisor import TRIP_FAULT, TRIP_NONE, TRIP_WKC, Supervisor
+
+
+def armed_supervisor(master, go_op, cycle):
+    image = ProcessImage(master.slaves)
+    supervisor = Supervisor(master, image)
+    go_op()
+    assert cycle(supervisor) == master.expected_wkc
+    supervisor.arm()
+    for axis in image.slaves:
+        axis.outputs.target_velocity = 500
+    return supervisor
+
+
+def test_trips_after_lost_frames(sim, master, go_op, cycle):
+    supervisor = armed_supervisor(master, go_op, cycle)
+    sim.configure(frame_loss=1.0)
+    for _ in range(supervisor.wkc_misses - 1):
+        supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_NONE
+    supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_WKC
+
+    sim.configure(frame_loss=0.0)
+    cycle(supervisor)
+    # whatever the application wrote, the next frame stops every axis
+    for slave in master.slaves:
+        outputs = OutputPdo.from_buffer_copy(slave.output)
+        assert outputs.controlword == QUICK_STOP
+        assert outputs.target_velocity == 0
+    assert supervisor.reaction_time is not None
+
+
+def test_trips_on_missing_slave(master, go_op, cycle):
+    supervisor = armed_supervisor(master, go_op, cycle)
+    master.slaves[1].state = backend.SAFEOP_STATE
+    master.slaves[1].write_state()
+    for _ in range(supervisor.wkc_misses):
+        supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_WKC
+
+
+def test_parked_slave_does_not_trip(master, go_op, cycle):
+    supervisor = armed_supervisor(master, go_op, cycle)
+    supervisor.park(1)
+    master.slaves[1].state = backend.SAFEOP_STATE
+    master.slaves[1].write_state()
+    for _ in range(2 * supervisor.wkc_misses):
+        supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_NONE
+
+
+def test_trips_on_drive_fault(master, go_op, cycle):
+    supervisor = armed_supervisor(master, go_op, cycle)
+    supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_NONE
+    master.slaves[2].inject_fault()
+    supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_FAULT
+    assert supervisor.trip_position == 2
+
+    supervisor.reset()
+    assert supervisor.tripped == TRIP_NONE
+    # a fault that is already there when reset is not a new one
+    supervisor.check(cycle(supervisor))
+    assert supervisor.tripped == TRIP_NONE